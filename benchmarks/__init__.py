@@ -0,0 +1,6 @@
+"""
+Benchmarks for the KorwinAI Discord Bot.
+
+This package contains benchmarks of the bot's hot paths, run against synthetic data
+so they need neither network access nor API credits. They are not part of the bot.
+"""
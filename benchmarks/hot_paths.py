@@ -0,0 +1,130 @@
+"""
+Hot path benchmarks for the KorwinAI Discord Bot.
+
+This module times the catalogue, cache and audio hot paths on synthetic catalogues
+of increasing size, writes the timings to a JSON file and optionally compares them
+against a baseline.
+
+Run it from the repository root:
+
+    python -m benchmarks.hot_paths --output results.json --baseline baseline.json
+
+Audio benchmarks need ffmpeg, they are skipped without it.
+"""
+
+import argparse
+import io
+import logging
+import pathlib
+import sys
+import tempfile
+
+from benchmarks.results import DEFAULT_THRESHOLD, BenchmarkResults, measure
+from benchmarks.synthetic import generate_catalogue, has_mp3_encoder
+from entities.cache.local_cache import MANIFEST_FILE
+from entities.catalogue import Category, KorwinCatalogue, LocalCache
+
+DEFAULT_SIZES = "100,1000,10000,100000"
+DEFAULT_REPEAT = 5
+
+
+def benchmark_catalogue(
+    results: BenchmarkResults, directory: pathlib.Path, rows: int, repeat: int
+) -> None:
+    """
+    Run all benchmarks on a catalogue of the given size.
+
+    Args:
+        results (BenchmarkResults): Results to add the timings to.
+        directory (pathlib.Path): Working directory.
+        rows (int): Number of catalogue rows.
+        repeat (int): Number of samples per benchmark.
+    """
+    csv_path = generate_catalogue(directory.joinpath(f"rows_{rows}"), rows)
+    cache_dir = csv_path.parent.joinpath("cache")
+    snapshot_path = csv_path.parent.joinpath("snapshot.json")
+
+    def fresh_cache() -> LocalCache:
+        cache_dir.joinpath(MANIFEST_FILE).unlink(missing_ok=True)
+        return LocalCache(cache_dir)
+
+    def load_catalogue() -> KorwinCatalogue:
+        return KorwinCatalogue(str(csv_path), "benchmark", cache, snapshot_path=snapshot_path)
+
+    cache = fresh_cache()
+    results.add(f"load_catalogue@{rows}", measure(load_catalogue, repeat))
+    catalogue = load_catalogue()
+
+    results.add(
+        f"get_random_text_from_category@{rows}",
+        measure(lambda: catalogue.get_random_text_from_category(Category.PODMIOT), repeat, 1000),
+    )
+    results.add(f"get_text_hash_map@{rows}", measure(catalogue.get_text_hash_map, repeat))
+
+    hash_map = catalogue.get_text_hash_map()
+    results.add(
+        f"is_hashmap_cached_cold@{rows}",
+        measure(lambda: fresh_cache().is_hashmap_cached(hash_map), repeat),
+    )
+    results.add(
+        f"is_hashmap_cached@{rows}", measure(lambda: cache.is_hashmap_cached(hash_map), repeat)
+    )
+
+    if not has_mp3_encoder():
+        for name in ("load_random_mp3", "get_random_sentence_mp3", "export"):
+            results.skip(f"{name}@{rows}", "ffmpeg is not available")
+        return
+
+    results.add(
+        f"load_random_mp3@{rows}",
+        measure(lambda: cache.load_random_mp3(Category.PODMIOT), repeat),
+    )
+    # The first sentences decode their segments, later ones reuse the segment store
+    results.add(
+        f"get_random_sentence_mp3_cold@{rows}",
+        measure(lambda: load_catalogue().get_random_sentence_mp3(), repeat),
+    )
+    results.add(
+        f"get_random_sentence_mp3@{rows}", measure(catalogue.get_random_sentence_mp3, repeat)
+    )
+
+    sentence = catalogue.get_random_sentence_mp3()
+    results.add(
+        f"export@{rows}", measure(lambda: sentence.export(io.BytesIO(), format="mp3"), repeat)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the catalogue, cache and audio paths")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated row counts")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="samples per benchmark")
+    parser.add_argument("--output", default="benchmark_results.json", help="results file")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="relative slowdown that counts as a regression",
+    )
+    parser.add_argument("--workdir", help="directory for the synthetic catalogues")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    results = BenchmarkResults("hot_paths")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        directory = pathlib.Path(args.workdir or temp_dir)
+        for rows in (int(size) for size in args.sizes.split(",")):
+            benchmark_catalogue(results, directory, rows, args.repeat)
+
+    results.save(args.output)
+
+    if args.baseline:
+        regressions = results.compare(args.baseline, args.threshold)
+        if regressions:
+            logging.error(f"{len(regressions)} benchmarks regressed")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
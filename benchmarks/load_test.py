@@ -0,0 +1,466 @@
+"""
+Load test harness for the KorwinAI Discord Bot.
+
+This module drives the real ``VoiceCommands`` handlers and the interval plays of a
+``DiscordBot`` with fake interactions, guilds and voice clients, against the stub
+text-to-speech server and a synthetic catalogue. Nothing connects to Discord.
+
+Run it from the repository root:
+
+    python -m benchmarks.load_test --korwin 300 --bog 100 --interval 20 --output load.json
+
+The report contains the time from interaction to the first audio frame read by the
+voice client, event loop lag, peak RSS and the number of spawned subprocesses.
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import pathlib
+import random
+import resource
+import tempfile
+import threading
+import time
+import types
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set
+
+from aiohttp import web
+
+from benchmarks.synthetic import generate_catalogue
+from utils.audio.stub_tts_server import create_app
+
+DEFAULT_ROWS = 200
+DEFAULT_GUILDS = 20
+MONITOR_INTERVAL = 0.01
+FRAME_DURATION = 0.02
+AUTHOR_ID = 1
+
+
+@dataclass
+class Invocation:
+    """
+    A single simulated command or interval run.
+    """
+
+    kind: str
+    started: float
+    first_frame: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def time_to_first_frame(self) -> Optional[float]:
+        return self.first_frame - self.started if self.first_frame is not None else None
+
+
+_current_invocation: contextvars.ContextVar[Optional[Invocation]] = contextvars.ContextVar(
+    "current_invocation", default=None
+)
+
+
+def percentile(values: List[float], percent: float) -> Optional[float]:
+    """
+    Get a percentile of a list of values, using the nearest rank.
+
+    Args:
+        values (List[float]): The values.
+        percent (float): The percentile, between 0 and 100.
+
+    Returns:
+        Optional[float]: The percentile, or None if there are no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(percent / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+class FakeVoiceClient:
+    """
+    Voice client that reads its sources in a thread, like discord.py's audio player.
+    """
+
+    def __init__(self, channel: "FakeVoiceChannel", harness: "LoadTest"):
+        self.channel = channel
+        self.harness = harness
+        self._connected = True
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def move_to(self, channel: "FakeVoiceChannel") -> None:
+        self.channel = channel
+
+    async def disconnect(self) -> None:
+        self._connected = False
+
+    def play(self, source, after: Callable[[Optional[Exception]], None]) -> None:
+        threading.Thread(target=self._play, args=(source, after), daemon=True).start()
+
+    def _play(self, source, after: Callable[[Optional[Exception]], None]) -> None:
+        error = None
+        try:
+            first = True
+            while True:
+                frame = source.read()
+                if not frame:
+                    break
+                if first:
+                    self.harness.first_frame(source)
+                    first = False
+                if self.harness.realtime:
+                    time.sleep(FRAME_DURATION)
+        except Exception as e:
+            error = e
+        finally:
+            source.cleanup()
+        after(error)
+
+
+class FakeVoiceChannel:
+    def __init__(self, id: int, guild: "FakeGuild", harness: "LoadTest"):
+        self.id = id
+        self.guild = guild
+        self.harness = harness
+        self.members = []
+
+    async def connect(self) -> FakeVoiceClient:
+        return FakeVoiceClient(self, self.harness)
+
+
+class FakeGuild:
+    def __init__(self, id: int, harness: "LoadTest"):
+        self.id = id
+        self.voice_channels = [FakeVoiceChannel(id * 10, self, harness)]
+
+
+class FakeMember:
+    def __init__(self, id: int, channel: FakeVoiceChannel):
+        self.id = id
+        self.voice = types.SimpleNamespace(channel=channel)
+        channel.members.append(self)
+
+
+class FakeResponse:
+    async def send_message(self, content: str, ephemeral: bool = False) -> None:
+        pass
+
+
+class FakeInteraction:
+    def __init__(self, user: FakeMember):
+        self.user = user
+        self.guild_id = user.voice.channel.guild.id
+        self.response = FakeResponse()
+
+
+class ProcessMonitor:
+    """
+    Samples event loop lag and the child processes of this process.
+    """
+
+    def __init__(self):
+        self.lags: List[float] = []
+        self.children: Set[int] = set()
+        self.peak_children = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _child_pids() -> Optional[Set[int]]:
+        pids = set()
+        try:
+            for task in pathlib.Path("/proc/self/task").iterdir():
+                pids.update(int(pid) for pid in task.joinpath("children").read_text().split())
+        except OSError:
+            return None
+        return pids
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(MONITOR_INTERVAL)
+            self.lags.append(max(0.0, loop.time() - started - MONITOR_INTERVAL))
+
+            pids = self._child_pids()
+            if pids is not None:
+                self.children.update(pids)
+                self.peak_children = max(self.peak_children, len(pids))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+class LoadTest:
+    """
+    Runs simulated commands against a bot and collects the measurements.
+    """
+
+    def __init__(self, bot, guilds: int, realtime: bool):
+        self.bot = bot
+        self.realtime = realtime
+        self.guilds = [FakeGuild(index + 1, self) for index in range(guilds)]
+        self.invocations: List[Invocation] = []
+        self._sources: Dict[int, Invocation] = dict()
+        self._lock = threading.Lock()
+
+        # Attribute every played source to the invocation that queued it
+        play = bot.voice_sessions.play
+
+        def tracked_play(channel, source):
+            invocation = _current_invocation.get()
+            if invocation is not None:
+                with self._lock:
+                    self._sources[id(source)] = invocation
+            return play(channel, source)
+
+        bot.voice_sessions.play = tracked_play
+
+    def first_frame(self, source) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            invocation = self._sources.pop(id(source), None)
+        if invocation is not None:
+            invocation.first_frame = now
+
+    def _member(self, user_id: int) -> FakeMember:
+        guild = random.choice(self.guilds)
+        return FakeMember(user_id, guild.voice_channels[0])
+
+    async def _invoke(self, kind: str, run: Callable[[], object], delay: float) -> None:
+        await asyncio.sleep(delay)
+        invocation = Invocation(kind, time.perf_counter())
+        self.invocations.append(invocation)
+        _current_invocation.set(invocation)
+        try:
+            await run()
+        except Exception as e:
+            invocation.error = repr(e)
+
+    async def run(self, korwin: int, bog: int, interval: int, unique_ratio: float, ramp: float):
+        korwin_command = self.bot.tree.get_command("korwin").callback
+        bog_command = self.bot.tree.get_command("bóg").callback
+        phrases = max(1, int(bog * unique_ratio))
+        invocations = []
+
+        for index in range(korwin):
+            interaction = FakeInteraction(self._member(1000 + index))
+            invocations.append(
+                self._invoke(
+                    "korwin", lambda i=interaction: korwin_command(i), random.uniform(0, ramp)
+                )
+            )
+
+        for index in range(bog):
+            interaction = FakeInteraction(self._member(AUTHOR_ID))
+            text = f"Load test phrase number {index % phrases}"
+            invocations.append(
+                self._invoke(
+                    "bog", lambda i=interaction, t=text: bog_command(i, t), random.uniform(0, ramp)
+                )
+            )
+
+        # Interval plays skip empty channels, so only pick guilds with members
+        occupied = [guild for guild in self.guilds if guild.voice_channels[0].members]
+        for _ in range(interval if occupied else 0):
+            guild = random.choice(occupied)
+            invocations.append(
+                self._invoke(
+                    "interval",
+                    lambda g=guild: self.bot.play_interval(g.id),
+                    random.uniform(0, ramp),
+                )
+            )
+
+        await asyncio.gather(*invocations)
+
+    async def wait_for_playback(self, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        while self.bot.voice_sessions.active_sessions and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+
+class StubServer:
+    """
+    Stub text-to-speech server running on its own event loop in a thread.
+    """
+
+    def __init__(self, latency: float, error_rate: float):
+        self.app = create_app(latency, error_rate)
+        self.url: Optional[str] = None
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        runner = web.AppRunner(self.app)
+        self._loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        self._loop.run_until_complete(site.start())
+        host, port = runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        self._ready.set()
+        self._loop.run_forever()
+
+    def start(self) -> str:
+        self._thread.start()
+        self._ready.wait()
+        return self.url
+
+    def stop(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def build_report(test: LoadTest, monitor: ProcessMonitor, duration: float) -> Dict:
+    report = {"duration": duration, "commands": {}}
+
+    for kind in sorted({invocation.kind for invocation in test.invocations}):
+        invocations = [invocation for invocation in test.invocations if invocation.kind == kind]
+        errors = [invocation.error for invocation in invocations if invocation.error]
+        report["commands"][kind] = {
+            "invocations": len(invocations),
+            "errors": len(errors),
+            "error_samples": sorted(set(errors))[:5],
+            "played": sum(invocation.first_frame is not None for invocation in invocations),
+            "time_to_first_frame": summarize(
+                [
+                    invocation.time_to_first_frame
+                    for invocation in invocations
+                    if invocation.time_to_first_frame is not None
+                ]
+            ),
+        }
+
+    # ru_maxrss is in kilobytes on Linux
+    report["event_loop_lag"] = summarize(monitor.lags)
+    report["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    report["peak_children_rss_mb"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    report["subprocesses"] = {
+        "spawned": len(monitor.children),
+        "peak_concurrent": monitor.peak_children,
+    }
+    report["executor"] = {
+        name: dict(vars(stats), average_wait=stats.average_wait)
+        for name, stats in test.bot.executor.stats().items()
+    }
+    report["sentence_pool"] = dict(vars(test.bot.sentence_pool.stats()))
+    return report
+
+
+async def run_load_test(args: argparse.Namespace, directory: pathlib.Path) -> Dict:
+    csv_path = generate_catalogue(directory, args.rows)
+
+    stub = StubServer(args.latency, args.error_rate)
+    os.environ["ELEVEN_LABS_BASE_URL"] = stub.start()
+    os.environ.setdefault("ELEVEN_LABS_API_KEY", "load-test")
+    os.environ["AUTHOR_ID"] = str(AUTHOR_ID)
+
+    from bot.client import DiscordBot
+    from bot.commands import VoiceCommands
+    from entities.catalogue import KorwinCatalogue, LocalCache, SegmentStore
+    from entities.catalogue.korwin_catalogue import SENTENCE_LOUDNESS
+
+    cache = LocalCache(csv_path.parent.joinpath("cache"))
+    store = SegmentStore(
+        cache,
+        target_loudness=SENTENCE_LOUDNESS,
+        rng=random.Random(args.seed) if args.seed is not None else None,
+    )
+    catalogue = KorwinCatalogue(
+        str(csv_path),
+        "load-test",
+        cache,
+        store,
+        snapshot_path=directory.joinpath("snapshot.json"),
+    )
+
+    bot = DiscordBot(catalogue)
+    bot.voice_commands = VoiceCommands(bot)
+    await bot._load_catalogue()
+    await bot._sentences_ready.wait()
+
+    test = LoadTest(bot, args.guilds, args.realtime)
+    bot.get_guild = lambda guild_id: test.guilds[guild_id - 1]
+
+    if args.warmup:
+        # Let the sentence pool fill before the burst, as it would between commands
+        await asyncio.sleep(args.warmup)
+
+    monitor = ProcessMonitor()
+    monitor.start()
+    started = time.perf_counter()
+
+    await test.run(args.korwin, args.bog, args.interval, args.unique_ratio, args.ramp)
+    await test.wait_for_playback(args.timeout)
+
+    duration = time.perf_counter() - started
+    await monitor.stop()
+    report = build_report(test, monitor, duration)
+
+    await bot.close()
+    stub.stop()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the bot with simulated Discord users")
+    parser.add_argument("--korwin", type=int, default=200, help="number of /korwin invocations")
+    parser.add_argument("--bog", type=int, default=50, help="number of /bóg invocations")
+    parser.add_argument("--interval", type=int, default=10, help="number of interval runs")
+    parser.add_argument(
+        "--unique-ratio", type=float, default=0.5, help="fraction of distinct /bóg phrases"
+    )
+    parser.add_argument("--guilds", type=int, default=DEFAULT_GUILDS, help="number of guilds")
+    parser.add_argument("--ramp", type=float, default=1.0, help="seconds to spread the burst over")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="catalogue rows")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub TTS latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="stub TTS 429/500 rate")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds before the burst")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for playback")
+    parser.add_argument(
+        "--realtime", action="store_true", help="read frames at playback speed instead of at once"
+    )
+    parser.add_argument("--output", default="load_test.json", help="report file")
+    parser.add_argument("--workdir", help="directory for the synthetic catalogue and cache")
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="seed the simulated users and the sentence picks for a repeatable run",
+    )
+    args = parser.parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(message)s")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        report = asyncio.run(run_load_test(args, pathlib.Path(args.workdir or temp_dir)))
+
+    pathlib.Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
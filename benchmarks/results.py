@@ -0,0 +1,125 @@
+"""
+Benchmark results module for the KorwinAI Discord Bot benchmarks.
+
+This module collects timings, writes them to a JSON file and compares them against
+a baseline file written by an earlier run.
+"""
+
+import json
+import logging
+import pathlib
+import platform
+import statistics
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Union
+
+DEFAULT_THRESHOLD = 0.2
+
+
+@dataclass
+class Timing:
+    """
+    Timing statistics of a single benchmark, in seconds per operation.
+    """
+
+    runs: int
+    median: float
+    mean: float
+    min: float
+    max: float
+
+    @classmethod
+    def from_samples(cls, samples: List[float]) -> "Timing":
+        return cls(
+            runs=len(samples),
+            median=statistics.median(samples),
+            mean=statistics.fmean(samples),
+            min=min(samples),
+            max=max(samples),
+        )
+
+
+def measure(func: Callable[[], object], repeat: int = 5, number: int = 1) -> Timing:
+    """
+    Time a function.
+
+    Args:
+        func (Callable[[], object]): The function to time.
+        repeat (int): Number of samples to take.
+        number (int): Number of calls per sample, for functions too fast to time alone.
+
+    Returns:
+        Timing: Seconds per call.
+    """
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - started) / number)
+    return Timing.from_samples(samples)
+
+
+class BenchmarkResults:
+    """
+    Timings of a benchmark run, keyed by benchmark name.
+    """
+
+    def __init__(self, suite: str):
+        self.suite = suite
+        self.timings: Dict[str, Timing] = dict()
+        self.skipped: Dict[str, str] = dict()
+
+    def add(self, name: str, timing: Timing) -> None:
+        self.timings[name] = timing
+        logging.info(f"{name}: median {timing.median * 1e6:.1f} us over {timing.runs} runs")
+
+    def skip(self, name: str, reason: str) -> None:
+        self.skipped[name] = reason
+        logging.warning(f"{name}: skipped, {reason}")
+
+    def to_dict(self) -> Dict:
+        return {
+            "suite": self.suite,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "results": {name: asdict(timing) for name, timing in self.timings.items()},
+            "skipped": self.skipped,
+        }
+
+    def save(self, path: Union[str, pathlib.Path]) -> None:
+        pathlib.Path(path).write_text(json.dumps(self.to_dict(), indent=2), encoding="utf-8")
+        logging.info(f"Results written to {path}")
+
+    def compare(
+        self, baseline_path: Union[str, pathlib.Path], threshold: float = DEFAULT_THRESHOLD
+    ) -> List[str]:
+        """
+        Compare the median timings against a baseline file.
+
+        Args:
+            baseline_path (Union[str, pathlib.Path]): Results file of an earlier run.
+            threshold (float): Relative slowdown that counts as a regression.
+
+        Returns:
+            List[str]: Names of the benchmarks that regressed.
+        """
+        baseline = json.loads(pathlib.Path(baseline_path).read_text(encoding="utf-8"))
+        regressions = []
+
+        for name, timing in self.timings.items():
+            previous: Optional[Dict] = baseline.get("results", {}).get(name)
+            if previous is None:
+                continue
+
+            ratio = timing.median / previous["median"] if previous["median"] else 1.0
+            if ratio > 1 + threshold:
+                regressions.append(name)
+                logging.error(f"{name}: {ratio:.2f}x slower than the baseline")
+            else:
+                logging.info(f"{name}: {ratio:.2f}x the baseline")
+
+        return regressions
@@ -0,0 +1,124 @@
+"""
+Synthetic catalogue module for the KorwinAI Discord Bot benchmarks.
+
+This module generates a catalogue CSV with a column per ``Category`` and a matching
+cache of sine tone MP3 segments. Only a few distinct segments are encoded, every
+cache entry is a hard link to one of them, so large catalogues take little time
+and disk space.
+"""
+
+import csv
+import hashlib
+import io
+import logging
+import os
+import pathlib
+import shutil
+from typing import List
+
+from entities.catalogue import Category
+from utils.audio.pcm import CHANNELS, SAMPLE_RATE, SAMPLE_WIDTH
+from utils.audio.stub_tts_server import silent_mp3
+
+TEMPLATE_SEGMENTS = 8
+SEGMENT_SECONDS = 0.5
+
+
+def has_mp3_encoder() -> bool:
+    """
+    Check if MP3 files can be encoded and decoded, which needs ffmpeg.
+
+    Returns:
+        bool: True if ffmpeg is available.
+    """
+    return shutil.which("ffmpeg") is not None
+
+
+def sine_mp3(frequency: float, seconds: float = SEGMENT_SECONDS) -> bytes:
+    """
+    Encode a sine tone as MP3.
+
+    Without ffmpeg, silent MP3 frames of the same length are returned instead, so
+    benchmarks that do not decode audio still run.
+
+    Args:
+        frequency (float): Frequency of the tone in Hz.
+        seconds (float): Length of the tone.
+
+    Returns:
+        bytes: The MP3 data.
+    """
+    if not has_mp3_encoder():
+        return silent_mp3("x" * int(seconds * 13))
+
+    import numpy as np
+    from pydub import AudioSegment
+
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    tone = (0.3 * np.sin(2 * np.pi * frequency * t) * 32767).astype("<i2")
+    segment = AudioSegment(
+        data=np.repeat(tone[:, None], CHANNELS, axis=1).tobytes(),
+        sample_width=SAMPLE_WIDTH,
+        frame_rate=SAMPLE_RATE,
+        channels=CHANNELS,
+    )
+    buffer = io.BytesIO()
+    segment.export(buffer, format="mp3", bitrate="64k")
+    return buffer.getvalue()
+
+
+def _link(source: pathlib.Path, target: pathlib.Path) -> None:
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def generate_catalogue(directory: pathlib.Path, rows: int) -> pathlib.Path:
+    """
+    Generate a synthetic catalogue and its cache.
+
+    The cache is written to ``<directory>/cache`` in the ``LocalCache`` layout.
+
+    Args:
+        directory (pathlib.Path): Directory to generate the catalogue in.
+        rows (int): Number of rows, every row has a text in every category.
+
+    Returns:
+        pathlib.Path: Path of the catalogue CSV.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    cache_dir = directory.joinpath("cache")
+    templates_dir = directory.joinpath("templates")
+    templates_dir.mkdir(exist_ok=True)
+
+    templates: List[pathlib.Path] = []
+    for index in range(TEMPLATE_SEGMENTS):
+        path = templates_dir.joinpath(f"{index}.mp3")
+        if not path.exists():
+            path.write_bytes(sine_mp3(220 * (1 + index / 4)))
+        templates.append(path)
+
+    columns = [category.value for category in Category]
+    texts = [
+        [f"{column} {row} " + "lorem ipsum " * (row % 5) for column in columns]
+        for row in range(rows)
+    ]
+
+    csv_path = directory.joinpath("catalogue.csv")
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(texts)
+
+    for column_index, column in enumerate(columns):
+        category_dir = cache_dir.joinpath(column)
+        category_dir.mkdir(parents=True, exist_ok=True)
+        for row, row_texts in enumerate(texts):
+            text = row_texts[column_index]
+            path = category_dir.joinpath(f"{hashlib.sha256(text.encode('utf-8')).hexdigest()}.mp3")
+            if not path.exists():
+                _link(templates[(row + column_index) % len(templates)], path)
+
+    logging.info(f"Generated a catalogue of {rows} rows in {directory}")
+    return csv_path
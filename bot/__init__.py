@@ -1,19 +1,26 @@
 import logging
 import os
+from concurrent.futures import Future
+from typing import Optional, Union
 
 from bot.client import DiscordBot
 from entities.catalogue import KorwinCatalogue
+from utils.profiling import StartupProfiler
 
 
-def run_discord_bot(catalogue: KorwinCatalogue):
+def run_discord_bot(
+    catalogue: Union[KorwinCatalogue, Future], profiler: Optional[StartupProfiler] = None
+):
     """
     Initializes and runs the Discord bot with the provided catalogue.
 
     Args:
-        catalogue: The KorwinCatalogue instance to use for the bot.
+        catalogue: The KorwinCatalogue instance to use for the bot, or a future that
+            resolves to it while the bot is already connecting.
+        profiler: Startup profiler that reports once the bot is ready.
     """
     logging.info("Initializing Discord bot...")
-    bot = DiscordBot(catalogue)
+    bot = DiscordBot(catalogue, profiler)
 
     # Get the Discord bot token from environment variables
     token = os.getenv("DISCORD_BOT_TOKEN")
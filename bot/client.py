@@ -1,14 +1,50 @@
+import asyncio
+import contextlib
 import logging
 import os
-import random
-from asyncio import sleep
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import List, Optional, Tuple, Union
 
 import discord
 from discord import app_commands
 from discord.ext import tasks
 
 from bot.commands import VoiceCommands
-from entities.catalogue import KorwinCatalogue
+from bot.scheduler import DEFAULT_MAX_CONCURRENT, IntervalScheduler, ScheduleStore
+from bot.sentence_pool import DEFAULT_POOL_MEMORY_BUDGET, DEFAULT_POOL_SIZE, SentencePool
+from bot.voice import DEFAULT_IDLE_TIMEOUT, VoiceSessionManager
+from entities.cache import ICache
+from entities.cache.phrase_cache import DEFAULT_PHRASE_MEMORY_BUDGET
+from entities.catalogue import Category, EvictionPolicy, KorwinCatalogue, PhraseCache
+from entities.catalogue.snapshot import CatalogueDiff
+from utils.audio import OpusPacketSource, PCMSegmentSource, encode_opus_packets, mix_sentence
+from utils.concurrency import AudioExecutor
+from utils.concurrency.executor import DEFAULT_IO_WORKERS
+from utils.logging import log_context
+from utils.metrics import (
+    ACTIVE_VOICE_SESSIONS,
+    CATALOGUE_SEGMENTS,
+    COMPOSITION_TIME,
+    EXECUTOR_QUEUE_DEPTH,
+)
+from utils.metrics.server import DEFAULT_HOST, MetricsServer
+from utils.profiling import LoopWatchdog, SamplingProfiler, StartupProfiler
+from utils.profiling.sampling import profile_path
+
+DEFAULT_RELOAD_INTERVAL_MINUTES = 60
+CACHE_FLUSH_INTERVAL_MINUTES = 5
+GENERATION_POLL_INTERVAL = 10.0
+
+
+@dataclass(frozen=True)
+class Sentence:
+    """
+    A composed sentence and the (category, hash) of the segments it is made of.
+    """
+
+    segments: Tuple[Tuple[str, str], ...]
+    audio: Union[bytes, List[List[bytes]]]
 
 
 class DiscordBot(discord.Client):
@@ -16,41 +52,370 @@ class DiscordBot(discord.Client):
     Discord bot client that handles the bot's connection and commands.
     """
 
-    def __init__(self, catalogue: KorwinCatalogue):
+    def __init__(
+        self,
+        catalogue: Union[KorwinCatalogue, Future],
+        profiler: Optional[StartupProfiler] = None,
+        **options,
+    ):
         # Set up intents
         intents = discord.Intents.default()
         intents.presences = True
         intents.message_content = True
         intents.members = True
-        super().__init__(intents=intents)
+        super().__init__(intents=intents, **options)
 
         # Initialize bot components
         self.tree = app_commands.CommandTree(self)
-        self.catalogue = catalogue
-        self.cache = catalogue.cache
+        self.catalogue: Optional[KorwinCatalogue] = None
         self.voice_commands = None
+        # Only the primary process syncs the command tree, evicts custom phrases and
+        # generates the rows added to the catalogue
+        self.primary = True
+        self.profiler = profiler or StartupProfiler()
 
-    @tasks.loop(minutes=5)
-    async def korwin_with_interval(self):
-        if random.random() > 0.025:
-            return
+        # The catalogue may still be loading while the bot connects
+        if isinstance(catalogue, Future):
+            self._catalogue_future = catalogue
+        else:
+            self._catalogue_future = Future()
+            self._catalogue_future.set_result(catalogue)
+        self._catalogue_ready = asyncio.Event()
+        self._sentences_ready = asyncio.Event()
+        self._prepare_task: Optional[asyncio.Task] = None
+        self.voice_sessions = VoiceSessionManager(
+            idle_timeout=float(os.getenv("VOICE_IDLE_TIMEOUT", DEFAULT_IDLE_TIMEOUT))
+        )
+        self.executor = AudioExecutor(
+            io_workers=int(os.getenv("IO_WORKERS", DEFAULT_IO_WORKERS)),
+            cpu_workers=int(os.getenv("CPU_WORKERS", 0)) or None,
+        )
+        self.stream_tts = os.getenv("STREAM_TTS", "true").lower() in ("1", "true", "yes")
+        self.mix_sentences = os.getenv("MIX_SENTENCES", "").lower() in ("1", "true", "yes")
+        pool_memory_mb = os.getenv("SENTENCE_POOL_MEMORY_MB")
+        self.sentence_pool = SentencePool(
+            self._compose_sentence,
+            self._sentence_size,
+            is_idle=lambda: self.executor.stats()["io"].pending == 0,
+            size=int(os.getenv("SENTENCE_POOL_SIZE", DEFAULT_POOL_SIZE)),
+            memory_budget=(
+                int(pool_memory_mb) * 1024 * 1024 if pool_memory_mb else DEFAULT_POOL_MEMORY_BUDGET
+            ),
+        )
 
-        logging.info("Playing korwin with interval")
-        guild_id = int(os.getenv("GUILD_ID"))
+        ACTIVE_VOICE_SESSIONS.set_function(lambda: self.voice_sessions.active_sessions)
+        CATALOGUE_SEGMENTS.set_function(
+            lambda: sum(self.catalogue.status().cached.values()) if self.catalogue else 0,
+            state="cached",
+        )
+        CATALOGUE_SEGMENTS.set_function(
+            lambda: self._missing_segments() if self.catalogue else 0, state="missing"
+        )
+        for pool in self.executor.stats():
+            EXECUTOR_QUEUE_DEPTH.set_function(
+                lambda pool=pool: self.executor.stats()[pool].pending, pool=pool
+            )
+        phrase_memory_mb = os.getenv("PHRASE_CACHE_MEMORY_MB")
+        self.phrases = PhraseCache(
+            int(phrase_memory_mb) * 1024 * 1024
+            if phrase_memory_mb
+            else DEFAULT_PHRASE_MEMORY_BUDGET
+        )
+        custom_max_mb = os.getenv("CUSTOM_CACHE_MAX_MB")
+        custom_max_age_days = os.getenv("CUSTOM_CACHE_MAX_AGE_DAYS")
+        self.eviction_policy = EvictionPolicy(
+            max_bytes=int(custom_max_mb) * 1024 * 1024 if custom_max_mb else None,
+            max_age=float(custom_max_age_days) * 24 * 3600 if custom_max_age_days else None,
+        )
 
-        vc = await max(
-            self.get_guild(guild_id).voice_channels, key=lambda vc: len(vc.members)
-        ).connect()
+        self._reload_lock = asyncio.Lock()
+        reload_minutes = float(
+            os.getenv("CATALOGUE_RELOAD_MINUTES", DEFAULT_RELOAD_INTERVAL_MINUTES)
+        )
+        self.reload_interval = reload_minutes * 60
+        if reload_minutes > 0:
+            self.refresh_catalogue.change_interval(minutes=reload_minutes)
+
+        guild_id = os.getenv("GUILD_ID")
+        self.scheduler = IntervalScheduler(
+            ScheduleStore(
+                os.getenv("INTERVAL_SCHEDULE_FILE", "./cache/interval_schedule.json"),
+                default_guild_id=int(guild_id) if guild_id else None,
+            ),
+            self.play_interval,
+            max_concurrent=int(os.getenv("INTERVAL_MAX_CONCURRENT", DEFAULT_MAX_CONCURRENT)),
+        )
 
-        vc.play(
-            discord.FFmpegPCMAudio(self.catalogue.get_random_sentence_mp3().export(), pipe=True)
+        metrics_port = os.getenv("METRICS_PORT")
+        self.metrics_server = (
+            MetricsServer(int(metrics_port), os.getenv("METRICS_HOST", DEFAULT_HOST))
+            if metrics_port
+            else None
         )
 
-        while vc.is_playing():
-            await sleep(0.1)
+        # Debug mode: watch for a blocked event loop and profile the listed commands
+        watchdog_ms = os.getenv("LOOP_WATCHDOG_MS")
+        self.watchdog = LoopWatchdog(float(watchdog_ms) / 1000) if watchdog_ms else None
+        self.profile_commands = {
+            name.strip() for name in os.getenv("PROFILE_COMMANDS", "").split(",") if name.strip()
+        }
+        self.profile_dir = os.getenv("PROFILE_DIR", "./profiles")
+
+    @property
+    def cache(self) -> ICache:
+        return self.catalogue.cache
+
+    @property
+    def sentences_ready(self) -> bool:
+        """
+        Whether random sentences can be played, i.e. every category of the catalogue
+        has a cached segment. Missing segments may still be generating.
+        """
+        return self._sentences_ready.is_set()
+
+    def _missing_segments(self) -> int:
+        status = self.catalogue.status()
+        return sum(status.total.values()) - sum(status.cached.values())
+
+    async def wait_for_catalogue(self) -> KorwinCatalogue:
+        """
+        Waits until the catalogue has been loaded.
+
+        Returns:
+            KorwinCatalogue: The catalogue.
+        """
+        await self._catalogue_ready.wait()
+        return self.catalogue
+
+    async def _compose_sentence(self, guild_id: Optional[int] = None) -> Sentence:
+        catalogue = await self.wait_for_catalogue()
+        segments = await self.executor.run_io(catalogue.pick_sentence, guild_id)
+        if self.mix_sentences:
+            audio = await self._mix_sentence(catalogue, segments)
+        else:
+            audio = await self._encode_sentence(catalogue, segments)
+        return Sentence(
+            tuple((category.value, cache_hash) for category, cache_hash in segments), audio
+        )
+
+    async def _mix_sentence(
+        self, catalogue: KorwinCatalogue, segments: List[Tuple[Category, str]]
+    ) -> bytes:
+        # Decoding mostly waits for FFmpeg and stays in a thread, mixing holds the GIL
+        buffers, gains = await self.executor.run_io(catalogue.get_sentence_parts, segments)
+        with COMPOSITION_TIME.time(format="pcm"):
+            return await self.executor.run_cpu(mix_sentence, buffers, gains)
+
+    async def _encode_sentence(
+        self, catalogue: KorwinCatalogue, segments: List[Tuple[Category, str]]
+    ) -> List[List[bytes]]:
+        packets = await self.executor.run_io(catalogue.get_sentence_opus, segments, False)
+        for index, (category, cache_hash) in enumerate(segments):
+            if packets[index] is None:
+                # Picked before its packets were encoded, encode them in the process pool
+                pcm, gain = await self.executor.run_io(
+                    catalogue.store.get_opus_input, cache_hash, category
+                )
+                encoded = await self.executor.run_cpu(encode_opus_packets, pcm, gain)
+                packets[index] = await self.executor.run_io(
+                    catalogue.store.put_opus, cache_hash, category, encoded
+                )
+        return packets
+
+    @staticmethod
+    def _sentence_size(sentence: Sentence) -> int:
+        if isinstance(sentence.audio, bytes):
+            return len(sentence.audio)
+        return sum(len(packet) for packets in sentence.audio for packet in packets)
+
+    async def random_sentence_source(self, guild_id: Optional[int] = None) -> discord.AudioSource:
+        """
+        Takes a random sentence from the sentence pool, once the catalogue is loaded.
+
+        Sentences with segments recently played in the guild are left in the pool for
+        other guilds, if the pool has none without, one is composed for the guild.
+
+        By default the sentence is played from pre-encoded Opus packets. With
+        ``MIX_SENTENCES`` enabled it is mixed as PCM instead, with crossfades between
+        the segments, at the cost of encoding it while it plays.
+
+        Args:
+            guild_id (Optional[int]): The guild the sentence is played in.
+
+        Returns:
+            discord.AudioSource: The sentence.
+        """
+        recent = (await self.wait_for_catalogue()).recent
+        sentence = await self.sentence_pool.take(
+            accept=lambda sentence: not recent.conflicts(guild_id, sentence.segments),
+            compose=lambda: self._compose_sentence(guild_id),
+        )
+        recent.add(guild_id, sentence.segments)
+
+        if isinstance(sentence.audio, bytes):
+            return PCMSegmentSource([sentence.audio])
+        return OpusPacketSource(sentence.audio)
+
+    async def _load_catalogue(self):
+        try:
+            catalogue = await asyncio.wrap_future(self._catalogue_future)
+        except Exception:
+            logging.exception("Failed to load the catalogue")
+            catalogue = None
+
+        if catalogue is None:
+            logging.error("Cannot continue without a catalogue, shutting down")
+            await self.close()
+            return
+
+        self.catalogue = catalogue
+        self._catalogue_ready.set()
+        logging.info("Catalogue loaded")
+
+        self._prepare_task = asyncio.create_task(self._prepare_segments())
+
+    def _set_sentences_ready(self) -> None:
+        if self.sentences_ready:
+            return
+        self._sentences_ready.set()
+        logging.info("Sentences ready")
+
+        # Keep sentences composed ahead of time, so commands only have to play them
+        self.sentence_pool.start()
+
+    async def _prepare_segments(self):
+        # Sentences are composed from the cached segments while the missing ones are
+        # generated by the primary process
+        status = await self.executor.run_io(self.catalogue.status)
+        generation = None
+        if not status.complete and self.primary:
+            logging.info(f"Generating missing segments in the background, {status}")
+            generation = asyncio.create_task(self._generate_missing())
+
+        try:
+            while True:
+                if status.ready:
+                    self._set_sentences_ready()
+                if status.complete or (generation is not None and generation.done()):
+                    break
+
+                await asyncio.sleep(GENERATION_POLL_INTERVAL)
+                if not self.primary:
+                    # Pick up the segments generated by the primary process
+                    for category in Category:
+                        self.catalogue.store.invalidate(category)
+                status = await self.executor.run_io(self.catalogue.status)
+        except asyncio.CancelledError:
+            if generation is not None:
+                generation.cancel()
+            raise
+
+        if generation is not None:
+            await generation
+            status = await self.executor.run_io(self.catalogue.status)
+            if status.ready:
+                self._set_sentences_ready()
+        if not status.ready:
+            logging.error(f"Cannot compose sentences, some categories are empty: {status}")
+
+    async def _generate_missing(self):
+        try:
+            async with self._reload_lock:
+                progress = await self.catalogue.generate_missing()
+            await self.executor.run_io(self.catalogue.generate_cached_opus)
+            logging.info(f"Background generation finished: {progress}")
+        except Exception:
+            logging.exception("Background generation of missing segments failed")
+
+    @tasks.loop(minutes=CACHE_FLUSH_INTERVAL_MINUTES)
+    async def flush_cache(self):
+        # Every process merges its custom phrase plays into the shared access file, so
+        # the primary does not evict phrases played only on other shards
+        await self.executor.run_io(self.cache.flush)
+
+    @tasks.loop(hours=1)
+    async def evict_custom_phrases(self):
+        evicted = await self.executor.run_io(self.cache.evict_custom, self.eviction_policy)
+        if evicted:
+            logging.info(f"Evicted {len(evicted)} custom phrases from the cache")
 
-        await vc.disconnect()
-        logging.info("Korwin with interval finished")
+    async def reload_catalogue(self) -> Optional[CatalogueDiff]:
+        """
+        Reloads the catalogue from the sheet without interrupting playing sessions,
+        see ``KorwinCatalogue.reload``. Concurrent reloads run one after another.
+
+        Returns:
+            Optional[CatalogueDiff]: The changes, or None if the catalogue could not be
+                switched yet.
+        """
+        catalogue = await self.wait_for_catalogue()
+        async with self._reload_lock:
+            diff = await catalogue.reload(generate=self.primary)
+
+        if diff is not None and any(diff.removed.values()):
+            # Pooled sentences may be made of the removed rows
+            dropped = self.sentence_pool.discard(
+                lambda sentence: any(
+                    cache_hash in diff.removed.get(category, ())
+                    for category, cache_hash in sentence.segments
+                )
+            )
+            if dropped:
+                logging.info(f"Dropped {dropped} pooled sentences with removed segments")
+        return diff
+
+    @tasks.loop(minutes=DEFAULT_RELOAD_INTERVAL_MINUTES)
+    async def refresh_catalogue(self):
+        try:
+            await self.reload_catalogue()
+        except Exception:
+            logging.exception("Failed to reload the catalogue")
+
+    @refresh_catalogue.before_loop
+    async def _before_refresh_catalogue(self):
+        # The catalogue was just loaded, the first reload is due one interval later
+        await asyncio.sleep(self.reload_interval)
+
+    def profile(self, command: str):
+        """
+        Profiles a command invocation if the command is listed in PROFILE_COMMANDS.
+
+        Args:
+            command (str): Name of the command, "*" in PROFILE_COMMANDS profiles all.
+
+        Returns:
+            A context manager sampling the event loop thread while it is entered.
+        """
+        if command not in self.profile_commands and "*" not in self.profile_commands:
+            return contextlib.nullcontext()
+        return SamplingProfiler(profile_path(self.profile_dir, command))
+
+    async def play_interval(self, guild_id: int):
+        """
+        Plays a random sentence in the most populated voice channel of a guild.
+        Called by the interval scheduler, empty channels are skipped.
+
+        Args:
+            guild_id (int): The guild.
+        """
+        guild = self.get_guild(guild_id)
+        if guild is None:
+            self.scheduler.unschedule(guild_id)
+            return
+
+        if not self.sentences_ready:
+            return
+
+        channel = max(guild.voice_channels, key=lambda vc: len(vc.members), default=None)
+        if channel is None or not channel.members:
+            return
+
+        with log_context(command="interval", guild_id=guild_id):
+            logging.info(f"Playing korwin with interval in guild {guild_id}")
+            with self.profile("interval"):
+                source = await self.random_sentence_source(guild_id)
+            await self.voice_sessions.play(channel, source)
+            logging.info(f"Korwin with interval finished in guild {guild_id}")
 
     async def setup_hook(self):
         """
@@ -58,14 +423,68 @@ class DiscordBot(discord.Client):
         This is called automatically when the bot starts.
         """
 
+        if self.watchdog is not None:
+            self.watchdog.start()
+
+        asyncio.create_task(self._load_catalogue())
+
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+
         self.voice_commands = VoiceCommands(self)
-        await self.tree.sync()
-        logging.info("Command tree synced")
+        if self.primary:
+            with self.profiler.phase("sync command tree"):
+                await self.tree.sync()
+            logging.info("Command tree synced")
+
+    async def close(self):
+        """
+        Stops the interval scheduler, the sentence pool, the metrics server and the
+        event loop watchdog, disconnects all voice sessions, stops the executor and
+        flushes the cache before closing the connection to Discord.
+        """
+        await self.scheduler.stop()
+        if self._prepare_task is not None:
+            self._prepare_task.cancel()
+        self.evict_custom_phrases.cancel()
+        self.flush_cache.cancel()
+        self.refresh_catalogue.cancel()
+        await self.sentence_pool.stop()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        if self.watchdog is not None:
+            await self.watchdog.stop()
+        await self.voice_sessions.close()
+        self.executor.shutdown()
+        if self.catalogue is not None:
+            # Write the cache index updates that were batched
+            self.catalogue.cache.flush()
+        await super().close()
 
     async def on_ready(self):
         """
         Called when the bot is ready and connected to Discord.
         """
         logging.info(f"Logged in as {self.user} (ID: {self.user.id})")
-        await self.korwin_with_interval.start()
-        logging.info("Korwin with interval started")
+        await self.wait_for_catalogue()
+        self.profiler.report("gateway ready")
+        self.scheduler.start(guild.id for guild in self.guilds)
+        if not self.flush_cache.is_running():
+            self.flush_cache.start()
+        if self.primary and self.eviction_policy.enabled:
+            if not self.evict_custom_phrases.is_running():
+                self.evict_custom_phrases.start()
+        if self.reload_interval > 0 and not self.refresh_catalogue.is_running():
+            self.refresh_catalogue.start()
+
+    async def on_guild_join(self, guild: discord.Guild):
+        """
+        Called when the bot joins a guild.
+        """
+        self.scheduler.schedule(guild.id)
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        """
+        Called when the bot leaves a guild.
+        """
+        self.scheduler.unschedule(guild.id)
@@ -1,15 +1,32 @@
+import asyncio
 import logging
 import os
-from typing import TYPE_CHECKING
+import time
+from typing import TYPE_CHECKING, Optional
 
 import discord
-from anyio import sleep
+from discord import app_commands
 
-from utils.audio import generate_speech_from_text
+from bot.scheduler import MIN_INTERVAL, GuildSchedule
+from utils.audio import (
+    SPEECH_GAIN,
+    PCMSegmentSource,
+    decode_mp3_to_pcm,
+    fetch_speech_mp3,
+    load_cached_speech_mp3,
+    speech_hash,
+    stream_speech_from_text,
+)
+from utils.concurrency import SingleFlight
+from utils.logging import log_context
+from utils.metrics import COMMAND_LATENCY
 
 if TYPE_CHECKING:
     from bot.client import DiscordBot
 
+# Seconds between checks whether another request finished generating a phrase
+GENERATION_POLL_INTERVAL = 0.25
+
 
 class VoiceCommands:
     """
@@ -18,8 +35,56 @@ class VoiceCommands:
 
     def __init__(self, bot: "DiscordBot"):
         self.bot = bot
+        # Concurrent requests for the same phrase share one lookup, generation and decode
+        self._phrase_flights: SingleFlight[Optional[bytes]] = SingleFlight()
         self._setup_commands()
 
+    async def _fetch_phrase(self, text: str) -> bytes:
+        # Wait for another request generating the phrase here, not in a pool thread
+        while True:
+            mp3 = await self.bot.executor.run_io(fetch_speech_mp3, text, self.bot.cache, False)
+            if mp3 is not None:
+                return mp3
+            await asyncio.sleep(GENERATION_POLL_INTERVAL)
+
+    async def _load_phrase(self, text: str, text_hash: str, generate: bool) -> Optional[bytes]:
+        if generate:
+            mp3 = await self._fetch_phrase(text)
+        else:
+            mp3 = await self.bot.executor.run_io(load_cached_speech_mp3, text, self.bot.cache)
+            if mp3 is None:
+                return None
+        pcm = await self.bot.executor.run_cpu(decode_mp3_to_pcm, mp3, SPEECH_GAIN)
+        self.bot.phrases.put(text_hash, pcm)
+        return pcm
+
+    async def load_phrase(self, text: str, generate: bool) -> Optional[bytes]:
+        """
+        Get the decoded speech of a custom phrase.
+
+        Concurrent calls for the same phrase are coalesced, later callers wait for the
+        first one instead of reading, generating and decoding it again.
+
+        Args:
+            text (str): The phrase.
+            generate (bool): Whether to generate the phrase if it is not cached.
+
+        Returns:
+            Optional[bytes]: The speech in Discord's PCM format, or None if it is not
+                cached and ``generate`` is False.
+        """
+        text_hash = speech_hash(text)
+
+        # Repeated phrases are played from memory, without reading or decoding
+        pcm = self.bot.phrases.get(text_hash)
+        if pcm is not None:
+            self.bot.cache.touch_mp3(text_hash)
+            return pcm
+
+        return await self._phrase_flights.run(
+            (text_hash, generate), lambda: self._load_phrase(text, text_hash, generate)
+        )
+
     def _setup_commands(self):
         @self.bot.tree.command(
             name="korwin", description="Plays a random sentence from the catalogue"
@@ -35,20 +100,25 @@ class VoiceCommands:
                 )
                 return
 
-            await interaction.response.send_message("Playing a random sentence...", ephemeral=True)
-
-            vc = await interaction.user.voice.channel.connect()
-            vc.play(
-                discord.FFmpegPCMAudio(
-                    self.bot.catalogue.get_random_sentence_mp3().export(), pipe=True
+            if not self.bot.sentences_ready:
+                await interaction.response.send_message(
+                    "The catalogue is still being prepared, see /status", ephemeral=True
                 )
-            )
+                return
 
-            # Wait until the audio finishes playing
-            while vc.is_playing():
-                await sleep(0.1)
+            with log_context(command="korwin", guild_id=interaction.guild_id):
+                started = time.perf_counter()
+                with COMMAND_LATENCY.time(command="korwin"), self.bot.profile("korwin"):
+                    await interaction.response.send_message(
+                        "Playing a random sentence...", ephemeral=True
+                    )
+                    source = await self.bot.random_sentence_source(interaction.guild_id)
+                latency = time.perf_counter() - started
+                logging.info(
+                    f"/korwin ready in {latency * 1000:.0f} ms", extra={"latency": latency}
+                )
 
-            await vc.disconnect()
+                await self.bot.voice_sessions.play(interaction.user.voice.channel, source)
 
         @self.bot.tree.command(name="bóg", description="Plays a custom text-to-speech message")
         async def play_custom_message(interaction: discord.Interaction, dziegiel: str):
@@ -72,17 +142,115 @@ class VoiceCommands:
                 )
                 return
 
-            await interaction.response.send_message(f"Playing: {dziegiel}", ephemeral=True)
+            with log_context(command="bóg", guild_id=interaction.guild_id):
+                started = time.perf_counter()
+                with COMMAND_LATENCY.time(command="bóg"), self.bot.profile("bóg"):
+                    await interaction.response.send_message(f"Playing: {dziegiel}", ephemeral=True)
+
+                    await self.bot.wait_for_catalogue()
+
+                    pcm = await self.load_phrase(dziegiel, generate=not self.bot.stream_tts)
+
+                    if pcm is not None:
+                        source = PCMSegmentSource([pcm])
+                    else:
+                        # Not cached - start playing while the speech is still being generated
+                        source = await self.bot.executor.run_io(
+                            stream_speech_from_text, dziegiel, self.bot.cache
+                        )
+                        if source is None:
+                            # Another request is generating it, wait and play it from the cache
+                            pcm = await self.load_phrase(dziegiel, generate=True)
+                            source = PCMSegmentSource([pcm])
+                latency = time.perf_counter() - started
+                logging.info(f"/bóg ready in {latency * 1000:.0f} ms", extra={"latency": latency})
+
+                await self.bot.voice_sessions.play(interaction.user.voice.channel, source)
+
+        @self.bot.tree.command(
+            name="status", description="Shows how much of the catalogue is ready"
+        )
+        async def show_status(interaction: discord.Interaction):
+            """
+            Command that shows whether random sentences can be played and the progress
+            of generating the segments that are not cached yet.
+            """
+            if self.bot.catalogue is None:
+                await interaction.response.send_message(
+                    "The catalogue is still loading", ephemeral=True
+                )
+                return
+
+            status = await self.bot.executor.run_io(self.bot.catalogue.status)
+            ready = "Ready" if self.bot.sentences_ready else "Not ready yet"
+            await interaction.response.send_message(f"{ready}: {status}", ephemeral=True)
 
-            vc = await interaction.user.voice.channel.connect()
-            vc.play(
-                discord.FFmpegPCMAudio(
-                    generate_speech_from_text(dziegiel, cache=self.bot.cache).export(), pipe=True
+        @self.bot.tree.command(
+            name="reload", description="Reloads the catalogue from the Google Sheet"
+        )
+        async def reload_catalogue(interaction: discord.Interaction):
+            """
+            Command that reloads the catalogue, generating only the added rows.
+            Only the author can use this command.
+            """
+            if str(interaction.user.id) != str(os.getenv("AUTHOR_ID")):
+                logging.warning(f"User {interaction.user.id} tried to use command reload")
+                await interaction.response.send_message(
+                    "You are not authorized to use this command!", ephemeral=True
                 )
-            )
+                return
+
+            # Generating added rows can take a while
+            await interaction.response.defer(ephemeral=True, thinking=True)
+            try:
+                diff = await self.bot.reload_catalogue()
+            except Exception as e:
+                logging.exception("Failed to reload the catalogue")
+                await interaction.followup.send(f"Reload failed: {e}", ephemeral=True)
+                return
+
+            if diff is None:
+                message = "Some added rows could not be generated, will retry on the next reload"
+            elif diff.changed:
+                message = f"Catalogue reloaded: {diff}"
+            else:
+                message = "Catalogue is up to date"
+            await interaction.followup.send(message, ephemeral=True)
 
-            # Wait until the audio finishes playing
-            while vc.is_playing():
-                await sleep(0.1)
+        @self.bot.tree.command(
+            name="interval", description="Enables or disables random sentences in this server"
+        )
+        @app_commands.guild_only()
+        @app_commands.default_permissions(manage_guild=True)
+        @app_commands.describe(
+            enabled="Whether to play random sentences",
+            minutes="Average number of minutes between sentences",
+        )
+        async def configure_interval(
+            interaction: discord.Interaction,
+            enabled: bool,
+            minutes: Optional[app_commands.Range[int, int(MIN_INTERVAL // 60), 10080]] = None,
+        ):
+            """
+            Command that opts the server in or out of random sentences played at
+            random intervals in its most populated voice channel.
+            """
+            store = self.bot.scheduler.store
+            current = store.get(interaction.guild_id) or GuildSchedule()
+            schedule = GuildSchedule(
+                enabled=enabled,
+                mean_interval=minutes * 60 if minutes else current.mean_interval,
+                distribution=current.distribution,
+                jitter=current.jitter,
+            )
+            store.set(interaction.guild_id, schedule)
+            self.bot.scheduler.schedule(interaction.guild_id)
 
-            await vc.disconnect()
+            if enabled:
+                message = (
+                    "Random sentences enabled, "
+                    f"about every {schedule.mean_interval / 60:.0f} minutes"
+                )
+            else:
+                message = "Random sentences disabled"
+            await interaction.response.send_message(message, ephemeral=True)
@@ -0,0 +1,316 @@
+import asyncio
+import contextlib
+import heapq
+import json
+import logging
+import os
+import pathlib
+import random
+from dataclasses import asdict, dataclass
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# The old loop played with a 2.5% chance every 5 minutes, once every 200 minutes on average
+DEFAULT_MEAN_INTERVAL = 200 * 60.0
+DEFAULT_JITTER = 0.25
+DEFAULT_MAX_CONCURRENT = 4
+MIN_INTERVAL = 60.0
+BUSY_RETRY_DELAY = 60.0
+DISTRIBUTIONS = ("exponential", "uniform")
+
+
+@dataclass
+class GuildSchedule:
+    """
+    Interval play settings of a single guild.
+
+    With the ``exponential`` distribution plays happen at random, ``mean_interval``
+    seconds apart on average. With ``uniform`` they happen every ``mean_interval``
+    seconds, give or take ``jitter`` of it.
+    """
+
+    enabled: bool = True
+    mean_interval: float = DEFAULT_MEAN_INTERVAL
+    distribution: str = "exponential"
+    jitter: float = DEFAULT_JITTER
+
+    def __post_init__(self):
+        if self.distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown interval distribution: {self.distribution}")
+        if self.mean_interval < MIN_INTERVAL:
+            raise ValueError(f"Interval must be at least {MIN_INTERVAL:.0f} seconds")
+        if not 0 <= self.jitter < 1:
+            raise ValueError("Jitter must be between 0 and 1")
+
+    def next_delay(self, rng: random.Random) -> float:
+        """
+        Draw the delay until the next play.
+
+        Args:
+            rng (random.Random): Random number generator to draw from.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        if self.distribution == "uniform":
+            delay = self.mean_interval * rng.uniform(1 - self.jitter, 1 + self.jitter)
+        else:
+            delay = rng.expovariate(1 / self.mean_interval)
+        return max(MIN_INTERVAL, delay)
+
+
+class ScheduleStore:
+    """
+    Per-guild interval settings, kept in a JSON file.
+
+    Guilds have to opt in, except for the guild in ``default_guild_id`` which is
+    enabled unless it has settings of its own, so the ``GUILD_ID`` setup keeps working.
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path], default_guild_id: Optional[int] = None):
+        """
+        Initialize the store and load the settings file, if there is one.
+
+        Args:
+            path (Union[str, pathlib.Path]): Path to the settings file.
+            default_guild_id (Optional[int]): Guild enabled without settings of its own.
+        """
+        self.path = pathlib.Path(path)
+        self.default_guild_id = default_guild_id
+        self._schedules: Dict[int, GuildSchedule] = dict()
+        self.load()
+
+    def load(self) -> None:
+        """
+        Read the settings file, invalid settings are ignored.
+        """
+        if not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self._schedules = {
+                int(guild_id): GuildSchedule(**schedule) for guild_id, schedule in data.items()
+            }
+        except (ValueError, TypeError) as e:
+            logging.error(f"Ignoring invalid interval settings in {self.path}: {e}")
+            self._schedules = dict()
+
+    def save(self) -> None:
+        """
+        Write the settings file atomically.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(f".{self.path.name}.tmp")
+        temp_path.write_text(
+            json.dumps(
+                {str(guild_id): asdict(schedule) for guild_id, schedule in self._schedules.items()}
+            ),
+            encoding="utf-8",
+        )
+        os.replace(temp_path, self.path)
+
+    def get(self, guild_id: int) -> Optional[GuildSchedule]:
+        """
+        Get the settings of a guild.
+
+        Args:
+            guild_id (int): The guild.
+
+        Returns:
+            Optional[GuildSchedule]: The settings, or None if the guild has not opted in.
+        """
+        schedule = self._schedules.get(guild_id)
+        if schedule is None and guild_id == self.default_guild_id:
+            schedule = GuildSchedule()
+        return schedule if schedule is not None and schedule.enabled else None
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[None]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_name(f".{self.path.name}.lock"), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def set(self, guild_id: int, schedule: GuildSchedule) -> None:
+        """
+        Change the settings of a guild and save them.
+
+        Shard processes share the settings file, so it is read again under a file
+        lock before it is written.
+
+        Args:
+            guild_id (int): The guild.
+            schedule (GuildSchedule): The new settings.
+        """
+        with self._locked():
+            self.load()
+            self._schedules[guild_id] = schedule
+            self.save()
+
+
+class IntervalScheduler:
+    """
+    Plays random sentences in every opted-in guild at random intervals.
+
+    Next play times are kept in a heap, so each wake-up only touches the guilds that
+    are due, however many guilds the bot is in. Rescheduling a guild pushes a new
+    entry and leaves the old one in the heap, it is skipped when it comes up. At most
+    ``max_concurrent`` interval plays run at once, a guild that comes up while they
+    are all busy is retried a little later.
+    """
+
+    def __init__(
+        self,
+        store: ScheduleStore,
+        play: Callable[[int], Awaitable[None]],
+        max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+        rng: Optional[random.Random] = None,
+    ):
+        """
+        Initialize the scheduler.
+
+        Args:
+            store (ScheduleStore): Per-guild settings.
+            play (Callable[[int], Awaitable[None]]): Plays a sentence in a guild.
+            max_concurrent (int): Maximum number of interval plays at once.
+            rng (Optional[random.Random]): Random number generator for the intervals.
+        """
+        self.store = store
+        self.play = play
+        self.max_concurrent = max_concurrent
+        self.rng = rng or random.Random()
+        self._heap: List[Tuple[float, int, int]] = []
+        self._entries: Dict[int, int] = dict()
+        self._sequence = 0
+        self._plays: Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def scheduled(self) -> int:
+        return len(self._entries)
+
+    @property
+    def active(self) -> int:
+        return len(self._plays)
+
+    def start(self, guild_ids: Iterable[int]) -> None:
+        """
+        Schedule the given guilds and start the scheduler task.
+
+        Guilds that are already scheduled keep their next play time, so this can be
+        called again after reconnecting.
+
+        Args:
+            guild_ids (Iterable[int]): Guilds the bot is in.
+        """
+        for guild_id in guild_ids:
+            if guild_id not in self._entries:
+                self.schedule(guild_id)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        logging.info(f"Interval scheduler started with {self.scheduled} guilds")
+
+    async def stop(self) -> None:
+        """
+        Stop the scheduler task and cancel running interval plays.
+        """
+        tasks = list(self._plays)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def schedule(self, guild_id: int, delay: Optional[float] = None) -> None:
+        """
+        Schedule the next play of a guild, replacing its current one.
+
+        Guilds that have not opted in are unscheduled instead.
+
+        Args:
+            guild_id (int): The guild.
+            delay (Optional[float]): Seconds until the play, drawn from the guild's
+                settings by default.
+        """
+        schedule = self.store.get(guild_id)
+        if schedule is None:
+            self.unschedule(guild_id)
+            return
+
+        if delay is None:
+            delay = schedule.next_delay(self.rng)
+        self._sequence += 1
+        self._entries[guild_id] = self._sequence
+        heapq.heappush(
+            self._heap, (asyncio.get_running_loop().time() + delay, self._sequence, guild_id)
+        )
+        self._wakeup.set()
+
+    def unschedule(self, guild_id: int) -> None:
+        """
+        Cancel the next play of a guild.
+
+        Args:
+            guild_id (int): The guild.
+        """
+        self._entries.pop(guild_id, None)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+
+            # Drop entries of guilds that were rescheduled or unscheduled
+            while self._heap and self._entries.get(self._heap[0][2]) != self._heap[0][1]:
+                heapq.heappop(self._heap)
+
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            fire_at, _, guild_id = self._heap[0]
+            delay = fire_at - loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            if self.active >= self.max_concurrent:
+                self.schedule(guild_id, BUSY_RETRY_DELAY * self.rng.uniform(0.5, 1.5))
+            else:
+                task = asyncio.create_task(self._play(guild_id))
+                self._plays.add(task)
+                task.add_done_callback(self._plays.discard)
+                self.schedule(guild_id)
+
+            # Let the plays run when many guilds are due at once
+            await asyncio.sleep(0)
+
+    async def _play(self, guild_id: int) -> None:
+        try:
+            await self.play(guild_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.exception(f"Interval play in guild {guild_id} failed")
@@ -0,0 +1,220 @@
+import asyncio
+import collections
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Generic, Optional, Tuple, TypeVar
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_POOL_MEMORY_BUDGET = 64 * 1024 * 1024
+REFILL_BACKOFF = 0.05
+REFILL_ERROR_BACKOFF = 5.0
+
+T = TypeVar("T")
+
+
+@dataclass
+class SentencePoolStats:
+    """
+    Hit, miss and refill statistics of a sentence pool.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    refills: int = 0
+    refill_errors: int = 0
+    total_refill_lag: float = 0.0
+    max_refill_lag: float = 0.0
+    last_refill_lag: float = 0.0
+    size: int = 0
+    nbytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+    @property
+    def average_refill_lag(self) -> float:
+        return self.total_refill_lag / self.refills if self.refills else 0.0
+
+
+class SentencePool(Generic[T]):
+    """
+    Bounded ring buffer of pre-composed sentences.
+
+    A background task keeps the pool filled, so a command only has to take a ready
+    sentence. Refills run one at a time and only while ``is_idle`` reports that the
+    bot has nothing else to do, so they never compete with commands. The pool holds
+    at most ``size`` sentences and stops refilling once they take ``memory_budget``
+    bytes. When the pool is empty, sentences are composed on demand.
+
+    The refill lag is the time from a slot becoming free until it is filled again.
+    """
+
+    def __init__(
+        self,
+        compose: Callable[[], Awaitable[T]],
+        sizeof: Callable[[T], int],
+        is_idle: Callable[[], bool] = lambda: True,
+        size: int = DEFAULT_POOL_SIZE,
+        memory_budget: int = DEFAULT_POOL_MEMORY_BUDGET,
+    ):
+        """
+        Initialize the sentence pool.
+
+        Args:
+            compose (Callable[[], Awaitable[T]]): Composes a new sentence.
+            sizeof (Callable[[T], int]): Gets the size of a sentence in bytes.
+            is_idle (Callable[[], bool]): Tells whether the bot is idle enough to refill.
+            size (int): Maximum number of sentences kept ready.
+            memory_budget (int): Maximum number of bytes kept ready.
+        """
+        self.compose = compose
+        self.sizeof = sizeof
+        self.is_idle = is_idle
+        self.size = size
+        self.memory_budget = memory_budget
+        self._sentences: Deque[Tuple[T, int]] = collections.deque()
+        self._stats = SentencePoolStats()
+        self._wanted = asyncio.Event()
+        self._wanted_since: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        # Incremented by discard, so a refill composed before it is dropped as well
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._sentences)
+
+    @property
+    def is_full(self) -> bool:
+        return len(self._sentences) >= self.size or self._stats.nbytes >= self.memory_budget
+
+    def start(self) -> None:
+        """
+        Start the background refill task.
+        """
+        if self.size > 0 and self._task is None:
+            self._want()
+            self._task = asyncio.create_task(self._refill())
+
+    async def stop(self) -> None:
+        """
+        Stop the background refill task and drop all pre-composed sentences.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._sentences.clear()
+        self._stats.size = self._stats.nbytes = 0
+
+    async def take(
+        self,
+        accept: Optional[Callable[[T], bool]] = None,
+        compose: Optional[Callable[[], Awaitable[T]]] = None,
+    ) -> T:
+        """
+        Take a pre-composed sentence, or compose one if the pool has none.
+
+        Args:
+            accept (Optional[Callable[[T], bool]]): Tells whether a pre-composed
+                sentence may be taken. The oldest accepted one is taken.
+            compose (Optional[Callable[[], Awaitable[T]]]): Composes a sentence if
+                none is accepted, instead of the pool's ``compose``.
+
+        Returns:
+            T: The sentence.
+        """
+        for index, (sentence, nbytes) in enumerate(self._sentences):
+            if accept is not None and not accept(sentence):
+                continue
+            del self._sentences[index]
+            self._stats.hits += 1
+            self._stats.size -= 1
+            self._stats.nbytes -= nbytes
+            self._want()
+            return sentence
+
+        self._stats.misses += 1
+        self._want()
+        return await (compose or self.compose)()
+
+    def discard(self, reject: Callable[[T], bool]) -> int:
+        """
+        Drop the pre-composed sentences that may no longer be played, e.g. the ones
+        made of segments removed from the catalogue. A refill in progress is dropped
+        as well, since it may have been composed before the change.
+
+        Args:
+            reject (Callable[[T], bool]): Tells whether a sentence has to be dropped.
+
+        Returns:
+            int: The number of sentences dropped.
+        """
+        self._generation += 1
+        kept = collections.deque(entry for entry in self._sentences if not reject(entry[0]))
+        dropped = len(self._sentences) - len(kept)
+        self._sentences = kept
+        self._stats.size = len(kept)
+        self._stats.nbytes = sum(nbytes for _, nbytes in kept)
+        if dropped:
+            self._want()
+        return dropped
+
+    def _want(self) -> None:
+        if self._wanted_since is None:
+            self._wanted_since = time.monotonic()
+        self._wanted.set()
+
+    def stats(self) -> SentencePoolStats:
+        """
+        Get hit, miss and refill statistics.
+
+        Returns:
+            SentencePoolStats: The statistics.
+        """
+        return self._stats
+
+    async def _refill(self) -> None:
+        while True:
+            if self.is_full:
+                self._wanted_since = None
+                self._wanted.clear()
+                await self._wanted.wait()
+                continue
+
+            # Yield to commands first, refills only use otherwise idle capacity
+            if not self.is_idle():
+                await asyncio.sleep(REFILL_BACKOFF)
+                continue
+
+            generation = self._generation
+            try:
+                sentence = await self.compose()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._stats.refill_errors += 1
+                logging.exception("Failed to compose a sentence for the pool")
+                await asyncio.sleep(REFILL_ERROR_BACKOFF)
+                continue
+
+            if generation != self._generation:
+                continue
+
+            nbytes = self.sizeof(sentence)
+            self._sentences.append((sentence, nbytes))
+            self._stats.size += 1
+            self._stats.nbytes += nbytes
+            self._stats.refills += 1
+
+            if self._wanted_since is not None:
+                lag = time.monotonic() - self._wanted_since
+                self._stats.total_refill_lag += lag
+                self._stats.max_refill_lag = max(self._stats.max_refill_lag, lag)
+                self._stats.last_refill_lag = lag
+                self._wanted_since = time.monotonic() if not self.is_full else None
@@ -0,0 +1,143 @@
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+import discord
+
+from bot.client import DiscordBot
+from entities.catalogue import KorwinCatalogue
+from utils.logging import setup_logging
+from utils.logging.setup import DEFAULT_LOG_FILE
+from utils.profiling import StartupProfiler
+
+RESTART_DELAY = 5.0
+
+
+class ShardedDiscordBot(DiscordBot, discord.AutoShardedClient):
+    """
+    Discord bot client that runs a subset of the bot's shards in this process.
+
+    The process running shard 0 is the primary one, see ``DiscordBot.primary``.
+    """
+
+    def __init__(
+        self,
+        catalogue: Union[KorwinCatalogue, Future],
+        shard_ids: Sequence[int],
+        shard_count: int,
+        profiler: Optional[StartupProfiler] = None,
+    ):
+        super().__init__(catalogue, profiler, shard_ids=list(shard_ids), shard_count=shard_count)
+        self.primary = 0 in shard_ids
+
+
+def split_shards(shard_count: int, workers: int) -> List[List[int]]:
+    """
+    Split the shards between worker processes.
+
+    Args:
+        shard_count (int): Total number of shards.
+        workers (int): Number of worker processes.
+
+    Returns:
+        List[List[int]]: The shard ids of every worker.
+    """
+    return [list(range(worker, shard_count, workers)) for worker in range(workers)]
+
+
+def _run_worker(
+    load_catalogue: Callable[[], Optional[KorwinCatalogue]],
+    shard_ids: List[int],
+    shard_count: int,
+    worker: int,
+):
+    # Every worker rotates its own log file
+    base, extension = os.path.splitext(os.getenv("LOG_FILE", DEFAULT_LOG_FILE))
+    setup_logging(f"{base}.{worker}{extension}")
+    logging.info(f"Shard worker {worker} starting with shards {shard_ids}")
+
+    # Stop gracefully when the launcher terminates the worker
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    # Every worker serves its own metrics, on consecutive ports
+    metrics_port = os.getenv("METRICS_PORT")
+    if metrics_port:
+        os.environ["METRICS_PORT"] = str(int(metrics_port) + worker)
+
+    loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalogue-loader")
+    catalogue = loader.submit(load_catalogue)
+    loader.shutdown(wait=False)
+
+    bot = ShardedDiscordBot(catalogue, shard_ids, shard_count)
+    bot.run(os.environ["DISCORD_BOT_TOKEN"])
+
+
+def run_sharded_bot(
+    load_catalogue: Callable[[], Optional[KorwinCatalogue]], shard_count: int, workers: int
+):
+    """
+    Runs the bot's shards in worker processes and restarts workers that crash.
+
+    The segment cache must already be prepared, workers only map it. Each worker
+    loads the catalogue with ``load_catalogue``, which must be picklable.
+
+    Args:
+        load_catalogue: Loads the catalogue in a worker process.
+        shard_count: Total number of shards.
+        workers: Number of worker processes.
+    """
+    if not os.getenv("DISCORD_BOT_TOKEN"):
+        logging.error("DISCORD_BOT_TOKEN environment variable not set!")
+        raise ValueError("DISCORD_BOT_TOKEN environment variable not set!")
+
+    workers = max(1, min(workers, shard_count))
+
+    # Share the CPUs between the workers' process pools
+    os.environ.setdefault("CPU_WORKERS", str(max(1, (os.cpu_count() or 1) // workers)))
+
+    context = multiprocessing.get_context("spawn")
+    shards = split_shards(shard_count, workers)
+    processes: Dict[int, multiprocessing.Process] = dict()
+    stopping = False
+
+    def start(worker: int) -> None:
+        process = context.Process(
+            target=_run_worker,
+            args=(load_catalogue, shards[worker], shard_count, worker),
+            name=f"korwin-shard-worker-{worker}",
+        )
+        process.start()
+        processes[worker] = process
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logging.info(f"Starting {workers} shard workers for {shard_count} shards")
+    for worker in range(workers):
+        start(worker)
+
+    while not stopping:
+        time.sleep(1)
+        for worker, process in list(processes.items()):
+            if process.is_alive() or stopping:
+                continue
+            logging.error(
+                f"Shard worker {worker} exited with code {process.exitcode}, "
+                f"restarting in {RESTART_DELAY:.0f}s"
+            )
+            time.sleep(RESTART_DELAY)
+            start(worker)
+
+    logging.info("Stopping shard workers...")
+    for process in processes.values():
+        process.terminate()
+    for process in processes.values():
+        process.join()
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+import discord
+
+from utils.metrics import VOICE_CONNECT_TIME
+
+DEFAULT_IDLE_TIMEOUT = 60.0
+
+
+class VoiceSession:
+    """
+    Voice connection of a single guild with a FIFO queue of clips to play.
+
+    The connection is kept open between clips and closed after the queue has been
+    empty for ``idle_timeout`` seconds.
+    """
+
+    def __init__(self, guild: discord.Guild, idle_timeout: float):
+        self.guild = guild
+        self.idle_timeout = idle_timeout
+        self.voice_client: Optional[discord.VoiceClient] = None
+        self._queue: asyncio.Queue[
+            Tuple[discord.VoiceChannel, discord.AudioSource, asyncio.Future]
+        ] = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def is_active(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def enqueue(self, channel: discord.VoiceChannel, source: discord.AudioSource) -> asyncio.Future:
+        """
+        Queue a clip to be played in a voice channel of this guild.
+
+        Args:
+            channel (discord.VoiceChannel): Channel to play the clip in.
+            source (discord.AudioSource): The clip.
+
+        Returns:
+            asyncio.Future: Resolved when the clip has finished playing.
+        """
+        finished = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((channel, source, finished))
+
+        if not self.is_active:
+            self._worker = asyncio.create_task(self._run())
+
+        return finished
+
+    async def _connect(self, channel: discord.VoiceChannel) -> discord.VoiceClient:
+        if self.voice_client is None or not self.voice_client.is_connected():
+            logging.info(f"Connecting to voice channel {channel.id} in guild {self.guild.id}")
+            with VOICE_CONNECT_TIME.time():
+                self.voice_client = await channel.connect()
+        elif self.voice_client.channel != channel:
+            await self.voice_client.move_to(channel)
+        return self.voice_client
+
+    async def _play(self, channel: discord.VoiceChannel, source: discord.AudioSource) -> None:
+        loop = asyncio.get_running_loop()
+        done = asyncio.Event()
+        errors = []
+
+        def after(error: Optional[Exception]):
+            if error is not None:
+                errors.append(error)
+            loop.call_soon_threadsafe(done.set)
+
+        try:
+            vc = await self._connect(channel)
+            vc.play(source, after=after)
+        except BaseException:
+            # The player never got the source, so nothing else cleans it up
+            source.cleanup()
+            raise
+
+        try:
+            await done.wait()
+        except asyncio.CancelledError:
+            # The player cleans up the source when it stops
+            vc.stop()
+            raise
+
+        if errors:
+            raise errors[0]
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                try:
+                    channel, source, finished = await asyncio.wait_for(
+                        self._queue.get(), timeout=self.idle_timeout
+                    )
+                except asyncio.TimeoutError:
+                    await self.disconnect()
+                    if self._queue.empty():
+                        return
+                    continue
+
+                try:
+                    await self._play(channel, source)
+                except asyncio.CancelledError:
+                    finished.cancel()
+                    raise
+                except Exception as e:
+                    if not finished.done():
+                        finished.set_exception(e)
+                else:
+                    if not finished.done():
+                        finished.set_result(None)
+        finally:
+            await self.disconnect()
+
+    async def close(self) -> None:
+        """
+        Stop playing, drop the queued clips and disconnect.
+        """
+        if self.is_active:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+
+        while not self._queue.empty():
+            _, source, finished = self._queue.get_nowait()
+            source.cleanup()
+            finished.cancel()
+
+        await self.disconnect()
+
+    async def disconnect(self) -> None:
+        """
+        Disconnect from the voice channel, if connected.
+        """
+        if self.voice_client is not None and self.voice_client.is_connected():
+            logging.info(f"Disconnecting from voice in guild {self.guild.id}")
+            await self.voice_client.disconnect()
+        self.voice_client = None
+
+
+class VoiceSessionManager:
+    """
+    Keeps one voice session per guild, so consecutive clips reuse the connection.
+    """
+
+    def __init__(self, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._sessions: Dict[int, VoiceSession] = dict()
+
+    @property
+    def active_sessions(self) -> int:
+        return sum(session.is_active for session in self._sessions.values())
+
+    def get_session(self, guild: discord.Guild) -> VoiceSession:
+        session = self._sessions.get(guild.id)
+        if session is None:
+            session = self._sessions[guild.id] = VoiceSession(guild, self.idle_timeout)
+        return session
+
+    def play(self, channel: discord.VoiceChannel, source: discord.AudioSource) -> asyncio.Future:
+        """
+        Queue a clip in the voice session of the channel's guild.
+
+        Args:
+            channel (discord.VoiceChannel): Channel to play the clip in.
+            source (discord.AudioSource): The clip.
+
+        Returns:
+            asyncio.Future: Resolved when the clip has finished playing.
+        """
+        return self.get_session(channel.guild).enqueue(channel, source)
+
+    async def close(self) -> None:
+        """
+        Stop and disconnect all voice sessions.
+        """
+        for session in self._sessions.values():
+            await session.close()
@@ -4,6 +4,22 @@ Entities package for the KorwinAI Discord Bot.
 This package contains the core domain entities used by the application.
 """
 
-from entities.catalogue import Category, KorwinCatalogue, LocalCache
+from entities.catalogue import (
+    Category,
+    EvictionPolicy,
+    KorwinCatalogue,
+    LocalCache,
+    PackCache,
+    PhraseCache,
+    SegmentStore,
+)
 
-__all__ = ["KorwinCatalogue", "Category", "LocalCache"]
+__all__ = [
+    "KorwinCatalogue",
+    "Category",
+    "EvictionPolicy",
+    "LocalCache",
+    "PackCache",
+    "PhraseCache",
+    "SegmentStore",
+]
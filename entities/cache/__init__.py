@@ -7,11 +7,34 @@ This module provides caching functionality for audio files generated from text s
 import logging
 import pathlib
 from abc import ABC
-from typing import Dict, Union
-
-from pydub import AudioSegment
+from typing import TYPE_CHECKING, Dict, List, Optional, Union
 
 from entities.catalogue.category import Category
+from utils.concurrency.file_lock import FileLock
+
+LOCK_DIR = ".locks"
+
+if TYPE_CHECKING:
+    from pydub import AudioSegment
+
+    from entities.cache.eviction import EvictionPolicy
+
+
+class ICacheWriter(ABC):
+    """
+    Incremental writer of a single cache entry.
+
+    Written data only becomes visible in the cache after ``commit``.
+    """
+
+    def write(self, data: bytes) -> None:
+        raise NotImplemented
+
+    def commit(self) -> None:
+        raise NotImplemented
+
+    def abort(self) -> None:
+        raise NotImplemented
 
 
 class ICache(ABC):
@@ -33,6 +56,32 @@ class ICache(ABC):
     def _map_category_to_string(category: Category | str = None) -> str:
         raise NotImplemented
 
+    def refresh(self) -> None:
+        raise NotImplemented
+
+    def flush(self) -> None:
+        raise NotImplemented
+
+    def lock_mp3(self, hash: str, category: Category | str = None) -> FileLock:
+        """
+        Get a lock that serializes generating an entry between threads and processes.
+
+        Every entry has its own lock file, so generating one entry never waits for
+        another. The lock file is removed on release, so the lock directory does not
+        grow with the cache.
+
+        Args:
+            hash (str): Hash of the entry.
+            category (Category | str): Category of the entry.
+
+        Returns:
+            FileLock: The lock, not yet acquired.
+        """
+        category_dir = self._map_category_to_string(category)
+        return FileLock(
+            self.cache_dir.joinpath(LOCK_DIR, f"{category_dir}-{hash}.lock"), remove=True
+        )
+
     def is_all_cached(self) -> bool:
         raise NotImplemented
 
@@ -48,8 +97,44 @@ class ICache(ABC):
     def save_mp3(self, audio: bytes, hash: str, category: Category | str = None) -> None:
         raise NotImplemented
 
-    def load_mp3(self, hash: str, category: Category | str = None) -> AudioSegment:
+    def open_mp3_writer(self, hash: str, category: Category | str = None) -> ICacheWriter:
+        raise NotImplemented
+
+    def read_mp3(self, hash: str, category: Category | str = None) -> bytes | memoryview:
+        raise NotImplemented
+
+    def load_mp3(self, hash: str, category: Category | str = None) -> "AudioSegment":
+        raise NotImplemented
+
+    def is_opus_cached(self, hash: str, category: Category | str = None) -> bool:
+        raise NotImplemented
+
+    def save_opus(self, packets: bytes, hash: str, category: Category | str = None) -> None:
+        raise NotImplemented
+
+    def load_opus(self, hash: str, category: Category | str = None) -> bytes | memoryview:
+        raise NotImplemented
+
+    def get_loudness(self, hash: str, category: Category | str = None) -> Optional[float]:
+        raise NotImplemented
+
+    def save_loudness(self, loudness: float, hash: str, category: Category | str = None) -> None:
+        raise NotImplemented
+
+    def list_mp3(self, category: Category | str = None) -> List[str]:
+        raise NotImplemented
+
+    def load_random_mp3(self, category: Category | str = None) -> "AudioSegment":
+        raise NotImplemented
+
+    def touch_mp3(self, hash: str, category: Category | str = None) -> None:
+        raise NotImplemented
+
+    def retire_mp3(self, hash: str, category: Category | str = None) -> None:
+        raise NotImplemented
+
+    def restore_mp3(self, hash: str, category: Category | str = None) -> bool:
         raise NotImplemented
 
-    def load_random_mp3(self, category: Category | str = None) -> AudioSegment:
+    def evict_custom(self, policy: "EvictionPolicy") -> List[str]:
         raise NotImplemented
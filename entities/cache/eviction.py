@@ -0,0 +1,193 @@
+"""
+Eviction module for the KorwinAI Discord Bot.
+
+This module tracks when custom phrases in the cache were last played and how often,
+and decides which of them to delete to keep the ``custom`` category within its size
+and age limits. The access records are kept in an index file, so eviction never has
+to scan the cache directory. Every process sharing the cache merges its accesses into
+that file.
+"""
+
+import json
+import os
+import pathlib
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Set
+
+from utils.concurrency.file_lock import FileLock
+
+ACCESS_FILE = "custom_access.json"
+DEFAULT_HALF_LIFE = 7 * 24 * 3600.0
+
+
+@dataclass
+class AccessRecord:
+    """
+    Size and access history of a single cached phrase.
+    """
+
+    size: int
+    accessed: float
+    hits: int = 0
+
+
+class AccessIndex:
+    """
+    Access records of the cached custom phrases, backed by an index file.
+
+    Records are updated in memory on every access and only written by ``save``, which
+    merges them with the records saved by other processes, so plays in every shard
+    worker count.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.records: Dict[str, AccessRecord] = dict()
+        self._lock = threading.Lock()
+        # Changes since the last save: hits per touched or added phrase, forgotten phrases
+        self._hits: Dict[str, int] = dict()
+        self._forgotten: Set[str] = set()
+        self.load()
+
+    def _read(self) -> Dict[str, AccessRecord]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return dict()
+        return {hash: AccessRecord(**record) for hash, record in data.items()}
+
+    def load(self) -> None:
+        self.records = self._read()
+
+    def save(self) -> None:
+        """
+        Merge the changes since the last save into the index file, atomically.
+
+        Phrases accessed here and in another process keep the latest access time and
+        the hits of both.
+        """
+        with FileLock(self.path.with_name(f".{self.path.name}.lock")):
+            merged = self._read()
+            with self._lock:
+                for hash, hits in self._hits.items():
+                    record = self.records.get(hash)
+                    if record is None:
+                        continue
+                    saved = merged.get(hash)
+                    if saved is None:
+                        merged[hash] = AccessRecord(record.size, record.accessed, record.hits)
+                    else:
+                        saved.accessed = max(saved.accessed, record.accessed)
+                        saved.hits += hits
+                for hash in self._forgotten:
+                    merged.pop(hash, None)
+                self._hits.clear()
+                self._forgotten.clear()
+                self.records = {
+                    hash: AccessRecord(record.size, record.accessed, record.hits)
+                    for hash, record in merged.items()
+                }
+                data = {hash: asdict(record) for hash, record in merged.items()}
+
+            temp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+            temp_path.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(temp_path, self.path)
+
+    def add(self, hash: str, size: int, accessed: Optional[float] = None) -> None:
+        """
+        Start tracking a phrase, if it is not tracked yet.
+
+        Args:
+            hash (str): Hash of the phrase.
+            size (int): Size of the cached file in bytes.
+            accessed (Optional[float]): Time of the last access, defaults to now.
+        """
+        with self._lock:
+            if hash not in self.records:
+                self.records[hash] = AccessRecord(size, accessed or time.time())
+                self._hits.setdefault(hash, 0)
+                self._forgotten.discard(hash)
+
+    def touch(self, hash: str, size: Optional[int] = None) -> None:
+        """
+        Record an access of a phrase.
+
+        Args:
+            hash (str): Hash of the phrase.
+            size (Optional[int]): Size of the cached file, needed for untracked phrases.
+        """
+        now = time.time()
+        with self._lock:
+            record = self.records.get(hash)
+            if record is None:
+                if size is None:
+                    return
+                record = self.records[hash] = AccessRecord(size, now)
+                self._forgotten.discard(hash)
+            record.accessed = now
+            record.hits += 1
+            self._hits[hash] = self._hits.get(hash, 0) + 1
+
+    def forget(self, hash: str) -> None:
+        with self._lock:
+            self.records.pop(hash, None)
+            self._hits.pop(hash, None)
+            self._forgotten.add(hash)
+
+
+@dataclass
+class EvictionPolicy:
+    """
+    Size and age limits of the cached custom phrases.
+
+    Phrases not played for ``max_age`` seconds are evicted. If the rest still takes
+    more than ``max_bytes``, the phrases with the lowest retention score are evicted
+    until it fits. The score is the number of plays, halved for every ``half_life``
+    seconds since the last play, so phrases played often survive a while after they
+    were last played, and phrases played once go first.
+    """
+
+    max_bytes: Optional[int] = None
+    max_age: Optional[float] = None
+    half_life: float = DEFAULT_HALF_LIFE
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes is not None or self.max_age is not None
+
+    def score(self, record: AccessRecord, now: float) -> float:
+        return (1 + record.hits) * 0.5 ** (max(0.0, now - record.accessed) / self.half_life)
+
+    def select(self, records: Dict[str, AccessRecord], now: Optional[float] = None) -> List[str]:
+        """
+        Pick the phrases to evict.
+
+        Args:
+            records (Dict[str, AccessRecord]): Access records keyed by hash.
+            now (Optional[float]): The current time, defaults to now.
+
+        Returns:
+            List[str]: Hashes of the phrases to evict.
+        """
+        now = now or time.time()
+        evicted = []
+        remaining = list(records.items())
+
+        if self.max_age is not None:
+            evicted = [hash for hash, record in remaining if now - record.accessed > self.max_age]
+            expired = set(evicted)
+            remaining = [(hash, record) for hash, record in remaining if hash not in expired]
+
+        if self.max_bytes is not None:
+            total = sum(record.size for _, record in remaining)
+            if total > self.max_bytes:
+                remaining.sort(key=lambda item: self.score(item[1], now))
+                for hash, record in remaining:
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append(hash)
+                    total -= record.size
+
+        return evicted
@@ -1,16 +1,83 @@
+import os
 import pathlib
-import random
-from typing import Dict
+import tempfile
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
 
-from pydub import AudioSegment
-
-from entities.cache import ICache
+from entities.cache import ICache, ICacheWriter
+from entities.cache.eviction import ACCESS_FILE, AccessIndex, EvictionPolicy
+from entities.cache.manifest import CacheManifest, CategoryIndex, ManifestEntry
 from entities.catalogue.category import Category
+from utils.metrics import CACHE_READ_TIME
+
+MANIFEST_FILE = "manifest.json"
+ORPHAN_DIR = "orphans"
+DEFAULT_REFRESH_INTERVAL = 30.0
+MANIFEST_SAVE_INTERVAL = 256
+
+if TYPE_CHECKING:
+    from pydub import AudioSegment
+
+
+class LocalCacheWriter(ICacheWriter):
+    """
+    Writes a cache entry to a temporary file and renames it into place on commit.
+    """
+
+    def __init__(self, path: pathlib.Path, on_commit: Optional[Callable[[], None]] = None):
+        self.path = path
+        self.on_commit = on_commit
+        # The directory as it was before this write, see LocalCache._own_write
+        self.directory_mtime = path.parent.stat().st_mtime_ns
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".part")
+        self.temp_path = pathlib.Path(temp_path)
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+
+    def commit(self) -> None:
+        self._file.close()
+        os.replace(self.temp_path, self.path)
+        if self.on_commit is not None:
+            self.on_commit()
+
+    def abort(self) -> None:
+        self._file.close()
+        self.temp_path.unlink(missing_ok=True)
 
 
 class LocalCache(ICache):
-    def __init__(self, cache_dir):
+    """
+    Cache that keeps every entry as a file in ``<cache_dir>/<category>/<hash>.mp3``.
+
+    The files of each category are indexed in memory and in a manifest file, so that
+    existence checks and random picks do not touch the filesystem. A category is
+    rescanned at most every ``refresh_interval`` seconds, and only if its directory
+    changed. Entry updates are written to the manifest in batches, call ``flush``
+    after a batch of writes.
+    """
+
+    def __init__(self, cache_dir, refresh_interval: float = DEFAULT_REFRESH_INTERVAL):
         super().__init__(pathlib.Path(cache_dir))
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._refreshed: Dict[str, float] = dict()
+        self._manifest = CacheManifest(self.cache_dir.joinpath(MANIFEST_FILE))
+        self._manifest.load()
+        self._unsaved = 0
+        self._access: Optional[AccessIndex] = None
+
+    def _save_manifest(self) -> None:
+        self._manifest.save()
+        self._unsaved = 0
+
+    def _manifest_changed(self) -> None:
+        # Rewriting the whole manifest on every write makes bulk writes quadratic
+        self._unsaved += 1
+        if self._unsaved >= MANIFEST_SAVE_INTERVAL:
+            self._save_manifest()
 
     @staticmethod
     def _map_category_to_string(category: Category | str = None):
@@ -24,6 +91,88 @@ class LocalCache(ICache):
             case _:
                 raise ValueError("category must be a Category or None")
 
+    def _index(self, category: Category | str = None) -> CategoryIndex:
+        category_dir = self._map_category_to_string(category)
+        now = time.monotonic()
+
+        with self._lock:
+            index = self._manifest.categories.get(category_dir)
+            refreshed = self._refreshed.get(category_dir)
+            if index is not None and refreshed is not None:
+                if now - refreshed < self.refresh_interval:
+                    return index
+
+            if index is None:
+                index = self._manifest.categories[category_dir] = CategoryIndex()
+            if index.rescan(self.cache_dir.joinpath(category_dir)):
+                self._save_manifest()
+            self._refreshed[category_dir] = now
+            return index
+
+    def _own_write(self, category_dir: str, directory_mtime: int) -> None:
+        # A write through this cache changes the directory, which would make the next
+        # refresh rescan and stat the whole category. If nothing else changed the
+        # directory since it was last scanned, the index already has the write.
+        index = self._manifest.categories.get(category_dir)
+        if index is not None and index.directory_mtime == directory_mtime:
+            index.directory_mtime = self.cache_dir.joinpath(category_dir).stat().st_mtime_ns
+
+    def _index_file(
+        self, hash: str, category: Category | str = None, directory_mtime: Optional[int] = None
+    ) -> None:
+        category_dir = self._map_category_to_string(category)
+        path = self.cache_dir.joinpath(category_dir, f"{hash}.mp3")
+
+        with self._lock:
+            if directory_mtime is not None:
+                self._own_write(category_dir, directory_mtime)
+            index = self._index(category)
+            entry = index.get(hash)
+            index.add(
+                ManifestEntry.from_stat(hash, path.stat(), opus=entry.opus if entry else False)
+            )
+            self._manifest_changed()
+
+    def _custom_access(self) -> AccessIndex:
+        with self._lock:
+            if self._access is None:
+                self._access = AccessIndex(self.cache_dir.joinpath(ACCESS_FILE))
+                self._sync_custom_access()
+            return self._access
+
+    def _sync_custom_access(self) -> None:
+        # Track phrases cached before tracking started or by another process, and
+        # forget phrases that were deleted by hand
+        index = self._index(None)
+        for entry in index.entries.values():
+            self._access.add(entry.hash, entry.size, entry.mtime)
+        for hash in [hash for hash in self._access.records if hash not in index]:
+            self._access.forget(hash)
+
+    def refresh(self) -> None:
+        """
+        Rescan the directories of all indexed categories that changed.
+        """
+        with self._lock:
+            self._refreshed.clear()
+            for category_dir in list(self._manifest.categories):
+                self._index(category_dir)
+
+    def flush(self) -> None:
+        """
+        Write the manifest file, if entries changed since it was last written, and
+        merge the custom phrase accesses into the access file.
+        """
+        with self._lock:
+            if self._unsaved:
+                self._save_manifest()
+            access = self._access
+        if access is not None:
+            access.save()
+
+    def get_entry(self, hash: str, category: Category | str = None) -> Optional[ManifestEntry]:
+        return self._index(category).get(hash)
+
     def is_hashmap_cached(self, hashmap: Dict[str, Dict[str, str]]) -> bool:
         for category_name, category in hashmap.items():
             for cache_hash, text in category.items():
@@ -37,25 +186,173 @@ class LocalCache(ICache):
         self.cache_dir.joinpath(category_dir).mkdir(exist_ok=True)
 
     def is_mp3_cached(self, hash: str, category: Category | str = None) -> bool:
+        return hash in self._index(category)
+
+    def save_mp3(self, audio: bytes, hash: str, category: Category | str = None) -> None:
         category_dir = self._map_category_to_string(category)
 
-        return self.cache_dir.joinpath(category_dir, f"{hash}.mp3").exists()
+        self.generate_category_directory(category)
+
+        # Written under a temporary name, so readers never see a partial file
+        writer = LocalCacheWriter(self.cache_dir.joinpath(category_dir, f"{hash}.mp3"))
+        writer.write(audio)
+        writer.commit()
 
-    def save_mp3(self, audio: bytes, hash: str, category: Category | str = None) -> None:
+        self._index_file(hash, category, writer.directory_mtime)
+        if category_dir == "custom":
+            self._custom_access().add(hash, len(audio))
+
+    def open_mp3_writer(self, hash: str, category: Category | str = None) -> LocalCacheWriter:
         category_dir = self._map_category_to_string(category)
 
         self.generate_category_directory(category)
 
-        with open(self.cache_dir.joinpath(category_dir, f"{hash}.mp3"), "wb") as f:
-            f.write(audio)
+        writer = LocalCacheWriter(self.cache_dir.joinpath(category_dir, f"{hash}.mp3"))
+        writer.on_commit = lambda: self._index_file(hash, category, writer.directory_mtime)
+        return writer
+
+    def read_mp3(self, hash: str, category: Category | str = None) -> bytes:
+        category_dir = self._map_category_to_string(category)
+
+        with CACHE_READ_TIME.time(backend="local", kind="mp3"):
+            data = self.cache_dir.joinpath(category_dir, f"{hash}.mp3").read_bytes()
+
+        if category_dir == "custom":
+            self._custom_access().touch(hash, len(data))
+        return data
+
+    def load_mp3(self, hash: str, category: Category | str = None) -> "AudioSegment":
+        from pydub import AudioSegment
 
-    def load_mp3(self, hash: str, category: Category | str = None) -> AudioSegment:
         category_dir = self._map_category_to_string(category)
 
         return AudioSegment.from_mp3(self.cache_dir.joinpath(category_dir, f"{hash}.mp3"))
 
-    def load_random_mp3(self, category: Category | str = None) -> AudioSegment:
+    def is_opus_cached(self, hash: str, category: Category | str = None) -> bool:
+        entry = self._index(category).get(hash)
+        return entry is not None and entry.opus
+
+    def save_opus(self, packets: bytes, hash: str, category: Category | str = None) -> None:
         category_dir = self._map_category_to_string(category)
-        list_of_files = list(self.cache_dir.joinpath(category_dir).glob("*.mp3"))
 
-        return AudioSegment.from_mp3(random.choice(list_of_files))
+        self.generate_category_directory(category)
+
+        writer = LocalCacheWriter(self.cache_dir.joinpath(category_dir, f"{hash}.opus"))
+        writer.write(packets)
+        writer.commit()
+
+        with self._lock:
+            self._own_write(category_dir, writer.directory_mtime)
+            entry = self._index(category).get(hash)
+            if entry is not None:
+                entry.opus = True
+                self._manifest_changed()
+
+    def load_opus(self, hash: str, category: Category | str = None) -> bytes:
+        category_dir = self._map_category_to_string(category)
+
+        with CACHE_READ_TIME.time(backend="local", kind="opus"):
+            return self.cache_dir.joinpath(category_dir, f"{hash}.opus").read_bytes()
+
+    def get_loudness(self, hash: str, category: Category | str = None) -> Optional[float]:
+        entry = self._index(category).get(hash)
+        return entry.loudness if entry is not None else None
+
+    def save_loudness(self, loudness: float, hash: str, category: Category | str = None) -> None:
+        with self._lock:
+            entry = self._index(category).get(hash)
+            if entry is not None:
+                entry.loudness = loudness
+                self._manifest_changed()
+
+    def list_mp3(self, category: Category | str = None) -> List[str]:
+        return self._index(category).hashes()
+
+    def load_random_mp3(self, category: Category | str = None) -> "AudioSegment":
+        return self.load_mp3(self._index(category).random(), category)
+
+    def touch_mp3(self, hash: str, category: Category | str = None) -> None:
+        if self._map_category_to_string(category) == "custom":
+            self._custom_access().touch(hash)
+
+    def retire_mp3(self, hash: str, category: Category | str = None) -> None:
+        """
+        Move an entry that left the catalogue to ``<cache_dir>/orphans/<category>``.
+
+        Retired entries can be brought back with ``restore_mp3``, or reclaimed by
+        deleting the orphans directory.
+
+        Args:
+            hash (str): The hash of the entry.
+            category (Category | str): The category of the entry.
+        """
+        category_dir = self._map_category_to_string(category)
+        orphan_dir = self.cache_dir.joinpath(ORPHAN_DIR, category_dir)
+        orphan_dir.mkdir(parents=True, exist_ok=True)
+
+        with self._lock:
+            for extension in ("mp3", "opus"):
+                path = self.cache_dir.joinpath(category_dir, f"{hash}.{extension}")
+                if path.exists():
+                    os.replace(path, orphan_dir.joinpath(path.name))
+            self._index(category).remove(hash)
+            self._save_manifest()
+
+    def restore_mp3(self, hash: str, category: Category | str = None) -> bool:
+        """
+        Move a retired entry back into the cache.
+
+        Args:
+            hash (str): The hash of the entry.
+            category (Category | str): The category of the entry.
+
+        Returns:
+            bool: True if the entry was retired and has been restored.
+        """
+        category_dir = self._map_category_to_string(category)
+        orphan_dir = self.cache_dir.joinpath(ORPHAN_DIR, category_dir)
+        if not orphan_dir.joinpath(f"{hash}.mp3").exists():
+            return False
+
+        self.generate_category_directory(category)
+        with self._lock:
+            # The Opus packets go first, so the entry is indexed with them
+            for extension in ("opus", "mp3"):
+                path = orphan_dir.joinpath(f"{hash}.{extension}")
+                if path.exists():
+                    os.replace(path, self.cache_dir.joinpath(category_dir, path.name))
+            self._index_file(hash, category)
+            self._index(category).get(hash).opus = self.cache_dir.joinpath(
+                category_dir, f"{hash}.opus"
+            ).exists()
+            self._save_manifest()
+        return True
+
+    def evict_custom(self, policy: EvictionPolicy) -> List[str]:
+        """
+        Delete the custom phrases selected by an eviction policy.
+
+        Args:
+            policy (EvictionPolicy): The size and age limits.
+
+        Returns:
+            List[str]: Hashes of the deleted phrases.
+        """
+        with self._lock:
+            access = self._custom_access()
+            # Pick up the plays recorded by other processes sharing the cache
+            access.save()
+            self._sync_custom_access()
+
+            index = self._index(None)
+            evicted = policy.select(access.records)
+            for hash in evicted:
+                for extension in ("mp3", "opus"):
+                    self.cache_dir.joinpath("custom", f"{hash}.{extension}").unlink(missing_ok=True)
+                index.remove(hash)
+                access.forget(hash)
+
+            if evicted:
+                self._save_manifest()
+            access.save()
+            return evicted
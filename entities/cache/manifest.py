@@ -0,0 +1,182 @@
+"""
+Cache manifest module for the KorwinAI Discord Bot.
+
+This module keeps an in-memory index of the cached files of every category, backed by
+a manifest file, so that existence checks and random picks need no filesystem calls.
+"""
+
+import json
+import os
+import pathlib
+import random
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+# ElevenLabs audio is requested as constant bitrate 128 kbps MP3
+MP3_BITRATE = 128000
+
+
+@dataclass
+class ManifestEntry:
+    """
+    Metadata of a single cached MP3 file.
+    """
+
+    hash: str
+    size: int
+    duration: float
+    mtime: float
+    opus: bool = False
+    # Integrated loudness in LUFS, measured once when the segment is first decoded
+    loudness: Optional[float] = None
+
+    @classmethod
+    def from_stat(cls, hash: str, stat: os.stat_result, opus: bool = False) -> "ManifestEntry":
+        return cls(
+            hash=hash,
+            size=stat.st_size,
+            duration=stat.st_size * 8 / MP3_BITRATE,
+            mtime=stat.st_mtime,
+            opus=opus,
+        )
+
+
+class CategoryIndex:
+    """
+    Index of the cached files of a single category.
+
+    Hashes are kept both in a dictionary and in a list, so that lookups, inserts,
+    removals and uniform random picks are all O(1).
+    """
+
+    def __init__(self, directory_mtime: int = 0):
+        self.directory_mtime = directory_mtime
+        self.entries: Dict[str, ManifestEntry] = dict()
+        self._hashes: List[str] = []
+        self._positions: Dict[str, int] = dict()
+
+    def __contains__(self, hash: str) -> bool:
+        return hash in self.entries
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def get(self, hash: str) -> Optional[ManifestEntry]:
+        return self.entries.get(hash)
+
+    def add(self, entry: ManifestEntry) -> None:
+        if entry.hash not in self.entries:
+            self._positions[entry.hash] = len(self._hashes)
+            self._hashes.append(entry.hash)
+        self.entries[entry.hash] = entry
+
+    def remove(self, hash: str) -> None:
+        if hash not in self.entries:
+            return
+
+        # Move the last hash into the removed slot to keep the list dense
+        position = self._positions.pop(hash)
+        last = self._hashes.pop()
+        if last != hash:
+            self._hashes[position] = last
+            self._positions[last] = position
+        del self.entries[hash]
+
+    def hashes(self) -> List[str]:
+        return list(self._hashes)
+
+    def random(self) -> str:
+        return random.choice(self._hashes)
+
+    def to_dict(self) -> Dict:
+        return {
+            "directory_mtime": self.directory_mtime,
+            "entries": [asdict(entry) for entry in self.entries.values()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "CategoryIndex":
+        index = cls(data.get("directory_mtime", 0))
+        for entry in data.get("entries", []):
+            index.add(ManifestEntry(**entry))
+        return index
+
+    def rescan(self, directory: pathlib.Path) -> bool:
+        """
+        Bring the index up to date with a directory, if it changed since the last scan.
+
+        Every MP3 file in the directory is stat-ed, only new and changed files are
+        indexed again.
+
+        Args:
+            directory (pathlib.Path): The category directory.
+
+        Returns:
+            bool: True if the index changed.
+        """
+        try:
+            directory_mtime = directory.stat().st_mtime_ns
+        except FileNotFoundError:
+            directory_mtime = 0
+
+        if directory_mtime == self.directory_mtime:
+            return False
+
+        mp3_files: Dict[str, os.DirEntry] = dict()
+        opus_files = set()
+        if directory_mtime:
+            with os.scandir(directory) as files:
+                for file in files:
+                    stem, _, extension = file.name.rpartition(".")
+                    if extension == "mp3":
+                        mp3_files[stem] = file
+                    elif extension == "opus":
+                        opus_files.add(stem)
+
+        for hash in self.hashes():
+            if hash not in mp3_files:
+                self.remove(hash)
+
+        for hash, file in mp3_files.items():
+            stat = file.stat()
+            entry = self.entries.get(hash)
+            if entry is None or entry.mtime != stat.st_mtime or entry.size != stat.st_size:
+                self.add(ManifestEntry.from_stat(hash, stat))
+            self.entries[hash].opus = hash in opus_files
+
+        self.directory_mtime = directory_mtime
+        return True
+
+
+class CacheManifest:
+    """
+    Manifest file holding the indexes of all categories.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.categories: Dict[str, CategoryIndex] = dict()
+
+    def load(self) -> None:
+        """
+        Load the manifest file, if it exists and is readable.
+        """
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return
+
+        self.categories = {
+            category: CategoryIndex.from_dict(index) for category, index in data.items()
+        }
+
+    def save(self) -> None:
+        """
+        Write the manifest file atomically.
+        """
+        temp_path = self.path.with_name(f".{self.path.name}.tmp")
+        temp_path.write_text(
+            json.dumps({category: index.to_dict() for category, index in self.categories.items()}),
+            encoding="utf-8",
+        )
+        os.replace(temp_path, self.path)
@@ -0,0 +1,639 @@
+"""
+Pack cache module for the KorwinAI Discord Bot.
+
+This module stores every cache entry as a record in a single append-only pack file,
+with an offset index kept in memory and in an index file. The pack file is memory
+mapped, so reading an entry returns a zero-copy slice of the mapping instead of
+opening a file.
+
+See ``entities.cache.pack_tool`` for importing an existing directory layout and for
+compacting the pack file by hand.
+"""
+
+import io
+import json
+import logging
+import mmap
+import os
+import pathlib
+import random
+import struct
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+from entities.cache import ICache, ICacheWriter
+from entities.cache.eviction import ACCESS_FILE, AccessIndex, EvictionPolicy
+from entities.catalogue.category import Category
+from utils.metrics import CACHE_READ_TIME
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+if TYPE_CHECKING:
+    from pydub import AudioSegment
+
+PACK_FILE = "segments.pack"
+INDEX_FILE = "segments.idx"
+DEFAULT_REFRESH_INTERVAL = 30.0
+# Number of appended records after which the index file is rewritten. Records that
+# are not in the index file yet are recovered by scanning the end of the pack file.
+INDEX_SAVE_INTERVAL = 256
+# Evicting custom phrases compacts the pack file once at least this many bytes and
+# this fraction of it belong to removed or superseded records
+COMPACT_MIN_DEAD_BYTES = 64 * 1024 * 1024
+COMPACT_DEAD_RATIO = 0.5
+
+MAGIC = b"KPK\x01"
+KIND_MP3 = 0
+KIND_OPUS = 1
+KIND_REMOVED = 2
+KIND_LOUDNESS = 3
+EXTENSIONS = {KIND_MP3: "mp3", KIND_OPUS: "opus", KIND_LOUDNESS: "loudness"}
+
+# magic, kind, hash length, category length, data length
+_HEADER = struct.Struct("<4sBBHI")
+_LOUDNESS = struct.Struct("<d")
+
+Location = Tuple[int, int]
+
+
+class PackIndex:
+    """
+    Offsets of the live records of a pack file.
+
+    For each kind and category, the hashes are kept both in a dictionary and in a
+    list, so that lookups, inserts, removals and uniform random picks are all O(1).
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.records = 0
+        self._locations: Dict[int, Dict[str, Dict[str, Location]]] = {
+            KIND_MP3: dict(),
+            KIND_OPUS: dict(),
+            KIND_LOUDNESS: dict(),
+        }
+        self._hashes: Dict[str, List[str]] = dict()
+        self._positions: Dict[str, Dict[str, int]] = dict()
+
+    def get(self, kind: int, category: str, hash: str) -> Optional[Location]:
+        return self._locations[kind].get(category, {}).get(hash)
+
+    def hashes(self, category: str) -> List[str]:
+        return list(self._hashes.get(category, []))
+
+    def random(self, category: str) -> str:
+        return random.choice(self._hashes[category])
+
+    def categories(self) -> List[str]:
+        return list(self._locations[KIND_MP3])
+
+    def locations(self) -> Iterator[Tuple[int, str, str, Location]]:
+        for kind, categories in self._locations.items():
+            for category, locations in categories.items():
+                for hash, location in locations.items():
+                    yield kind, category, hash, location
+
+    def apply(self, kind: int, category: str, hash: str, location: Location) -> None:
+        """
+        Apply a record of the pack file to the index.
+
+        Args:
+            kind (int): The record kind.
+            category (str): The category of the record.
+            hash (str): The hash of the record.
+            location (Location): Offset and size of the record data.
+        """
+        self.records += 1
+
+        if kind == KIND_REMOVED:
+            for locations in self._locations.values():
+                locations.get(category, {}).pop(hash, None)
+            self._remove_hash(category, hash)
+            return
+
+        locations = self._locations[kind].setdefault(category, dict())
+        locations[hash] = location
+        if kind == KIND_MP3:
+            # New audio has to be measured again
+            self._locations[KIND_LOUDNESS].get(category, {}).pop(hash, None)
+            self._add_hash(category, hash)
+
+    def _add_hash(self, category: str, hash: str) -> None:
+        positions = self._positions.setdefault(category, dict())
+        if hash not in positions:
+            hashes = self._hashes.setdefault(category, [])
+            positions[hash] = len(hashes)
+            hashes.append(hash)
+
+    def _remove_hash(self, category: str, hash: str) -> None:
+        positions = self._positions.get(category, {})
+        if hash not in positions:
+            return
+
+        # Move the last hash into the removed slot to keep the list dense
+        hashes = self._hashes[category]
+        position = positions.pop(hash)
+        last = hashes.pop()
+        if last != hash:
+            hashes[position] = last
+            positions[last] = position
+
+    def to_dict(self) -> Dict:
+        return {
+            "size": self.size,
+            "records": [
+                [kind, category, hash, offset, length]
+                for kind, category, hash, (offset, length) in self.locations()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "PackIndex":
+        index = cls()
+        for kind, category, hash, offset, length in data.get("records", []):
+            index.apply(kind, category, hash, (offset, length))
+        index.size = data.get("size", 0)
+        return index
+
+
+def _encode_record(kind: int, category: str, hash: str, data: bytes) -> Tuple[bytes, int]:
+    hash_bytes = hash.encode("utf-8")
+    category_bytes = category.encode("utf-8")
+    header = (
+        _HEADER.pack(MAGIC, kind, len(hash_bytes), len(category_bytes), len(data))
+        + hash_bytes
+        + category_bytes
+    )
+    return header, len(header)
+
+
+def _scan_records(buffer, start: int, end: int) -> Iterator[Tuple[int, int, str, str, Location]]:
+    """
+    Parse the records of a pack file between two offsets.
+
+    Parsing stops at the first incomplete or corrupt record.
+
+    Yields:
+        Tuple[int, int, str, str, Location]: The record offset, kind, category, hash
+            and the offset and size of its data.
+    """
+    offset = start
+    while offset + _HEADER.size <= end:
+        magic, kind, hash_length, category_length, length = _HEADER.unpack_from(buffer, offset)
+        data_offset = offset + _HEADER.size + hash_length + category_length
+        if magic != MAGIC or data_offset + length > end:
+            return
+
+        hash = bytes(buffer[offset + _HEADER.size : offset + _HEADER.size + hash_length])
+        category = bytes(buffer[offset + _HEADER.size + hash_length : data_offset])
+        yield offset, kind, category.decode("utf-8"), hash.decode("utf-8"), (data_offset, length)
+        offset = data_offset + length
+
+
+class PackCacheWriter(ICacheWriter):
+    """
+    Buffers a cache entry in memory and appends it to the pack file on commit.
+    """
+
+    def __init__(self, cache: "PackCache", hash: str, category: str):
+        self.cache = cache
+        self.hash = hash
+        self.category = category
+        self._buffer = io.BytesIO()
+
+    def write(self, data: bytes) -> None:
+        self._buffer.write(data)
+
+    def commit(self) -> None:
+        self.cache._append(KIND_MP3, self.category, self.hash, self._buffer.getvalue())
+        self._buffer.close()
+
+    def abort(self) -> None:
+        self._buffer.close()
+
+
+class PackCache(ICache):
+    """
+    Cache that keeps every entry as a record in ``<cache_dir>/segments.pack``.
+
+    Reads are zero-copy slices of a memory mapping of the pack file. Writes append a
+    new record, so saving an entry again supersedes the old record instead of
+    overwriting it; ``compact`` rewrites the pack file without the dead records.
+    Appends are serialized between processes with a file lock, and records appended
+    by other processes are picked up every ``refresh_interval`` seconds, or as soon
+    as a lookup misses. A pack file replaced by ``compact`` in another process is
+    reopened the same way.
+    """
+
+    def __init__(self, cache_dir, refresh_interval: float = DEFAULT_REFRESH_INTERVAL):
+        super().__init__(pathlib.Path(cache_dir))
+        self.refresh_interval = refresh_interval
+        self.pack_path = self.cache_dir.joinpath(PACK_FILE)
+        self.index_path = self.cache_dir.joinpath(INDEX_FILE)
+        self._lock = threading.RLock()
+        self._map: Optional[mmap.mmap] = None
+        self._unsaved = 0
+        self._refreshed = 0.0
+        self._access: Optional[AccessIndex] = None
+
+        self.pack_path.touch(exist_ok=True)
+        self._file = open(self.pack_path, "r+b")
+        self._index = self._load_index()
+        self.refresh()
+
+    @staticmethod
+    def _map_category_to_string(category: Category | str = None):
+        match category:
+            case category if category is None:
+                return "custom"
+            case category if isinstance(category, Category):
+                return category.value
+            case category if isinstance(category, str):
+                return category
+            case _:
+                raise ValueError("category must be a Category or None")
+
+    def _load_index(self) -> PackIndex:
+        try:
+            data = json.loads(self.index_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return PackIndex()
+
+        index = PackIndex.from_dict(data)
+        # An index of another inode or describing a longer file belongs to a pack file
+        # that was replaced
+        stat = os.fstat(self._file.fileno())
+        if data.get("inode", stat.st_ino) != stat.st_ino or index.size > stat.st_size:
+            logging.warning("Pack index does not match the pack file, rebuilding it")
+            return PackIndex()
+        return index
+
+    def _save_index(self) -> None:
+        self._unsaved = 0
+        if self._replaced():
+            # The index of the old file must not overwrite the index of the compacted one
+            return
+
+        self._write_index(self._index, os.fstat(self._file.fileno()).st_ino)
+
+    def _write_index(self, index: PackIndex, inode: int) -> None:
+        data = index.to_dict()
+        data["inode"] = inode
+        # Shard workers may save the index at the same time, each from its own temp file
+        temp_path = self.index_path.with_name(f".{self.index_path.name}.{os.getpid()}.tmp")
+        temp_path.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(temp_path, self.index_path)
+
+    def _replaced(self) -> bool:
+        try:
+            return os.stat(self.pack_path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _reopen(self) -> None:
+        # Slices of the old mapping stay valid until they are released
+        logging.info(f"{self.pack_path} was compacted, reopening it")
+        self._file.close()
+        self._file = open(self.pack_path, "r+b")
+        self._map = None
+        self._unsaved = 0
+        self._index = self._load_index()
+
+    def _lock_pack(self) -> None:
+        # Another process may replace the pack file while this one waits for the lock
+        while True:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            if not self._replaced():
+                return
+            self._unlock_pack()
+            self.refresh()
+
+    def _unlock_pack(self) -> None:
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def _mapping(self, end: int) -> mmap.mmap:
+        # Mappings are never closed explicitly, so slices handed out earlier stay valid
+        # until they are released; a new mapping is created when the file grew.
+        if self._map is None or len(self._map) < end:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def refresh(self) -> None:
+        """
+        Index the records appended to the pack file since the last refresh, and
+        reopen the pack file if it was compacted.
+        """
+        with self._lock:
+            self._refreshed = time.monotonic()
+            if self._replaced():
+                self._reopen()
+            size = os.fstat(self._file.fileno()).st_size
+            if size <= self._index.size:
+                return
+
+            mapping = self._mapping(size)
+            end = self._index.size
+            for offset, kind, category, hash, location in _scan_records(
+                mapping, self._index.size, size
+            ):
+                self._index.apply(kind, category, hash, location)
+                end = location[0] + location[1]
+                self._unsaved += 1
+
+            if end < size:
+                logging.warning(f"Ignoring incomplete record at offset {end} of {self.pack_path}")
+            self._index.size = end
+
+            if self._unsaved:
+                self._save_index()
+
+    def _current_index(self) -> PackIndex:
+        if time.monotonic() - self._refreshed >= self.refresh_interval:
+            self.refresh()
+        return self._index
+
+    def _custom_access(self) -> AccessIndex:
+        with self._lock:
+            if self._access is None:
+                self._access = AccessIndex(self.cache_dir.joinpath(ACCESS_FILE))
+                self._sync_custom_access()
+            return self._access
+
+    def _sync_custom_access(self) -> None:
+        # Track phrases cached before tracking started or by another process, and
+        # forget phrases that were removed
+        index = self._current_index()
+        hashes = set(index.hashes("custom"))
+        for hash in hashes:
+            self._access.add(hash, index.get(KIND_MP3, "custom", hash)[1])
+        for hash in [hash for hash in self._access.records if hash not in hashes]:
+            self._access.forget(hash)
+
+    def _locate(self, kind: int, category: str, hash: str) -> Optional[Location]:
+        location = self._current_index().get(kind, category, hash)
+        if location is None and (
+            os.fstat(self._file.fileno()).st_size > self._index.size or self._replaced()
+        ):
+            # Another process may have just appended it, e.g. a phrase cached by another
+            # shard, or compacted the pack file
+            self.refresh()
+            location = self._index.get(kind, category, hash)
+        return location
+
+    def _append(self, kind: int, category: str, hash: str, data: bytes) -> None:
+        header, header_size = _encode_record(kind, category, hash, data)
+
+        with self._lock:
+            self._lock_pack()
+            try:
+                # Pick up records appended by other processes first, and cut off an
+                # incomplete record left behind by a crash
+                self.refresh()
+                offset = self._index.size
+                self._file.truncate(offset)
+                self._file.seek(offset)
+                self._file.write(header)
+                self._file.write(data)
+                self._file.flush()
+            finally:
+                self._unlock_pack()
+
+            self._index.apply(kind, category, hash, (offset + header_size, len(data)))
+            self._index.size = offset + header_size + len(data)
+            self._unsaved += 1
+            if self._unsaved >= INDEX_SAVE_INTERVAL:
+                self._save_index()
+
+    def _read(self, kind: int, hash: str, category: Category | str = None) -> memoryview:
+        category_dir = self._map_category_to_string(category)
+
+        with self._lock:
+            location = self._locate(kind, category_dir, hash)
+            if location is None:
+                raise FileNotFoundError(f"{category_dir}/{hash}.{EXTENSIONS[kind]} is not cached")
+            offset, length = location
+            return memoryview(self._mapping(offset + length))[offset : offset + length]
+
+    def flush(self) -> None:
+        """
+        Write the index file, if records were appended since it was last written, and
+        merge the custom phrase accesses into the access file.
+        """
+        with self._lock:
+            if self._unsaved:
+                self._save_index()
+            access = self._access
+        if access is not None:
+            access.save()
+
+    def close(self) -> None:
+        """
+        Write the index file and close the pack file.
+        """
+        with self._lock:
+            self.flush()
+            self._map = None
+            self._file.close()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the size of the pack file and how much of it is live.
+
+        Returns:
+            Dict[str, int]: Number of records, live records, pack size and live bytes.
+        """
+        with self._lock:
+            live = [location for _, _, _, location in self._index.locations()]
+            return {
+                "records": self._index.records,
+                "live_records": len(live),
+                "size": self._index.size,
+                "live_bytes": sum(length for _, length in live),
+            }
+
+    def compact(self) -> int:
+        """
+        Rewrite the pack file with only the live records.
+
+        The new pack file and its index replace the old ones atomically, so it is safe
+        to compact while the bot is running. Appends of other processes wait for the
+        compaction and then go to the new file, which their next refresh or missed
+        lookup reopens. Slices read before compaction stay valid, the disk space of
+        the old file is freed once every process released them.
+
+        Returns:
+            int: The number of bytes reclaimed.
+        """
+        with self._lock:
+            self._lock_pack()
+            try:
+                self.refresh()
+                mapping = self._mapping(self._index.size) if self._index.size else b""
+                compacted = PackIndex()
+                temp_path = self.pack_path.with_name(f".{self.pack_path.name}.tmp")
+
+                with open(temp_path, "wb") as f:
+                    for kind, category, hash, (offset, length) in sorted(
+                        self._index.locations(), key=lambda record: record[3][0]
+                    ):
+                        data = mapping[offset : offset + length]
+                        header, header_size = _encode_record(kind, category, hash, data)
+                        f.write(header)
+                        data_offset = f.tell()
+                        f.write(data)
+                        compacted.apply(kind, category, hash, (data_offset, length))
+                    compacted.size = f.tell()
+                    f.flush()
+                    os.fsync(f.fileno())
+                    # Written first, so that other processes reopening the new file find it
+                    self._write_index(compacted, os.fstat(f.fileno()).st_ino)
+
+                reclaimed = self._index.size - compacted.size
+                os.replace(temp_path, self.pack_path)
+            finally:
+                self._unlock_pack()
+
+            self._file.close()
+            self._file = open(self.pack_path, "r+b")
+            self._map = None
+            self._index = compacted
+            self._unsaved = 0
+            logging.info(f"Compacted {self.pack_path}, reclaimed {reclaimed} bytes")
+            return reclaimed
+
+    def is_hashmap_cached(self, hashmap: Dict[str, Dict[str, str]]) -> bool:
+        for category_name, category in hashmap.items():
+            for cache_hash, text in category.items():
+                if not self.is_mp3_cached(category=Category(category_name), hash=cache_hash):
+                    return False
+        return True
+
+    def generate_category_directory(self, category: Category | str = None) -> None:
+        # Categories are part of the records, there are no directories to create
+        pass
+
+    def is_mp3_cached(self, hash: str, category: Category | str = None) -> bool:
+        category_dir = self._map_category_to_string(category)
+        return self._locate(KIND_MP3, category_dir, hash) is not None
+
+    def save_mp3(self, audio: bytes, hash: str, category: Category | str = None) -> None:
+        category_dir = self._map_category_to_string(category)
+        self._append(KIND_MP3, category_dir, hash, audio)
+        if category_dir == "custom":
+            self._custom_access().add(hash, len(audio))
+
+    def open_mp3_writer(self, hash: str, category: Category | str = None) -> PackCacheWriter:
+        return PackCacheWriter(self, hash, self._map_category_to_string(category))
+
+    def read_mp3(self, hash: str, category: Category | str = None) -> memoryview:
+        with CACHE_READ_TIME.time(backend="pack", kind="mp3"):
+            data = self._read(KIND_MP3, hash, category)
+
+        if self._map_category_to_string(category) == "custom":
+            self._custom_access().touch(hash, len(data))
+        return data
+
+    def load_mp3(self, hash: str, category: Category | str = None) -> "AudioSegment":
+        from pydub import AudioSegment
+
+        return AudioSegment.from_file(io.BytesIO(self.read_mp3(hash, category)), format="mp3")
+
+    def remove_mp3(self, hash: str, category: Category | str = None) -> None:
+        """
+        Remove an entry and its Opus packets from the cache.
+
+        The space is reclaimed by the next ``compact``.
+
+        Args:
+            hash (str): The hash of the entry.
+            category (Category | str): The category of the entry.
+        """
+        self._append(KIND_REMOVED, self._map_category_to_string(category), hash, b"")
+
+    def is_opus_cached(self, hash: str, category: Category | str = None) -> bool:
+        category_dir = self._map_category_to_string(category)
+        return self._locate(KIND_OPUS, category_dir, hash) is not None
+
+    def save_opus(self, packets: bytes, hash: str, category: Category | str = None) -> None:
+        self._append(KIND_OPUS, self._map_category_to_string(category), hash, packets)
+
+    def load_opus(self, hash: str, category: Category | str = None) -> memoryview:
+        with CACHE_READ_TIME.time(backend="pack", kind="opus"):
+            return self._read(KIND_OPUS, hash, category)
+
+    def get_loudness(self, hash: str, category: Category | str = None) -> Optional[float]:
+        if self._locate(KIND_LOUDNESS, self._map_category_to_string(category), hash):
+            (loudness,) = _LOUDNESS.unpack(self._read(KIND_LOUDNESS, hash, category))
+            return loudness
+        return None
+
+    def save_loudness(self, loudness: float, hash: str, category: Category | str = None) -> None:
+        category_dir = self._map_category_to_string(category)
+        self._append(KIND_LOUDNESS, category_dir, hash, _LOUDNESS.pack(loudness))
+
+    def list_mp3(self, category: Category | str = None) -> List[str]:
+        return self._current_index().hashes(self._map_category_to_string(category))
+
+    def load_random_mp3(self, category: Category | str = None) -> "AudioSegment":
+        category_dir = self._map_category_to_string(category)
+        return self.load_mp3(self._current_index().random(category_dir), category)
+
+    def touch_mp3(self, hash: str, category: Category | str = None) -> None:
+        if self._map_category_to_string(category) == "custom":
+            self._custom_access().touch(hash)
+
+    def retire_mp3(self, hash: str, category: Category | str = None) -> None:
+        """
+        Remove an entry that left the catalogue.
+
+        Readers that already hold a slice of it are not affected, the space is
+        reclaimed by the next ``compact``.
+
+        Args:
+            hash (str): The hash of the entry.
+            category (Category | str): The category of the entry.
+        """
+        self.remove_mp3(hash, category)
+
+    def restore_mp3(self, hash: str, category: Category | str = None) -> bool:
+        # Removed records are not kept apart, they are dropped by the next compaction
+        return False
+
+    def evict_custom(self, policy: EvictionPolicy) -> List[str]:
+        """
+        Remove the custom phrases selected by an eviction policy.
+
+        The pack file is compacted once enough of it is dead, see
+        ``COMPACT_MIN_DEAD_BYTES`` and ``COMPACT_DEAD_RATIO``, so eviction bounds the
+        disk use like it does with the files backend.
+
+        Args:
+            policy (EvictionPolicy): The size and age limits.
+
+        Returns:
+            List[str]: Hashes of the removed phrases.
+        """
+        with self._lock:
+            access = self._custom_access()
+            # Pick up the plays recorded by other processes sharing the cache
+            access.save()
+            self._sync_custom_access()
+
+            evicted = policy.select(access.records)
+            for hash in evicted:
+                self.remove_mp3(hash)
+                access.forget(hash)
+
+            access.save()
+
+            stats = self.stats()
+            dead = stats["size"] - stats["live_bytes"]
+            if dead >= COMPACT_MIN_DEAD_BYTES and dead >= stats["size"] * COMPACT_DEAD_RATIO:
+                self.compact()
+            return evicted
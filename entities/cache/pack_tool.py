@@ -0,0 +1,85 @@
+"""
+Pack cache tool for the KorwinAI Discord Bot.
+
+Run ``python -m entities.cache.pack_tool migrate ./cache`` to import an existing
+``<category>/<hash>.mp3`` directory layout into the pack file, and
+``python -m entities.cache.pack_tool compact ./cache`` to drop superseded and removed
+records. Compacting is safe while the bot is running.
+"""
+
+import argparse
+import logging
+import pathlib
+
+from entities.catalogue import PackCache
+
+
+def migrate_directory(cache: PackCache, source: pathlib.Path, remove: bool = False) -> int:
+    """
+    Import a ``<category>/<hash>.mp3`` directory layout into a pack cache.
+
+    Entries already in the pack are skipped. Opus sidecar files are imported as well.
+
+    Args:
+        cache (PackCache): The pack cache to import into.
+        source (pathlib.Path): The cache directory to import.
+        remove (bool): Whether to delete the imported files.
+
+    Returns:
+        int: The number of imported files.
+    """
+    imported = 0
+
+    for category_dir in sorted(path for path in source.iterdir() if path.is_dir()):
+        category = category_dir.name
+        for path in sorted(category_dir.iterdir()):
+            hash, _, extension = path.name.rpartition(".")
+            if path.name.startswith(".") or extension not in ("mp3", "opus"):
+                continue
+
+            if extension == "mp3" and not cache.is_mp3_cached(hash, category):
+                cache.save_mp3(path.read_bytes(), hash, category)
+                imported += 1
+            elif extension == "opus" and not cache.is_opus_cached(hash, category):
+                cache.save_opus(path.read_bytes(), hash, category)
+                imported += 1
+
+            if remove:
+                path.unlink()
+
+        logging.info(f"Imported {category_dir}")
+
+    cache.flush()
+    return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the packed segment cache")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = commands.add_parser("migrate", help="import a <category>/<hash>.mp3 directory")
+    migrate.add_argument("cache_dir", help="directory holding the pack file")
+    migrate.add_argument("--source", help="directory to import, defaults to cache_dir")
+    migrate.add_argument("--remove", action="store_true", help="delete the imported files")
+
+    compact = commands.add_parser("compact", help="drop superseded and removed records")
+    compact.add_argument("cache_dir", help="directory holding the pack file")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    cache = PackCache(args.cache_dir)
+    try:
+        if args.command == "migrate":
+            source = pathlib.Path(args.source or args.cache_dir)
+            imported = migrate_directory(cache, source, remove=args.remove)
+            logging.info(f"Imported {imported} files from {source}")
+        elif args.command == "compact":
+            cache.compact()
+        logging.info(f"Pack statistics: {cache.stats()}")
+    finally:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Phrase cache module for the KorwinAI Discord Bot.
+
+This module keeps recently played custom phrases decoded in memory, so repeated
+phrases do not have to be read from the cache and decoded again.
+"""
+
+import collections
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+DEFAULT_PHRASE_MEMORY_BUDGET = 32 * 1024 * 1024
+
+
+@dataclass
+class PhraseCacheStats:
+    """
+    Hit, miss and eviction statistics of a phrase cache.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    size: int = 0
+    nbytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+
+class PhraseCache:
+    """
+    Least recently used cache of decoded, ready to play custom phrases.
+
+    Phrases are keyed by the hash of their text and kept as PCM in Discord's voice
+    format. The least recently used phrases are dropped once the cache holds more
+    than ``memory_budget`` bytes.
+    """
+
+    def __init__(self, memory_budget: int = DEFAULT_PHRASE_MEMORY_BUDGET):
+        """
+        Initialize the phrase cache.
+
+        Args:
+            memory_budget (int): Maximum number of bytes of PCM kept in memory.
+        """
+        self.memory_budget = memory_budget
+        self._phrases: collections.OrderedDict[str, bytes] = collections.OrderedDict()
+        self._stats = PhraseCacheStats()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._phrases)
+
+    def get(self, hash: str) -> Optional[bytes]:
+        """
+        Get a decoded phrase and mark it as recently used.
+
+        Args:
+            hash (str): Hash of the phrase's text.
+
+        Returns:
+            Optional[bytes]: The phrase as PCM, or None if it is not in the cache.
+        """
+        with self._lock:
+            pcm = self._phrases.get(hash)
+            if pcm is None:
+                self._stats.misses += 1
+                return None
+            self._phrases.move_to_end(hash)
+            self._stats.hits += 1
+            return pcm
+
+    def put(self, hash: str, pcm: bytes) -> None:
+        """
+        Add a decoded phrase, dropping the least recently used ones to stay in budget.
+
+        Phrases larger than the whole budget are not kept.
+
+        Args:
+            hash (str): Hash of the phrase's text.
+            pcm (bytes): The phrase as PCM.
+        """
+        if len(pcm) > self.memory_budget:
+            return
+
+        with self._lock:
+            previous = self._phrases.pop(hash, None)
+            if previous is not None:
+                self._stats.nbytes -= len(previous)
+
+            self._phrases[hash] = pcm
+            self._stats.nbytes += len(pcm)
+
+            while self._stats.nbytes > self.memory_budget:
+                _, evicted = self._phrases.popitem(last=False)
+                self._stats.nbytes -= len(evicted)
+                self._stats.evictions += 1
+
+            self._stats.size = len(self._phrases)
+
+    def stats(self) -> PhraseCacheStats:
+        """
+        Get hit, miss and eviction statistics.
+
+        Returns:
+            PhraseCacheStats: The statistics.
+        """
+        return self._stats
@@ -0,0 +1,486 @@
+"""
+Segment store module for the KorwinAI Discord Bot.
+
+This module keeps cached catalogue segments decoded in memory, so that composing a
+sentence does not need to decode any MP3 files. Segments are also available as
+pre-encoded Opus packets, which are persisted next to the MP3 files in the cache.
+The loudness of every segment is measured once and stored with its cache entry, so
+normalizing a segment only takes a precomputed gain.
+
+Processes that share a memory-mapped cache can read the Opus packets straight from
+the mapping instead, so the packets are kept in memory only once.
+
+Random segments are picked with a precomputed alias table per category, so a pick
+takes constant time however large the catalogue is.
+"""
+
+import logging
+import random
+import threading
+import zlib
+from typing import (
+    AbstractSet,
+    Container,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from entities.cache import ICache
+from entities.catalogue.category import Category
+from entities.catalogue.sampler import AliasSampler
+from utils.audio.opus import encode_opus_packets, pack_opus_packets, unpack_opus_packets
+from utils.audio.pcm import to_discord_pcm
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+LOCK_STRIPES = 64
+
+
+class SegmentStore:
+    """
+    Decode-once in-memory store of catalogue segments.
+
+    Every segment is decoded from the cache a single time, converted to Discord's
+    PCM format and kept as an immutable buffer. Lookups return zero-copy memoryviews
+    of those buffers.
+
+    The store is used from several executor threads. Concurrent lookups of the same
+    segment wait for a single decode or encode, serialized by a fixed set of striped
+    locks, so lookups of other segments are not held up.
+    """
+
+    def __init__(
+        self,
+        cache: ICache,
+        memory_budget: Optional[int] = DEFAULT_MEMORY_BUDGET,
+        gain: float = 0,
+        target_loudness: Optional[float] = None,
+        shared: bool = False,
+        rng: Optional[random.Random] = None,
+    ):
+        """
+        Initialize the segment store.
+
+        Args:
+            cache (ICache): Cache to decode the segments from.
+            memory_budget (Optional[int]): Maximum number of bytes of PCM buffers and
+                Opus packets kept resident. Segments over the budget are decoded or
+                read from the cache on every use. None means no limit.
+            gain (float): Gain in dB applied to every segment, on top of normalization.
+            target_loudness (Optional[float]): Loudness in LUFS every segment is
+                normalized to. None disables normalization.
+            shared (bool): Return cached Opus packets as views into the cache instead
+                of keeping copies, see ``get_opus``.
+            rng (Optional[random.Random]): Random number generator for picking
+                segments. A seeded one makes the picks reproducible.
+        """
+        self.cache = cache
+        self.memory_budget = memory_budget
+        self.gain = gain
+        self.target_loudness = target_loudness
+        self.shared = shared
+        self.rng = rng or random.Random()
+        self._segments: Dict[str, Dict[str, bytes]] = dict()
+        self._gains: Dict[str, Dict[str, float]] = dict()
+        self._opus: Dict[str, Dict[str, List[bytes]]] = dict()
+        self._hashes: Dict[str, List[str]] = dict()
+        self._rows: Optional[Mapping[str, AbstractSet[str]]] = None
+        self._weights: Mapping[str, Mapping[str, float]] = dict()
+        self._samplers: Dict[str, AliasSampler[str]] = dict()
+        self._nbytes = 0
+        self._budget_warned = False
+        # Guards the resident segments and their size, held only for bookkeeping
+        self._lock = threading.Lock()
+        self._pcm_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._opus_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Get the number of bytes used by resident segments.
+
+        Returns:
+            int: The size of all decoded PCM buffers and Opus packets.
+        """
+        return self._nbytes
+
+    def __len__(self) -> int:
+        return sum(len(segments) for segments in self._segments.values())
+
+    @staticmethod
+    def _stripe(locks: List[threading.Lock], key: str, hash: str) -> threading.Lock:
+        return locks[zlib.crc32(f"{key}/{hash}".encode("utf-8")) % len(locks)]
+
+    def _decode(self, hash: str, category: Category | str) -> bytes:
+        pcm = to_discord_pcm(self.cache.load_mp3(hash, category))
+
+        key = self.cache._map_category_to_string(category)
+        gains = self._gains.setdefault(key, dict())
+        if hash not in gains:
+            loudness = None
+            if self.target_loudness is not None:
+                loudness = self.cache.get_loudness(hash, category)
+                if loudness is None:
+                    from utils.audio.dsp import measure_loudness
+
+                    loudness = measure_loudness(pcm)
+                    self.cache.save_loudness(loudness, hash, category)
+            gains[hash] = self._gain(loudness)
+        return pcm
+
+    def _keep(self, segments: Dict, hash: str, value, nbytes: int) -> None:
+        # Must be called with self._lock held
+        if self.memory_budget is None or self._nbytes + nbytes <= self.memory_budget:
+            segments[hash] = value
+            self._nbytes += nbytes
+        elif not self._budget_warned:
+            logging.warning(
+                f"Segment store memory budget of {self.memory_budget} bytes exceeded, "
+                "remaining segments will be decoded or read from the cache on every use"
+            )
+            self._budget_warned = True
+
+    def _needs_encoding(self, hash: str, category: Category | str) -> bool:
+        measured = (
+            self.target_loudness is None or self.cache.get_loudness(hash, category) is not None
+        )
+        return not (measured and self.cache.is_opus_cached(hash, category))
+
+    def _encode(self, hash: str, category: Category | str) -> List[bytes]:
+        packets = encode_opus_packets(*self.get_opus_input(hash, category))
+        self.cache.save_opus(pack_opus_packets(packets), hash, category)
+        return packets
+
+    def _gain(self, loudness: Optional[float]) -> float:
+        from utils.audio.dsp import normalization_gain
+
+        if self.target_loudness is None:
+            return self.gain
+        return normalization_gain(loudness, self.target_loudness, self.gain)
+
+    def _category_hashes(self, category: Category | str) -> List[str]:
+        key = self.cache._map_category_to_string(category)
+        if key not in self._hashes:
+            hashes = self.cache.list_mp3(category)
+            if self._rows is not None:
+                rows = self._rows.get(key, ())
+                hashes = [cache_hash for cache_hash in hashes if cache_hash in rows]
+            self._hashes[key] = hashes
+        return self._hashes[key]
+
+    def _sampler(self, category: Category | str) -> AliasSampler[str]:
+        key = self.cache._map_category_to_string(category)
+        sampler = self._samplers.get(key)
+        if sampler is None:
+            hashes = self._category_hashes(category)
+            weights = self._weights.get(key)
+            sampler = self._samplers[key] = AliasSampler(
+                hashes,
+                [weights.get(cache_hash, 1.0) for cache_hash in hashes] if weights else None,
+            )
+        return sampler
+
+    def restrict(
+        self,
+        rows: Mapping[str, AbstractSet[str]],
+        weights: Optional[Mapping[str, Mapping[str, float]]] = None,
+    ) -> None:
+        """
+        Only pick random segments that are rows of the catalogue.
+
+        Cached segments that are not in ``rows`` are skipped, e.g. rows that were just
+        removed from the catalogue but are still cached.
+
+        Args:
+            rows (Mapping[str, AbstractSet[str]]): The segment hashes of every category.
+            weights (Optional[Mapping[str, Mapping[str, float]]]): Relative weights of
+                segments, per category. Segments without one have a weight of 1.
+        """
+        self._rows = rows
+        self._weights = weights or dict()
+        self._hashes.clear()
+        self._samplers.clear()
+
+    def discard(self, hash: str, category: Category | str) -> None:
+        """
+        Drop a segment from memory, e.g. when it was removed from the catalogue.
+
+        Buffers that are still playing stay valid, they are only no longer kept by
+        the store.
+
+        Args:
+            hash (str): Hash of the segment.
+            category (Category | str): Category of the segment.
+        """
+        key = self.cache._map_category_to_string(category)
+        with self._lock:
+            pcm = self._segments.get(key, dict()).pop(hash, None)
+            if pcm is not None:
+                self._nbytes -= len(pcm)
+            packets = self._opus.get(key, dict()).pop(hash, None)
+            if packets is not None:
+                self._nbytes -= sum(len(packet) for packet in packets)
+            self._gains.get(key, dict()).pop(hash, None)
+
+    def get(self, hash: str, category: Category | str) -> memoryview:
+        """
+        Get the PCM buffer of a segment, decoding it on first use.
+
+        The buffer is returned as decoded, see ``get_gain`` for the gain to apply.
+
+        Args:
+            hash (str): Hash of the segment.
+            category (Category | str): Category of the segment.
+
+        Returns:
+            memoryview: Read-only view of the segment in Discord's PCM format.
+        """
+        key = self.cache._map_category_to_string(category)
+        segments = self._segments.setdefault(key, dict())
+
+        pcm = segments.get(hash)
+        if pcm is not None:
+            return memoryview(pcm)
+
+        with self._stripe(self._pcm_locks, key, hash):
+            # Another thread may have decoded it meanwhile
+            pcm = segments.get(hash)
+            if pcm is not None:
+                return memoryview(pcm)
+
+            pcm = self._decode(hash, category)
+            with self._lock:
+                self._keep(segments, hash, pcm, len(pcm))
+
+        return memoryview(pcm)
+
+    def get_gain(self, hash: str, category: Category | str) -> float:
+        """
+        Get the gain that normalizes a segment.
+
+        The loudness stored with the cache entry is used; segments that were never
+        measured are decoded and measured once.
+
+        Args:
+            hash (str): Hash of the segment.
+            category (Category | str): Category of the segment.
+
+        Returns:
+            float: The gain in dB, including the store's extra gain.
+        """
+        key = self.cache._map_category_to_string(category)
+        gains = self._gains.setdefault(key, dict())
+        if hash not in gains:
+            loudness = self.cache.get_loudness(hash, category)
+            if self.target_loudness is not None and loudness is None:
+                # Decoding measures the loudness
+                self.get(hash, category)
+            else:
+                gains[hash] = self._gain(loudness)
+        return gains[hash]
+
+    def count(self, category: Category | str) -> int:
+        """
+        Get the number of segments random picks choose from in a category.
+
+        Args:
+            category (Category | str): The category.
+
+        Returns:
+            int: The number of cached segments of the category.
+        """
+        return len(self._category_hashes(category))
+
+    def random_hash(self, category: Category | str, exclude: Container[str] = ()) -> str:
+        """
+        Pick a random segment from a category, in constant time.
+
+        Args:
+            category (Category | str): The category to pick from.
+            exclude (Container[str]): Segments to avoid if possible, e.g. the ones
+                recently played, see ``AliasSampler.sample_excluding``.
+
+        Returns:
+            str: Hash of the segment.
+        """
+        sampler = self._sampler(category)
+        if not sampler.items:
+            raise IndexError(
+                f"No cached segments in {self.cache._map_category_to_string(category)}"
+            )
+        return sampler.sample_excluding(self.rng, exclude)
+
+    def get_random(self, category: Category | str) -> memoryview:
+        """
+        Get the PCM buffer of a random segment from a category.
+
+        Args:
+            category (Category | str): The category to pick from.
+
+        Returns:
+            memoryview: Read-only view of the segment in Discord's PCM format.
+        """
+        return self.get(self.random_hash(category), category)
+
+    def get_opus(
+        self, hash: str, category: Category | str, encode: bool = True
+    ) -> Optional[List[Union[bytes, memoryview]]]:
+        """
+        Get a segment as pre-encoded Opus packets.
+
+        The packets carry the segment's gain. They are read from the cache sidecar
+        file. If there is none yet, or it was encoded before the segment's loudness
+        was measured, the segment is encoded once and the sidecar file is written.
+
+        The packets count towards the memory budget, like the PCM buffers. Encoding
+        does not keep the segment's PCM buffer resident.
+
+        In a shared store, packets of a memory-mapped cache are returned as views into
+        the mapping on every call and never copied into the store, so any number of
+        processes mapping the same cache keep a single copy of them in memory.
+
+        Args:
+            hash (str): Hash of the segment.
+            category (Category | str): Category of the segment.
+            encode (bool): Whether to encode the segment if needed. Otherwise None is
+                returned, and the caller can encode it elsewhere with
+                ``get_opus_input`` and ``put_opus``.
+
+        Returns:
+            Optional[List[Union[bytes, memoryview]]]: 20 ms Opus packets of the
+                segment, or None if it needs encoding and ``encode`` is False.
+        """
+        key = self.cache._map_category_to_string(category)
+        segments = self._opus.setdefault(key, dict())
+
+        packets = segments.get(hash)
+        if packets is not None:
+            return packets
+
+        with self._stripe(self._opus_locks, key, hash):
+            # Another thread may have encoded it meanwhile
+            packets = segments.get(hash)
+            if packets is not None:
+                return packets
+
+            if self._needs_encoding(hash, category):
+                if not encode:
+                    return None
+                packets = self._encode(hash, category)
+            else:
+                data = self.cache.load_opus(hash, category)
+                if self.shared and isinstance(data, memoryview):
+                    return unpack_opus_packets(data, copy=False)
+                packets = unpack_opus_packets(data)
+
+            with self._lock:
+                self._keep(segments, hash, packets, sum(len(packet) for packet in packets))
+        return packets
+
+    def get_opus_input(self, hash: str, category: Category | str) -> Tuple[bytes, float]:
+        """
+        Get the PCM buffer and gain a segment's Opus packets are encoded from, to
+        encode them elsewhere, e.g. in a worker process.
+
+        A segment that is not resident is decoded, but not kept.
+
+        Args:
+            hash (str): Hash of the segment.
+            category (Category | str): Category of the segment.
+
+        Returns:
+            Tuple[bytes, float]: The PCM buffer and the gain in dB to apply.
+        """
+        key = self.cache._map_category_to_string(category)
+        pcm = self._segments.get(key, dict()).get(hash)
+        if pcm is None:
+            pcm = self._decode(hash, category)
+        return pcm, self.get_gain(hash, category)
+
+    def put_opus(
+        self, hash: str, category: Category | str, packets: List[bytes]
+    ) -> List[Union[bytes, memoryview]]:
+        """
+        Store Opus packets encoded from ``get_opus_input`` and write the sidecar file.
+
+        Args:
+            hash (str): Hash of the segment.
+            category (Category | str): Category of the segment.
+            packets (List[bytes]): The encoded packets.
+
+        Returns:
+            List[Union[bytes, memoryview]]: The packets to play, the ones stored by
+                another thread if it was faster.
+        """
+        key = self.cache._map_category_to_string(category)
+        segments = self._opus.setdefault(key, dict())
+
+        with self._stripe(self._opus_locks, key, hash):
+            stored = segments.get(hash)
+            if stored is not None:
+                return stored
+
+            self.cache.save_opus(pack_opus_packets(packets), hash, category)
+            with self._lock:
+                self._keep(segments, hash, packets, sum(len(packet) for packet in packets))
+        return packets
+
+    def encode_opus(self, hash: str, category: Category | str) -> bool:
+        """
+        Write the Opus sidecar file of a segment, if it has none or an outdated one.
+
+        Unlike ``get_opus``, nothing is kept in memory, so every segment of the
+        catalogue can be encoded without regard to the memory budget.
+
+        Args:
+            hash (str): Hash of the segment.
+            category (Category | str): Category of the segment.
+
+        Returns:
+            bool: True if the segment was encoded.
+        """
+        key = self.cache._map_category_to_string(category)
+        with self._stripe(self._opus_locks, key, hash):
+            if not self._needs_encoding(hash, category):
+                return False
+            self._encode(hash, category)
+            return True
+
+    def get_random_opus(self, category: Category | str) -> List[Union[bytes, memoryview]]:
+        """
+        Get a random segment from a category as pre-encoded Opus packets.
+
+        Args:
+            category (Category | str): The category to pick from.
+
+        Returns:
+            List[Union[bytes, memoryview]]: 20 ms Opus packets of the segment.
+        """
+        return self.get_opus(self.random_hash(category), category)
+
+    def preload(self, categories: Iterable[Category | str] = Category) -> None:
+        """
+        Decode every cached segment of the given categories up front.
+
+        Args:
+            categories (Iterable[Category | str]): Categories to preload.
+        """
+        for category in categories:
+            for cache_hash in self._category_hashes(category):
+                self.get(cache_hash, category)
+        logging.info(f"Segment store loaded {len(self)} segments ({self.nbytes} bytes)")
+
+    def invalidate(self, category: Category | str = None) -> None:
+        """
+        Forget the list of segments of a category so that it is read from the cache again.
+
+        Args:
+            category (Category | str): The category to invalidate.
+        """
+        key = self.cache._map_category_to_string(category)
+        self._hashes.pop(key, None)
+        self._samplers.pop(key, None)
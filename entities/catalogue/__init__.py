@@ -5,8 +5,20 @@ This subpackage contains classes related to the Korwin catalogue,
 including the catalogue itself, categories, and caching functionality.
 """
 
+from entities.cache.eviction import EvictionPolicy
 from entities.cache.local_cache import LocalCache
+from entities.cache.pack_cache import PackCache
+from entities.cache.phrase_cache import PhraseCache
+from entities.cache.segment_store import SegmentStore
 from entities.catalogue.category import Category
 from entities.catalogue.korwin_catalogue import KorwinCatalogue
 
-__all__ = ["Category", "LocalCache", "KorwinCatalogue"]
+__all__ = [
+    "Category",
+    "EvictionPolicy",
+    "LocalCache",
+    "PackCache",
+    "PhraseCache",
+    "SegmentStore",
+    "KorwinCatalogue",
+]
@@ -0,0 +1,283 @@
+"""
+Batch generator module for the KorwinAI Discord Bot.
+
+This module generates the cached MP3 files of a catalogue concurrently, within the
+ElevenLabs API rate limits, and keeps a journal so an interrupted run can resume.
+"""
+
+import asyncio
+import logging
+import pathlib
+import random
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple, Union
+
+from entities.catalogue.category import Category
+from utils.audio.tts import convert_options, create_async_client
+from utils.metrics import TTS_BYTES, TTS_LATENCY
+
+if TYPE_CHECKING:
+    from entities.catalogue.korwin_catalogue import KorwinCatalogue
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_REQUESTS_PER_SECOND = 2.0
+DEFAULT_MAX_RETRIES = 5
+REPORT_INTERVAL = 5.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter for asyncio tasks.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Initialize the bucket, full.
+
+        Args:
+            rate (float): Tokens added per second.
+            capacity (Optional[float]): Maximum number of tokens. Defaults to ``rate``.
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """
+        Wait until a token is available and take it.
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class GenerationJournal:
+    """
+    Append-only journal of generated segments, one ``<category>/<hash>`` per line.
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path]):
+        self.path = pathlib.Path(path)
+
+    def load(self) -> Set[str]:
+        """
+        Read the segments generated by previous runs.
+
+        Returns:
+            Set[str]: Keys of the generated segments.
+        """
+        if not self.path.exists():
+            return set()
+        return set(self.path.read_text(encoding="utf-8").split())
+
+    def record(self, key: str) -> None:
+        """
+        Record a generated segment.
+
+        Args:
+            key (str): Key of the segment.
+        """
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(key + "\n")
+
+    def clear(self) -> None:
+        """
+        Remove the journal, e.g. after a complete run.
+        """
+        self.path.unlink(missing_ok=True)
+
+
+@dataclass
+class GenerationProgress:
+    """
+    Progress of a batch generation run.
+    """
+
+    total: int
+    done: int = 0
+    failed: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def throughput(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        remaining = self.total - self.done - self.failed
+        return remaining / self.throughput if self.throughput else None
+
+    def __str__(self) -> str:
+        eta = f"{self.eta:.0f}s" if self.eta is not None else "unknown"
+        return (
+            f"Generated {self.done}/{self.total} ({self.failed} failed), "
+            f"{self.throughput:.2f} segments/s, ETA {eta}"
+        )
+
+
+class BatchGenerator:
+    """
+    Generates missing cached MP3 files of a catalogue with the ElevenLabs API.
+
+    Requests run concurrently up to ``concurrency`` at a time and are paced by a
+    token bucket. Rate limiting (429) and server errors (5xx) are retried with
+    exponential backoff. Finished segments are recorded in a journal, so a crashed
+    run resumes without checking the cache for them again.
+
+    Categories with the fewest cached segments are generated first, interleaved, so
+    a partially cached catalogue can compose sentences as early as possible.
+    """
+
+    def __init__(
+        self,
+        catalogue: "KorwinCatalogue",
+        concurrency: int = DEFAULT_CONCURRENCY,
+        requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        journal_path: Optional[Union[str, pathlib.Path]] = None,
+        hash_map: Optional[Dict[str, Dict[str, str]]] = None,
+    ):
+        """
+        Initialize the batch generator.
+
+        Args:
+            catalogue (KorwinCatalogue): The catalogue to generate segments for.
+            concurrency (int): Maximum number of requests in flight.
+            requests_per_second (float): Maximum request rate.
+            max_retries (int): Maximum number of retries per segment.
+            journal_path (Optional[Union[str, pathlib.Path]]): Path of the progress journal.
+                Defaults to ``generation.journal`` in the cache directory.
+            hash_map (Optional[Dict[str, Dict[str, str]]]): Segments to generate, per
+                category. Defaults to the whole catalogue.
+        """
+        self.catalogue = catalogue
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.hash_map = hash_map
+        self.progress: Optional[GenerationProgress] = None
+        self.bucket = TokenBucket(requests_per_second)
+        self.journal = GenerationJournal(
+            journal_path or catalogue.cache.cache_dir.joinpath("generation.journal")
+        )
+
+    def _pending(self) -> List[Tuple[Category, str, str]]:
+        done = self.journal.load()
+        pending = []
+        cached = dict()
+
+        hash_map = (
+            self.hash_map if self.hash_map is not None else self.catalogue.get_text_hash_map()
+        )
+        for category_name, category in hash_map.items():
+            self.catalogue.cache.generate_category_directory(category=Category(category_name))
+
+            cached[category_name] = 0
+            for cache_hash, text in category.items():
+                if f"{category_name}/{cache_hash}" in done or self.catalogue.cache.is_mp3_cached(
+                    category=Category(category_name), hash=cache_hash
+                ):
+                    cached[category_name] += 1
+                    continue
+                pending.append((Category(category_name), cache_hash, text))
+
+        # The n-th missing segment of a category is due once every category has n
+        # segments more than it has now, so the emptiest categories fill up first
+        position = {category_name: 0 for category_name in cached}
+
+        def due(job: Tuple[Category, str, str]) -> int:
+            category_name = job[0].value
+            position[category_name] += 1
+            return cached[category_name] + position[category_name]
+
+        return sorted(pending, key=due)
+
+    async def _convert(self, client, text: str) -> bytes:
+        import httpx
+        from elevenlabs.core.api_error import ApiError
+
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                with TTS_LATENCY.time(mode="batch"):
+                    audio = b"".join(
+                        [
+                            chunk
+                            async for chunk in client.text_to_speech.convert(
+                                **convert_options(text)
+                            )
+                        ]
+                    )
+                TTS_BYTES.inc(len(audio), mode="batch")
+                return audio
+            except (ApiError, httpx.TransportError) as e:
+                retryable = isinstance(e, httpx.TransportError) or (
+                    e.status_code in RETRY_STATUS_CODES
+                )
+                if not retryable or attempt == self.max_retries:
+                    raise
+
+                delay = min(60.0, 2**attempt) * random.uniform(0.5, 1.5)
+                logging.warning(f"TTS request failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _report(self, progress: GenerationProgress) -> None:
+        while True:
+            await asyncio.sleep(REPORT_INTERVAL)
+            logging.info(str(progress))
+
+    async def run(self) -> GenerationProgress:
+        """
+        Generate all missing segments.
+
+        Returns:
+            GenerationProgress: Final progress of the run.
+        """
+        pending = self._pending()
+        progress = self.progress = GenerationProgress(total=len(pending))
+        logging.info(f"Generating {len(pending)} missing segments")
+
+        client = create_async_client(self.catalogue.api_key)
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def generate(category: Category, cache_hash: str, text: str) -> None:
+            async with slots:
+                try:
+                    audio = await self._convert(client, text)
+                except Exception as e:
+                    progress.failed += 1
+                    logging.error(f"Failed to generate {category.value}/{cache_hash}.mp3: {e}")
+                    return
+
+                await asyncio.to_thread(
+                    self.catalogue.cache.save_mp3, audio=audio, hash=cache_hash, category=category
+                )
+                self.journal.record(f"{category.value}/{cache_hash}")
+                # Let sentences pick the new segment right away
+                self.catalogue.store.invalidate(category)
+                progress.done += 1
+                logging.info(f"Generated {category.value}/{cache_hash}.mp3")
+
+        reporter = asyncio.create_task(self._report(progress))
+        try:
+            await asyncio.gather(*(generate(*job) for job in pending))
+        finally:
+            reporter.cancel()
+            await asyncio.to_thread(self.catalogue.cache.flush)
+
+        logging.info(str(progress))
+        if not progress.failed:
+            self.journal.clear()
+        return progress
@@ -2,20 +2,72 @@
 KorwinCatalogue module for the KorwinAI Discord Bot.
 
 This module provides the main catalogue functionality for generating and managing
-text and audio segments.
+text and audio segments. The catalogue can be reloaded while the bot is running,
+only the rows that changed are generated or retired.
 """
 
-import hashlib
+import asyncio
 import logging
-from time import sleep
-from typing import Dict, Tuple
-
-import pandas as pd
-from elevenlabs import ElevenLabs
-from pydub import AudioSegment
+import pathlib
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple, Union
 
 from entities.cache import ICache
+from entities.cache.segment_store import SegmentStore
+from entities.catalogue.batch_generator import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_REQUESTS_PER_SECOND,
+    BatchGenerator,
+    GenerationProgress,
+)
 from entities.catalogue.category import Category
+from entities.catalogue.sampler import DEFAULT_NO_REPEAT_WINDOW, RecentSegments
+from entities.catalogue.snapshot import (
+    CatalogueDiff,
+    CatalogueSnapshot,
+    load_catalogue_snapshot,
+)
+from utils.audio.pcm import CHANNELS, SAMPLE_RATE, SAMPLE_WIDTH
+from utils.metrics import COMPOSITION_TIME
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from pydub import AudioSegment
+
+    from utils.audio.dsp import SentenceMixer
+
+# Loudness in LUFS every catalogue segment is normalized to
+SENTENCE_LOUDNESS = -16.0
+SNAPSHOT_FILE = "catalogue.json"
+
+
+@dataclass
+class CatalogueStatus:
+    """
+    How much of the catalogue is cached, and the progress of generating the rest.
+    """
+
+    cached: Dict[str, int]
+    total: Dict[str, int]
+    progress: Optional[GenerationProgress] = None
+
+    @property
+    def ready(self) -> bool:
+        """
+        Whether sentences can be composed, i.e. every category has a cached segment.
+        """
+        return all(self.cached.get(category.value, 0) for category in Category)
+
+    @property
+    def complete(self) -> bool:
+        return all(self.cached.get(column, 0) >= total for column, total in self.total.items())
+
+    def __str__(self) -> str:
+        cached, total = sum(self.cached.values()), sum(self.total.values())
+        status = f"{cached}/{total} segments cached"
+        if self.progress is not None and not self.complete:
+            status += f", {self.progress}"
+        return status
 
 
 class KorwinCatalogue:
@@ -26,32 +78,102 @@ class KorwinCatalogue:
     converting text to speech, and caching the results.
     """
 
-    def __init__(self, df_link: str, api_key: str, cache: ICache):
+    def __init__(
+        self,
+        df_link: str,
+        api_key: str,
+        cache: ICache,
+        store: Optional[SegmentStore] = None,
+        snapshot_path: Optional[Union[str, pathlib.Path]] = None,
+        mixer: Optional["SentenceMixer"] = None,
+        no_repeat_window: int = DEFAULT_NO_REPEAT_WINDOW,
+    ):
         """
         Initialize the KorwinCatalogue with a data source and API key.
 
         Args:
-            df_link (str): Link to the CSV file containing text segments.
+            df_link (str): Link or path to the CSV file containing text segments.
             api_key (str): ElevenLabs API key for text-to-speech conversion.
             cache (ICache): Cache instance for caching audio segments.
+            store (Optional[SegmentStore]): Store of decoded segments. Defaults to a
+                lazily filled store on top of ``cache``.
+            snapshot_path (Optional[Union[str, pathlib.Path]]): Local snapshot of the
+                catalogue, used when the sheet did not change or cannot be downloaded.
+                Defaults to ``catalogue.json`` in the cache directory.
+            mixer (Optional[SentenceMixer]): Mixer used to compose sentences as PCM.
+                Defaults to a mixer with the default crossfade.
+            no_repeat_window (int): Number of segments of every category recently
+                played in a guild that sentences for that guild avoid.
         """
-        self._df = pd.read_csv(df_link)
+        self.df_link = df_link
         self.api_key = api_key
         self.cache = cache
+        self.store = (
+            store if store is not None else SegmentStore(cache, target_loudness=SENTENCE_LOUDNESS)
+        )
+        self._mixer = mixer
+        self.snapshot_path = snapshot_path or cache.cache_dir.joinpath(SNAPSHOT_FILE)
+        self._snapshot = load_catalogue_snapshot(df_link, self.snapshot_path)
+        self._df: Optional["pd.DataFrame"] = None
+        self._orphans: Set[Tuple[str, str]] = set()
+        self._generator: Optional[BatchGenerator] = None
+        self.recent = RecentSegments(no_repeat_window)
+        self.store.restrict(self._rows(self._snapshot), self._snapshot.weights)
+
+    @staticmethod
+    def _rows(snapshot: CatalogueSnapshot):
+        return {column: rows.keys() for column, rows in snapshot.hash_map.items()}
+
+    @property
+    def snapshot(self) -> CatalogueSnapshot:
+        """
+        Get the compiled catalogue.
+
+        Returns:
+            CatalogueSnapshot: Per-category tuples of (hash, text).
+        """
+        return self._snapshot
 
     @property
-    def df(self) -> pd.DataFrame:
+    def df(self) -> "pd.DataFrame":
         """
         Get the DataFrame containing text segments.
 
+        The DataFrame is only built on first access, the hot paths use the snapshot.
+
         Returns:
             pd.DataFrame: The DataFrame with text segments.
         """
+        if self._df is None:
+            import pandas as pd
+
+            self._df = pd.DataFrame(
+                {
+                    column: pd.Series([text for _, text in rows], dtype=object)
+                    for column, rows in self._snapshot.categories.items()
+                }
+            )
         return self._df
 
     def is_cached(self) -> bool:
         return self.cache.is_hashmap_cached(self.get_text_hash_map())
 
+    def status(self) -> CatalogueStatus:
+        """
+        Get how many segments of every category are cached.
+
+        Only cached segments are used to compose sentences, so a partially cached
+        catalogue is usable once every category has at least one.
+
+        Returns:
+            CatalogueStatus: The status, with the progress of ``generate_missing``.
+        """
+        return CatalogueStatus(
+            cached={column: self.store.count(column) for column in self._snapshot.hash_map},
+            total={column: len(rows) for column, rows in self._snapshot.hash_map.items()},
+            progress=self._generator.progress if self._generator is not None else None,
+        )
+
     def get_random_text_from_category(self, category: Category) -> str:
         """
         Get a random text segment from the specified category.
@@ -62,7 +184,7 @@ class KorwinCatalogue:
         Returns:
             str: A random text segment from the category.
         """
-        return self.df[category.value].dropna().sample(n=1).values[0]
+        return self.store.rng.choice(self._snapshot.categories[category.value])[1]
 
     def generate_random_sentence(self) -> str:
         """
@@ -73,72 +195,308 @@ class KorwinCatalogue:
         """
         return " ".join([self.get_random_text_from_category(cat) for cat in Category])
 
-    def get_random_mp3_from_category(self, category: Category) -> AudioSegment:
+    @property
+    def mixer(self) -> "SentenceMixer":
+        """
+        Get the mixer used to compose sentences as PCM.
+
+        Returns:
+            SentenceMixer: The mixer.
+        """
+        if self._mixer is None:
+            from utils.audio.dsp import SentenceMixer
+
+            self._mixer = SentenceMixer()
+        return self._mixer
+
+    def get_random_mp3_from_category(self, category: Category) -> bytes:
         """
-        Get a random MP3 file from the specified category.
+        Get a random cached segment from the specified category.
+
+        The segment is decoded once by the segment store, only its precomputed
+        normalization gain is applied on every call.
 
         Args:
             category (Category): The category to get audio from.
 
         Returns:
-            AudioSegment: The audio segment.
+            bytes: The segment as PCM in Discord's voice format.
         """
-        return self.cache.load_random_mp3(category)
+        from utils.audio.dsp import apply_gain
 
-    def get_random_sentence_mp3(self) -> AudioSegment:
+        cache_hash = self.store.random_hash(category)
+        pcm = self.store.get(cache_hash, category)
+        return apply_gain(pcm, self.store.get_gain(cache_hash, category))
+
+    def get_random_sentence_mp3(self) -> "AudioSegment":
         """
         Generate a random sentence as an audio segment by combining audio from all categories.
 
         Returns:
             AudioSegment: The combined audio segment.
         """
-        audio = self.get_random_mp3_from_category(category=Category.INTRO)
-        audio.fade_in(400)
-        for category in Category:
-            if category == Category.INTRO:
-                continue
-            next_audio = self.get_random_mp3_from_category(category)
-            next_audio.fade_in(400).fade_out(400)
-            audio += next_audio
-        return audio + 6
+        from pydub import AudioSegment
+
+        return AudioSegment(
+            data=self.get_random_sentence_pcm(),
+            sample_width=SAMPLE_WIDTH,
+            frame_rate=SAMPLE_RATE,
+            channels=CHANNELS,
+        )
+
+    def pick_sentence(self, guild_id: Optional[int] = None) -> List[Tuple[Category, str]]:
+        """
+        Pick a random cached segment from every category, in constant time.
+
+        Segments recently played in the guild are avoided, see ``recent``. Picks are
+        weighted by the catalogue's weight columns.
+
+        Args:
+            guild_id (Optional[int]): The guild the sentence is for.
+
+        Returns:
+            List[Tuple[Category, str]]: (category, hash) of every segment, in sentence
+                order.
+        """
+        return [
+            (category, self.store.random_hash(category, self.recent.get(guild_id, category.value)))
+            for category in Category
+        ]
+
+    def get_random_sentence_pcm(self, guild_id: Optional[int] = None) -> bytes:
+        """
+        Generate a random sentence as raw PCM, see ``get_sentence_pcm``.
+
+        Args:
+            guild_id (Optional[int]): The guild the sentence is for.
+
+        Returns:
+            bytes: The sentence as PCM in Discord's voice format.
+        """
+        return self.get_sentence_pcm(self.pick_sentence(guild_id))
 
-    def generate_cached_mp3(self) -> None:
+    def get_sentence_pcm(self, segments: List[Tuple[Category, str]]) -> bytes:
+        """
+        Compose a sentence as raw PCM, mixed from the given segments.
+
+        Every segment is normalized with its precomputed gain, consecutive segments
+        are crossfaded and the sentence is limited, see ``SentenceMixer``. The PCM is
+        in Discord's voice format and can be played directly with ``PCMSegmentSource``,
+        so no MP3 encoder or FFmpeg subprocess is needed.
+
+        Args:
+            segments (List[Tuple[Category, str]]): (category, hash) of every segment,
+                see ``pick_sentence``.
+
+        Returns:
+            bytes: The sentence as PCM in Discord's voice format.
+        """
+        with COMPOSITION_TIME.time(format="pcm"):
+            return self.mixer.mix(
+                [self.store.get(cache_hash, category) for category, cache_hash in segments],
+                [self.store.get_gain(cache_hash, category) for category, cache_hash in segments],
+            )
+
+    def get_sentence_parts(
+        self, segments: List[Tuple[Category, str]]
+    ) -> Tuple[List[bytes], List[float]]:
+        """
+        Get the PCM buffers and gains a sentence is mixed from, see ``get_sentence_pcm``.
+
+        The buffers are copied out of the segment store, so that they can be sent to
+        a worker process and mixed there with ``utils.audio.dsp.mix_sentence``.
+
+        Args:
+            segments (List[Tuple[Category, str]]): (category, hash) of every segment,
+                see ``pick_sentence``.
+
+        Returns:
+            Tuple[List[bytes], List[float]]: The PCM buffers and the gain of every
+                segment.
+        """
+        return (
+            [bytes(self.store.get(cache_hash, category)) for category, cache_hash in segments],
+            [self.store.get_gain(cache_hash, category) for category, cache_hash in segments],
+        )
+
+    def get_random_sentence_opus(self, guild_id: Optional[int] = None) -> List[List[bytes]]:
+        """
+        Generate a random sentence as pre-encoded Opus packets, see ``get_sentence_opus``.
+
+        Args:
+            guild_id (Optional[int]): The guild the sentence is for.
+
+        Returns:
+            List[List[bytes]]: The Opus packet sequences in sentence order.
+        """
+        return self.get_sentence_opus(self.pick_sentence(guild_id))
+
+    def get_sentence_opus(
+        self, segments: List[Tuple[Category, str]], encode: bool = True
+    ) -> List[Optional[List[bytes]]]:
+        """
+        Compose a sentence as pre-encoded Opus packets, one sequence per segment.
+
+        The packets can be played with ``OpusPacketSource`` without any encoding work.
+        Segments are normalized when they are encoded, but not crossfaded.
+
+        Args:
+            segments (List[Tuple[Category, str]]): (category, hash) of every segment,
+                see ``pick_sentence``.
+            encode (bool): Whether to encode segments that have no Opus packets yet.
+                Otherwise their sequence is None, see ``SegmentStore.get_opus``.
+
+        Returns:
+            List[Optional[List[bytes]]]: The Opus packet sequences in sentence order.
+        """
+        with COMPOSITION_TIME.time(format="opus"):
+            return [
+                self.store.get_opus(cache_hash, category, encode)
+                for category, cache_hash in segments
+            ]
+
+    def generate_cached_mp3(
+        self,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+    ) -> None:
         """
         Generate and cache MP3 files for all text segments.
 
         This method uses the ElevenLabs API to convert text to speech and
-        caches the results for future use.
+        caches the results for future use. Requests run concurrently within the
+        given rate limit, see ``BatchGenerator``.
+
+        Args:
+            concurrency (int): Maximum number of requests in flight.
+            requests_per_second (float): Maximum request rate.
+        """
+        asyncio.run(
+            BatchGenerator(
+                self, concurrency=concurrency, requests_per_second=requests_per_second
+            ).run()
+        )
+
+    async def generate_missing(
+        self,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+    ) -> GenerationProgress:
+        """
+        Generate the missing segments in the running event loop, while the cached ones
+        are already in use.
+
+        New segments can be picked by sentences as soon as they are cached, see
+        ``status`` for the progress.
+
+        Args:
+            concurrency (int): Maximum number of requests in flight.
+            requests_per_second (float): Maximum request rate.
+
+        Returns:
+            GenerationProgress: Final progress of the run.
         """
-        client = ElevenLabs(api_key=self.api_key)
+        self._generator = BatchGenerator(
+            self, concurrency=concurrency, requests_per_second=requests_per_second
+        )
+        return await self._generator.run()
 
-        for category_name, category in self.get_text_hash_map().items():
-            self.cache.generate_category_directory(category=Category(category_name))
+    def generate_cached_opus(self, hash_map: Optional[Dict[str, Dict[str, str]]] = None) -> None:
+        """
+        Pre-encode all cached MP3 files as Opus packets.
 
-            for cache_hash, text in category.items():
-                if self.cache.is_mp3_cached(category=Category(category_name), hash=cache_hash):
-                    logging.info(f"Skipping {category_name}/{cache_hash}.mp3 - already exists")
+        The packets are stored in sidecar files next to the MP3 files, so this only
+        encodes segments that were added since the last run. The packets are not kept
+        in memory, they are loaded on first play.
+
+        Args:
+            hash_map (Optional[Dict[str, Dict[str, str]]]): Segments to encode, per
+                category. Defaults to the whole catalogue.
+        """
+        hash_map = hash_map if hash_map is not None else self.get_text_hash_map()
+        for category_name, category in hash_map.items():
+            for cache_hash in category:
+                if not self.cache.is_mp3_cached(category=Category(category_name), hash=cache_hash):
                     continue
+                if self.store.encode_opus(cache_hash, Category(category_name)):
+                    logging.info(f"Encoded {category_name}/{cache_hash}.opus")
+        self.cache.flush()
 
-                previous_text, _, next_text = self.generate_random_pre_n_next_text_without_category(
-                    Category(category_name)
-                )
+    async def reload(self, generate: bool = True) -> Optional[CatalogueDiff]:
+        """
+        Reload the catalogue from its source and switch to it.
+
+        The new catalogue is compared with the current one by hash, only the added
+        rows are generated, in the background. Sentences keep being composed from the
+        current catalogue until every added row is cached, then the catalogue is
+        swapped in a single step, so playing sessions are not interrupted.
+
+        Cached segments that are no longer in the catalogue are moved out of the cache
+        with ``ICache.retire_mp3``, one reload after they were first seen orphaned, so
+        other processes sharing the cache have switched by then.
 
-                self.cache.save_mp3(
-                    audio=b"".join(
-                        client.text_to_speech.convert(
-                            text=text,
-                            voice_id="pqHfZKP75CvOlQylNhV4",
-                            model_id="eleven_flash_v2_5",
-                            language_code="pl",
-                            output_format="mp3_44100_128",
-                        )
-                    ),
-                    category=Category(category_name),
-                    hash=cache_hash,
+        Args:
+            generate (bool): Whether to generate added rows and retire orphans. Shard
+                workers other than the primary one leave that to the primary and only
+                switch once the added rows are cached.
+
+        Returns:
+            Optional[CatalogueDiff]: The changes, or None if the catalogue could not be
+                switched yet.
+        """
+        snapshot = await asyncio.to_thread(
+            load_catalogue_snapshot, self.df_link, self.snapshot_path
+        )
+        diff = self._snapshot.diff(snapshot)
+
+        added = any(diff.added.values())
+        if added and generate:
+            # Rows that come back are restored instead of generated again
+            for category_name, rows in diff.added.items():
+                for cache_hash in rows:
+                    await asyncio.to_thread(
+                        self.cache.restore_mp3, cache_hash, Category(category_name)
+                    )
+            progress = await BatchGenerator(self, hash_map=diff.added).run()
+            if progress.failed:
+                logging.warning(
+                    f"Catalogue reload postponed, {progress.failed} added rows failed to generate"
                 )
+                return None
+            await asyncio.to_thread(self.generate_cached_opus, diff.added)
+        elif added and not await asyncio.to_thread(self.cache.is_hashmap_cached, diff.added):
+            logging.info("Catalogue reload postponed until the added rows are cached")
+            return None
+
+        # Swap the catalogue, sentences being composed keep the segments they picked
+        self._snapshot = snapshot
+        self._df = None
+        self.store.restrict(self._rows(snapshot), snapshot.weights)
+        for category_name, hashes in diff.removed.items():
+            for cache_hash in hashes:
+                self.store.discard(cache_hash, category_name)
+
+        if generate:
+            await asyncio.to_thread(self._retire_orphans)
+
+        if diff.changed:
+            logging.info(f"Catalogue reloaded, {diff}")
+        return diff
+
+    def _retire_orphans(self) -> None:
+        orphans = set()
+        for category in Category:
+            rows = self._snapshot.hash_map.get(category.value, dict())
+            for cache_hash in self.cache.list_mp3(category):
+                if cache_hash not in rows:
+                    orphans.add((category.value, cache_hash))
+
+        retire = orphans & self._orphans
+        for category_name, cache_hash in retire:
+            logging.info(f"Retiring orphaned segment {category_name}/{cache_hash}.mp3")
+            self.cache.retire_mp3(cache_hash, Category(category_name))
 
-                logging.info(f"Generated {category_name}/{cache_hash}.mp3")
-                sleep(1)
+        self._orphans = orphans - retire
 
     def generate_random_pre_n_next_text_without_category(
         self, category: Category
@@ -170,13 +528,4 @@ class KorwinCatalogue:
             Dict[str, Dict[str, str]]: A dictionary mapping category names to dictionaries
                 mapping hash values to text segments.
         """
-        hash_map_list: Dict[str, Dict[str, str]] = dict()
-
-        for column in self.df.columns:
-            hash_map_list[column] = dict()
-            for cell in self.df[column]:
-                if type(cell) is not str:
-                    continue
-                hash_map_list[column][hashlib.sha256(cell.encode("utf-8")).hexdigest()] = cell
-
-        return hash_map_list
+        return {column: dict(rows) for column, rows in self._snapshot.hash_map.items()}
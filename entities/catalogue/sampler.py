@@ -0,0 +1,208 @@
+"""
+Sampler module for the KorwinAI Discord Bot.
+
+This module picks random catalogue segments in constant time, optionally weighted,
+and remembers the segments recently played in every guild, so that they are not
+picked again right away.
+"""
+
+import collections
+import random
+import threading
+from typing import Container, Deque, Dict, Generic, Iterable, Optional, Sequence, Tuple, TypeVar
+
+DEFAULT_NO_REPEAT_WINDOW = 5
+MAX_REDRAWS = 8
+
+T = TypeVar("T")
+
+
+class AliasSampler(Generic[T]):
+    """
+    Weighted random choice with Vose's alias method.
+
+    The alias tables are built once in O(n), every pick then takes two random numbers
+    regardless of the number of items. Without weights every item is equally likely.
+    """
+
+    def __init__(self, items: Sequence[T], weights: Optional[Sequence[float]] = None):
+        """
+        Build the alias tables.
+
+        Args:
+            items (Sequence[T]): The items to pick from.
+            weights (Optional[Sequence[float]]): Relative weight of every item. Items
+                with a weight of 0 are never picked, unless all weights are 0.
+        """
+        self.items = list(items)
+        self._probability: Optional[list] = None
+        self._alias: Optional[list] = None
+        self._weights: Optional[list] = None
+
+        total = sum(weights) if weights is not None else 0
+        if weights is None or total <= 0 or len(set(weights)) == 1:
+            return
+        self._weights = list(weights)
+
+        n = len(self.items)
+        scaled = [weight * n / total for weight in weights]
+        self._probability = [1.0] * n
+        self._alias = list(range(n))
+        small = [index for index, weight in enumerate(scaled) if weight < 1]
+        large = [index for index, weight in enumerate(scaled) if weight >= 1]
+
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self._probability[less] = scaled[less]
+            self._alias[less] = more
+            scaled[more] += scaled[less] - 1
+            (small if scaled[more] < 1 else large).append(more)
+        # Whatever is left has a probability of 1, up to rounding errors
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def sample(self, rng: random.Random) -> T:
+        """
+        Pick an item.
+
+        Args:
+            rng (random.Random): Random number generator to draw from.
+
+        Returns:
+            T: The item.
+        """
+        index = int(rng.random() * len(self.items))
+        if self._probability is not None and rng.random() >= self._probability[index]:
+            index = self._alias[index]
+        return self.items[index]
+
+    def sample_excluding(self, rng: random.Random, exclude: Container[T]) -> T:
+        """
+        Pick an item that is not in ``exclude``.
+
+        Excluded picks are drawn again, at most ``MAX_REDRAWS`` times, which is O(1)
+        unless most items are excluded. Then the item is picked among the items that are
+        not excluded, in O(n), with the same relative weights. An excluded item is only
+        returned if every item that can be picked is excluded.
+
+        Args:
+            rng (random.Random): Random number generator to draw from.
+            exclude (Container[T]): Items to avoid.
+
+        Returns:
+            T: The item.
+        """
+        item = self.sample(rng)
+        for _ in range(MAX_REDRAWS):
+            if item not in exclude:
+                return item
+            item = self.sample(rng)
+
+        if self._weights is None:
+            candidates = [candidate for candidate in self.items if candidate not in exclude]
+            return rng.choice(candidates) if candidates else item
+
+        candidates, weights = [], []
+        for candidate, weight in zip(self.items, self._weights):
+            if weight > 0 and candidate not in exclude:
+                candidates.append(candidate)
+                weights.append(weight)
+        return rng.choices(candidates, weights)[0] if candidates else item
+
+
+class RecentWindow:
+    """
+    Ring buffer of the last ``size`` items, with O(1) membership tests.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._items: Deque[str] = collections.deque()
+        self._counts: Dict[str, int] = collections.Counter()
+
+    def __contains__(self, item: object) -> bool:
+        return item in self._counts
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, item: str) -> None:
+        """
+        Add an item, dropping the oldest one if the window is full.
+
+        Args:
+            item (str): The item.
+        """
+        if self.size <= 0:
+            return
+        self._items.append(item)
+        self._counts[item] += 1
+        if len(self._items) > self.size:
+            oldest = self._items.popleft()
+            self._counts[oldest] -= 1
+            if not self._counts[oldest]:
+                del self._counts[oldest]
+
+
+class RecentSegments:
+    """
+    The segments recently played in every guild, per category.
+    """
+
+    def __init__(self, window: int = DEFAULT_NO_REPEAT_WINDOW):
+        """
+        Initialize the windows.
+
+        Args:
+            window (int): Number of recent segments of every category that are not
+                picked again in a guild. 0 disables the windows.
+        """
+        self.window = window
+        self._windows: Dict[Tuple[int, str], RecentWindow] = dict()
+        self._lock = threading.Lock()
+
+    def get(self, guild_id: Optional[int], category: str) -> Container[str]:
+        """
+        Get the segments of a category recently played in a guild.
+
+        Args:
+            guild_id (Optional[int]): The guild, None for no guild.
+            category (str): The category.
+
+        Returns:
+            Container[str]: Hashes of the recent segments.
+        """
+        if guild_id is None:
+            return ()
+        return self._windows.get((guild_id, category), ())
+
+    def conflicts(self, guild_id: Optional[int], segments: Iterable[Tuple[str, str]]) -> bool:
+        """
+        Check whether any of the segments was recently played in a guild.
+
+        Args:
+            guild_id (Optional[int]): The guild, None for no guild.
+            segments (Iterable[Tuple[str, str]]): (category, hash) of every segment.
+
+        Returns:
+            bool: True if a segment is in its category's window.
+        """
+        return any(cache_hash in self.get(guild_id, category) for category, cache_hash in segments)
+
+    def add(self, guild_id: Optional[int], segments: Iterable[Tuple[str, str]]) -> None:
+        """
+        Remember segments played in a guild.
+
+        Args:
+            guild_id (Optional[int]): The guild, None for no guild.
+            segments (Iterable[Tuple[str, str]]): (category, hash) of every segment.
+        """
+        if guild_id is None or self.window <= 0:
+            return
+        with self._lock:
+            for category, cache_hash in segments:
+                window = self._windows.get((guild_id, category))
+                if window is None:
+                    window = self._windows[(guild_id, category)] = RecentWindow(self.window)
+                window.add(cache_hash)
@@ -0,0 +1,254 @@
+"""
+Catalogue snapshot module for the KorwinAI Discord Bot.
+
+This module compiles the catalogue CSV into immutable per-category tuples of
+(hash, text), persists them as a local snapshot and refreshes the snapshot with
+conditional HTTP requests, so startup does not depend on the network.
+
+A category column can be followed by a ``<category> weight`` column holding the
+relative weight of the text in the same row, see ``AliasSampler``.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import pathlib
+import urllib.error
+import urllib.request
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Optional, Tuple, Union
+
+Row = Tuple[str, str]
+
+REQUEST_TIMEOUT = 10
+WEIGHT_SUFFIX = " weight"
+
+
+def _parse_weight(cell: str) -> Optional[float]:
+    try:
+        weight = float(cell.replace(",", "."))
+    except ValueError:
+        return None
+    return weight if weight >= 0 else None
+
+
+@dataclass(frozen=True)
+class CatalogueDiff:
+    """
+    Rows added to and removed from the catalogue, per category.
+    """
+
+    added: Dict[str, Dict[str, str]]
+    removed: Dict[str, FrozenSet[str]]
+
+    @property
+    def changed(self) -> bool:
+        return any(self.added.values()) or any(self.removed.values())
+
+    def __str__(self) -> str:
+        added = sum(len(rows) for rows in self.added.values())
+        removed = sum(len(hashes) for hashes in self.removed.values())
+        return f"{added} rows added, {removed} rows removed"
+
+
+@dataclass(frozen=True)
+class CatalogueSnapshot:
+    """
+    Compiled catalogue: for every column, the non-empty cells as (hash, text) pairs,
+    and the weights of the rows that have one.
+    """
+
+    categories: Dict[str, Tuple[Row, ...]]
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    weights: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    hash_map: Dict[str, Dict[str, str]] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(
+            self, "hash_map", {column: dict(rows) for column, rows in self.categories.items()}
+        )
+
+    @classmethod
+    def from_csv(
+        cls, data: str, etag: Optional[str] = None, last_modified: Optional[str] = None
+    ) -> "CatalogueSnapshot":
+        """
+        Compile a catalogue CSV, hashing every cell once.
+
+        Args:
+            data (str): The CSV data, with one column per category and optional
+                weight columns.
+            etag (Optional[str]): ETag of the HTTP response the data came from.
+            last_modified (Optional[str]): Last-Modified of the HTTP response.
+
+        Returns:
+            CatalogueSnapshot: The compiled catalogue.
+        """
+        reader = csv.reader(io.StringIO(data))
+        columns = next(reader, [])
+        weight_columns = {
+            index: column.removesuffix(WEIGHT_SUFFIX)
+            for index, column in enumerate(columns)
+            if column.endswith(WEIGHT_SUFFIX) and column.removesuffix(WEIGHT_SUFFIX) in columns
+        }
+        cells = {column: [] for index, column in enumerate(columns) if index not in weight_columns}
+        weights = {column: dict() for column in weight_columns.values()}
+
+        for row in reader:
+            hashes = dict()
+            for index, (column, cell) in enumerate(zip(columns, row)):
+                if cell and index not in weight_columns:
+                    hashes[column] = hashlib.sha256(cell.encode("utf-8")).hexdigest()
+                    cells[column].append((hashes[column], cell))
+
+            for index, column in weight_columns.items():
+                if index >= len(row) or not row[index] or column not in hashes:
+                    continue
+                weight = _parse_weight(row[index])
+                if weight is None:
+                    logging.warning(f"Ignoring invalid weight {row[index]!r} in {columns[index]}")
+                    continue
+                weights[column][hashes[column]] = weight
+
+        return cls(
+            categories={column: tuple(rows) for column, rows in cells.items()},
+            etag=etag,
+            last_modified=last_modified,
+            weights={column: rows for column, rows in weights.items() if rows},
+        )
+
+    @classmethod
+    def load(cls, path: Union[str, pathlib.Path]) -> Optional["CatalogueSnapshot"]:
+        """
+        Load a snapshot written by ``save``.
+
+        Args:
+            path (Union[str, pathlib.Path]): Path of the snapshot file.
+
+        Returns:
+            Optional[CatalogueSnapshot]: The snapshot, or None if there is no usable file.
+        """
+        try:
+            data = json.loads(pathlib.Path(path).read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+
+        return cls(
+            categories={
+                column: tuple((cache_hash, text) for cache_hash, text in rows)
+                for column, rows in data["categories"].items()
+            },
+            etag=data.get("etag"),
+            last_modified=data.get("last_modified"),
+            weights=data.get("weights", dict()),
+        )
+
+    def diff(self, other: "CatalogueSnapshot") -> CatalogueDiff:
+        """
+        Compare this snapshot with a newer one, using the hashes of both.
+
+        Args:
+            other (CatalogueSnapshot): The newer snapshot.
+
+        Returns:
+            CatalogueDiff: Rows of ``other`` that are not in this snapshot, and rows of
+                this snapshot that are not in ``other``.
+        """
+        columns = set(self.hash_map) | set(other.hash_map)
+        old = {column: self.hash_map.get(column, dict()) for column in columns}
+        new = {column: other.hash_map.get(column, dict()) for column in columns}
+        return CatalogueDiff(
+            added={
+                column: {
+                    cache_hash: text
+                    for cache_hash, text in new[column].items()
+                    if cache_hash not in old[column]
+                }
+                for column in columns
+            },
+            removed={
+                column: frozenset(old[column].keys() - new[column].keys()) for column in columns
+            },
+        )
+
+    def save(self, path: Union[str, pathlib.Path]) -> None:
+        """
+        Write the snapshot atomically.
+
+        Args:
+            path (Union[str, pathlib.Path]): Path of the snapshot file.
+        """
+        path = pathlib.Path(path)
+        temp_path = path.with_name(f".{path.name}.tmp")
+        temp_path.write_text(
+            json.dumps(
+                {
+                    "categories": self.categories,
+                    "etag": self.etag,
+                    "last_modified": self.last_modified,
+                    "weights": self.weights,
+                },
+                ensure_ascii=False,
+            ),
+            encoding="utf-8",
+        )
+        os.replace(temp_path, path)
+
+
+def load_catalogue_snapshot(
+    source: str, snapshot_path: Optional[Union[str, pathlib.Path]] = None
+) -> CatalogueSnapshot:
+    """
+    Load the catalogue from a local CSV file or refresh it from a URL.
+
+    For URLs the request is conditional on the ETag and Last-Modified of the saved
+    snapshot. When the sheet did not change, or the request fails, the saved
+    snapshot is used.
+
+    Args:
+        source (str): Path or URL of the catalogue CSV.
+        snapshot_path (Optional[Union[str, pathlib.Path]]): Where to keep the snapshot.
+
+    Returns:
+        CatalogueSnapshot: The catalogue.
+    """
+    if not source.startswith(("http://", "https://")):
+        return CatalogueSnapshot.from_csv(pathlib.Path(source).read_text(encoding="utf-8"))
+
+    previous = CatalogueSnapshot.load(snapshot_path) if snapshot_path else None
+
+    request = urllib.request.Request(source)
+    if previous is not None and previous.etag:
+        request.add_header("If-None-Match", previous.etag)
+    if previous is not None and previous.last_modified:
+        request.add_header("If-Modified-Since", previous.last_modified)
+
+    try:
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+            snapshot = CatalogueSnapshot.from_csv(
+                response.read().decode("utf-8"),
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and previous is not None:
+            logging.info("Catalogue not modified, using local snapshot")
+            return previous
+        if previous is None:
+            raise
+        logging.warning(f"Catalogue refresh failed ({e}), using local snapshot")
+        return previous
+    except (urllib.error.URLError, TimeoutError) as e:
+        if previous is None:
+            raise
+        logging.warning(f"Catalogue refresh failed ({e}), using local snapshot")
+        return previous
+
+    logging.info("Catalogue downloaded")
+    if snapshot_path:
+        snapshot.save(snapshot_path)
+    return snapshot
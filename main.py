@@ -2,25 +2,186 @@
 Main entry point for the KorwinAI Discord Bot.
 
 This module initializes the application, sets up logging, loads the catalogue,
-and starts the Discord bot.
+and starts the Discord bot. The catalogue is loaded in a background thread while
+the bot connects to Discord, missing segments are generated by the bot once it is
+online.
 """
 
+import argparse
+import functools
 import logging
 import os
+import random
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
 
 from dotenv import load_dotenv
 
-from bot import run_discord_bot
-from entities import KorwinCatalogue, LocalCache
 from utils import setup_logging
+from utils.profiling import StartupProfiler
+
+
+def load_catalogue(
+    google_sheets_link: str,
+    eleven_labs_api_key: str,
+    profiler: Optional[StartupProfiler] = None,
+    backend: Optional[str] = None,
+    shared: bool = False,
+) -> "KorwinCatalogue":
+    """
+    Load the catalogue and prepare its cached segments.
+
+    Segments that are not cached yet do not block startup, the bot generates them in
+    the background and composes sentences from the cached ones meanwhile.
+
+    Args:
+        google_sheets_link (str): Link or path to the catalogue CSV.
+        eleven_labs_api_key (str): ElevenLabs API key.
+        profiler (Optional[StartupProfiler]): Profiler to record the startup phases in.
+        backend (Optional[str]): Cache backend, ``files`` or ``pack``. Defaults to
+            ``CACHE_BACKEND``.
+        shared (bool): Whether the cache is shared with other shard workers. It must
+            already be prepared by the launcher, this process only maps it.
+
+    Returns:
+        KorwinCatalogue: The catalogue.
+    """
+    profiler = profiler or StartupProfiler()
+
+    with profiler.phase("import entities"):
+        from entities import KorwinCatalogue, LocalCache, PackCache, SegmentStore
+        from entities.catalogue.korwin_catalogue import SENTENCE_LOUDNESS
+        from entities.catalogue.sampler import DEFAULT_NO_REPEAT_WINDOW
+
+    # Initialize cache
+    logging.info("Initializing cache...")
+    with profiler.phase("initialize cache"):
+        if (backend or os.getenv("CACHE_BACKEND", "files")).lower() == "pack":
+            cache = PackCache("./cache")
+        else:
+            cache = LocalCache("./cache")
+
+    # Initialize the decoded segment store, a seed makes the random picks reproducible
+    memory_budget_mb = os.getenv("SEGMENT_MEMORY_BUDGET_MB")
+    seed = os.getenv("RANDOM_SEED")
+    store = SegmentStore(
+        cache,
+        memory_budget=int(memory_budget_mb) * 1024 * 1024 if memory_budget_mb else None,
+        target_loudness=SENTENCE_LOUDNESS,
+        shared=shared,
+        rng=random.Random(int(seed)) if seed else None,
+    )
+
+    # Initialize the catalogue
+    logging.info("Initializing Korwin catalogue...")
+    with profiler.phase("load catalogue"):
+        catalogue = KorwinCatalogue(
+            google_sheets_link,
+            eleven_labs_api_key,
+            cache,
+            store,
+            no_repeat_window=int(os.getenv("NO_REPEAT_WINDOW", DEFAULT_NO_REPEAT_WINDOW)),
+        )
+
+    # Check if all texts are cached
+    logging.info("Checking if catalogue is cached...")
+    with profiler.phase("check cache"):
+        is_cached = catalogue.is_cached()
+
+    if is_cached:
+        logging.info("All texts are cached! Have fun :3")
+    else:
+        logging.warning(
+            f"Catalogue not cached ({catalogue.status()}), "
+            "the missing texts will be generated in the background"
+        )
+
+    # Shard workers read the segments prepared by the launcher from the shared cache
+    if shared:
+        return catalogue
+
+    # Decode all segments up front instead of on first use
+    if os.getenv("PRELOAD_SEGMENTS", "").lower() in ("1", "true", "yes"):
+        logging.info("Preloading segment store...")
+        with profiler.phase("preload segments"):
+            store.preload()
+
+    # Encode segments added since the last run to Opus, so playback skips encoding
+    logging.info("Encoding Opus packet cache...")
+    with profiler.phase("encode opus cache"):
+        catalogue.generate_cached_opus()
+
+    return catalogue
+
+
+def run_shards(
+    google_sheets_link: str,
+    eleven_labs_api_key: str,
+    profiler: StartupProfiler,
+    args: argparse.Namespace,
+):
+    """
+    Prepare the shared segment cache once, then run the shards in worker processes.
+
+    The workers map the same pack cache, so the segments are kept in memory once
+    however many workers there are. Missing segments are generated by the worker
+    running shard 0.
+
+    Args:
+        google_sheets_link (str): Link or path to the catalogue CSV.
+        eleven_labs_api_key (str): ElevenLabs API key.
+        profiler (StartupProfiler): Profiler to record the startup phases in.
+        args (argparse.Namespace): Command line arguments.
+    """
+    catalogue = load_catalogue(google_sheets_link, eleven_labs_api_key, profiler, backend="pack")
+    catalogue.cache.close()
+    profiler.report("shared cache ready")
+
+    from bot.sharding import run_sharded_bot
+
+    run_sharded_bot(
+        functools.partial(
+            load_catalogue,
+            google_sheets_link,
+            eleven_labs_api_key,
+            backend="pack",
+            shared=True,
+        ),
+        args.shards,
+        args.shard_workers or args.shards,
+    )
 
 
 def main():
     """
     Main function that initializes and runs the application.
     """
+    parser = argparse.ArgumentParser(description="KorwinAI Discord Bot")
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="log per-phase and per-import timings once the bot is ready",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=int(os.getenv("SHARD_COUNT", 0)),
+        help="run this many shards in worker processes sharing one segment cache",
+    )
+    parser.add_argument(
+        "--shard-workers",
+        type=int,
+        default=int(os.getenv("SHARD_WORKERS", 0)),
+        help="number of shard worker processes, defaults to one per shard",
+    )
+    args = parser.parse_args()
+
+    profiler = StartupProfiler(enabled=args.profile_startup)
+    profiler.install_import_hook()
+
     # setup logging
-    setup_logging()
+    with profiler.phase("setup logging"):
+        setup_logging()
     logging.info("Logging setup complete")
 
     # Load environment variables
@@ -34,35 +195,23 @@ def main():
         )
         return
 
-    # Initialize cache
-    logging.info("Initializing cache...")
-    cache = LocalCache("./cache")
-
-    # Initialize the catalogue
-    logging.info("Initializing Korwin catalogue...")
-    catalogue = KorwinCatalogue(google_sheets_link, eleven_labs_api_key, cache)
+    if args.shards:
+        run_shards(google_sheets_link, eleven_labs_api_key, profiler, args)
+        return
 
-    # Check if all texts are cached
-    logging.info("Checking if catalogue is cached...")
-    if catalogue.is_cached():
-        logging.info("Catalogue cached")
-    else:
-        logging.warning("Catalogue not cached")
-        logging.warning("There are some missing texts in the catalogue")
-        logging.warning("Would you like to generate them now?")
-        if input("(y/N): ") == "y":
-            logging.info("Generating all texts...")
-            catalogue.generate_cached_mp3()
-            logging.info("Generated all texts")
-        else:
-            logging.error("Cannot continue without cached texts")
-            return
+    # Load the catalogue in the background while the bot connects to Discord
+    loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalogue-loader")
+    catalogue: Future = loader.submit(
+        load_catalogue, google_sheets_link, eleven_labs_api_key, profiler
+    )
+    loader.shutdown(wait=False)
 
-        logging.info("All texts are cached! Have fun :3")
+    with profiler.phase("import bot"):
+        from bot import run_discord_bot
 
     # Run the Discord bot
     logging.info("Starting Discord bot...")
-    run_discord_bot(catalogue)
+    run_discord_bot(catalogue, profiler)
 
 
 if __name__ == "__main__":
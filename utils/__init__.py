@@ -2,9 +2,26 @@
 Utilities package for the KorwinAI Discord Bot.
 
 This package contains various utility functions and modules used throughout the application.
+Exports are imported lazily, on first access, so importing a single utility module does
+not pull in the heavy audio and text-to-speech dependencies.
 """
 
-from utils.audio import generate_speech_from_text
-from utils.logging import setup_logging
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from utils.audio import generate_speech_from_text
+    from utils.logging import setup_logging
+
+_EXPORTS = {
+    "generate_speech_from_text": "utils.audio",
+    "setup_logging": "utils.logging",
+}
 
 __all__ = ["generate_speech_from_text", "setup_logging"]
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name]), name)
@@ -2,8 +2,49 @@
 Audio utilities for the KorwinAI Discord Bot.
 
 This subpackage contains functions for generating and processing audio.
+Exports are imported lazily, on first access, see ``utils``.
 """
 
-from utils.audio.generate_voice import generate_speech_from_text
+import importlib
+from typing import TYPE_CHECKING
 
-__all__ = ["generate_speech_from_text"]
+if TYPE_CHECKING:
+    from utils.audio.dsp import SentenceMixer, apply_gain, measure_loudness, mix_sentence
+    from utils.audio.generate_voice import (
+        SPEECH_GAIN,
+        fetch_speech_mp3,
+        generate_speech_from_text,
+        load_cached_speech_mp3,
+        speech_hash,
+    )
+    from utils.audio.opus import encode_opus_packets
+    from utils.audio.opus_source import OpusPacketSource
+    from utils.audio.pcm import decode_mp3_to_pcm, to_discord_pcm
+    from utils.audio.pcm_source import PCMSegmentSource
+    from utils.audio.streaming import stream_speech_from_text
+
+_EXPORTS = {
+    "SPEECH_GAIN": "utils.audio.generate_voice",
+    "fetch_speech_mp3": "utils.audio.generate_voice",
+    "generate_speech_from_text": "utils.audio.generate_voice",
+    "load_cached_speech_mp3": "utils.audio.generate_voice",
+    "speech_hash": "utils.audio.generate_voice",
+    "stream_speech_from_text": "utils.audio.streaming",
+    "SentenceMixer": "utils.audio.dsp",
+    "apply_gain": "utils.audio.dsp",
+    "measure_loudness": "utils.audio.dsp",
+    "mix_sentence": "utils.audio.dsp",
+    "encode_opus_packets": "utils.audio.opus",
+    "decode_mp3_to_pcm": "utils.audio.pcm",
+    "to_discord_pcm": "utils.audio.pcm",
+    "OpusPacketSource": "utils.audio.opus_source",
+    "PCMSegmentSource": "utils.audio.pcm_source",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name]), name)
@@ -0,0 +1,250 @@
+"""
+DSP helpers for the KorwinAI Discord Bot.
+
+This module measures the loudness of PCM in Discord's voice format (ITU-R BS.1770
+integrated loudness, in LUFS) and mixes sentences: per-segment gain, equal-power
+crossfades between segments and a peak limiter, vectorized with NumPy over reusable
+buffers.
+"""
+
+import threading
+from typing import Optional, Sequence, Union
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.audio.pcm import CHANNELS, SAMPLE_RATE
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+TARGET_LOUDNESS = -16.0
+MAX_NORMALIZATION_GAIN = 20.0
+DEFAULT_CROSSFADE_MS = 40
+DEFAULT_CEILING_DB = -1.0
+
+# BS.1770 K-weighting filter coefficients for 48 kHz: a high shelf and a high pass
+_K_WEIGHTING = (
+    (
+        (1.53512485958697, -2.69169618940638, 1.19839281085285),
+        (1.0, -1.69065929318241, 0.73248077421585),
+    ),
+    ((1.0, -2.0, 1.0), (1.0, -1.99004745483398, 0.99007225036621)),
+)
+_BLOCK_SAMPLES = SAMPLE_RATE * 400 // 1000
+_BLOCK_STEP = _BLOCK_SAMPLES // 4
+_ABSOLUTE_GATE = -70.0
+_RELATIVE_GATE = -10.0
+
+# The limiter computes gains per 5 ms block and holds each gain for 20 ms on both sides
+_LIMITER_BLOCK = SAMPLE_RATE * 5 // 1000
+_LIMITER_HOLD_BLOCKS = 4
+
+
+def _samples(pcm: Buffer) -> np.ndarray:
+    return np.frombuffer(pcm, dtype="<i2").reshape(-1, CHANNELS)
+
+
+def _k_weighting_response(length: int) -> np.ndarray:
+    z = np.exp(-1j * np.pi * np.arange(length // 2 + 1) / (length / 2))
+    response = np.ones_like(z)
+    for b, a in _K_WEIGHTING:
+        response *= (b[0] + b[1] * z + b[2] * z**2) / (a[0] + a[1] * z + a[2] * z**2)
+    return response
+
+
+def measure_loudness(pcm: Buffer) -> float:
+    """
+    Measure the integrated loudness of PCM in Discord's voice format.
+
+    The K-weighting filter is applied in the frequency domain, then the gated mean
+    square of 400 ms blocks with 75% overlap is computed as in ITU-R BS.1770.
+
+    Args:
+        pcm (Buffer): Signed 16-bit little-endian stereo PCM sampled at 48 kHz.
+
+    Returns:
+        float: The loudness in LUFS. Silence measures as the absolute gate, -70 LUFS.
+    """
+    samples = _samples(pcm).astype(np.float64) / 32768
+    if not len(samples):
+        return _ABSOLUTE_GATE
+
+    # Zero padding keeps the filter's tail from wrapping around to the start
+    length = len(samples) + _BLOCK_SAMPLES
+    spectrum = np.fft.rfft(samples, n=length, axis=0)
+    weighted = np.fft.irfft(spectrum * _k_weighting_response(length)[:, None], n=length, axis=0)
+    power = np.square(weighted[: len(samples)]).sum(axis=1)
+
+    if len(power) < _BLOCK_SAMPLES:
+        energies = np.array([power.mean()])
+    else:
+        cumulative = np.concatenate(([0.0], np.cumsum(power)))
+        starts = np.arange(0, len(power) - _BLOCK_SAMPLES + 1, _BLOCK_STEP)
+        energies = (cumulative[starts + _BLOCK_SAMPLES] - cumulative[starts]) / _BLOCK_SAMPLES
+
+    with np.errstate(divide="ignore"):
+        loudness = -0.691 + 10 * np.log10(energies)
+
+    gated = energies[loudness > _ABSOLUTE_GATE]
+    if not len(gated):
+        return _ABSOLUTE_GATE
+
+    threshold = -0.691 + 10 * np.log10(gated.mean()) + _RELATIVE_GATE
+    with np.errstate(divide="ignore"):
+        gated = gated[-0.691 + 10 * np.log10(gated) > threshold]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def normalization_gain(
+    loudness: Optional[float], target: float = TARGET_LOUDNESS, gain: float = 0
+) -> float:
+    """
+    Get the gain that brings a segment to the target loudness.
+
+    Args:
+        loudness (Optional[float]): Measured loudness of the segment in LUFS, or None
+            to apply only ``gain``.
+        target (float): Target loudness in LUFS.
+        gain (float): Extra gain in dB.
+
+    Returns:
+        float: The gain in dB, limited to ``MAX_NORMALIZATION_GAIN`` either way.
+    """
+    if loudness is None:
+        return gain
+    normalization = min(max(target - loudness, -MAX_NORMALIZATION_GAIN), MAX_NORMALIZATION_GAIN)
+    return normalization + gain
+
+
+def apply_gain(pcm: Buffer, gain: float) -> bytes:
+    """
+    Apply a gain to PCM in Discord's voice format, clipping at full scale.
+
+    Args:
+        pcm (Buffer): Signed 16-bit little-endian stereo PCM sampled at 48 kHz.
+        gain (float): The gain in dB.
+
+    Returns:
+        bytes: The amplified PCM.
+    """
+    samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32)
+    samples *= 10 ** (gain / 20)
+    np.clip(samples, -32768, 32767, out=samples)
+    return samples.astype("<i2").tobytes()
+
+
+class SentenceMixer:
+    """
+    Mixes PCM segments into a single sentence.
+
+    Every segment is scaled by its own gain, consecutive segments are joined with an
+    equal-power crossfade and the result goes through a peak limiter. The float and
+    integer work buffers are kept per thread and only grow, so mixing does not
+    allocate a new sentence-sized buffer on every call.
+    """
+
+    def __init__(
+        self, crossfade_ms: int = DEFAULT_CROSSFADE_MS, ceiling_db: float = DEFAULT_CEILING_DB
+    ):
+        """
+        Initialize the mixer.
+
+        Args:
+            crossfade_ms (int): Length of the crossfades in milliseconds.
+            ceiling_db (float): Peak level the limiter keeps the sentence under, in dBFS.
+        """
+        self.crossfade = SAMPLE_RATE * crossfade_ms // 1000
+        self.ceiling = 10 ** (ceiling_db / 20)
+        self._local = threading.local()
+        self._curves = self._fade_curves(self.crossfade)
+
+    @staticmethod
+    def _fade_curves(frames: int):
+        # Equal-power fade curves, sampled in the middle of every frame
+        t = (np.arange(frames, dtype=np.float32) + 0.5) / max(frames, 1)
+        return np.sin(t * np.pi / 2)[:, None], np.cos(t * np.pi / 2)[:, None]
+
+    def _buffers(self, frames: int):
+        mix = getattr(self._local, "mix", None)
+        if mix is None or len(mix) < frames:
+            capacity = max(frames, 2 * len(mix) if mix is not None else 0)
+            self._local.mix = np.empty((capacity, CHANNELS), dtype=np.float32)
+            self._local.out = np.empty((capacity, CHANNELS), dtype="<i2")
+        return self._local.mix[:frames], self._local.out[:frames]
+
+    def _limit(self, mix: np.ndarray) -> None:
+        blocks = -(-len(mix) // _LIMITER_BLOCK)
+        peaks = np.zeros(blocks * _LIMITER_BLOCK, dtype=np.float32)
+        np.max(np.abs(mix), axis=1, out=peaks[: len(mix)])
+        peaks = peaks.reshape(blocks, _LIMITER_BLOCK).max(axis=1)
+        if peaks.max(initial=0) <= self.ceiling:
+            return
+
+        gains = np.minimum(1, self.ceiling / np.maximum(peaks, 1e-9))
+        padded = np.pad(gains, _LIMITER_HOLD_BLOCKS, constant_values=1)
+        held = sliding_window_view(padded, 2 * _LIMITER_HOLD_BLOCKS + 1).min(axis=1)
+
+        # Interpolating between held block gains never exceeds the gain a block needs
+        centers = np.arange(blocks) * _LIMITER_BLOCK + _LIMITER_BLOCK / 2
+        mix *= np.interp(np.arange(len(mix)), centers, held).astype(np.float32)[:, None]
+
+    def mix(self, segments: Sequence[Buffer], gains: Sequence[float]) -> bytes:
+        """
+        Mix segments into a single sentence.
+
+        Args:
+            segments (Sequence[Buffer]): PCM segments in Discord's voice format.
+            gains (Sequence[float]): Gain in dB of every segment.
+
+        Returns:
+            bytes: The sentence as PCM in Discord's voice format.
+        """
+        samples = [_samples(segment) for segment in segments]
+        overlaps = [
+            min(self.crossfade, len(previous), len(current))
+            for previous, current in zip(samples, samples[1:])
+        ]
+        mix, out = self._buffers(sum(len(s) for s in samples) - sum(overlaps))
+
+        position = 0
+        for index, (segment, gain) in enumerate(zip(samples, gains)):
+            scale = np.float32(10 ** (gain / 20) / 32768)
+            overlap = overlaps[index - 1] if index else 0
+            if overlap:
+                start = position - overlap
+                if overlap == self.crossfade:
+                    fade_in, fade_out = self._curves
+                else:
+                    fade_in, fade_out = self._fade_curves(overlap)
+                mix[start:position] *= fade_out
+                mix[start:position] += segment[:overlap] * scale * fade_in
+            end = position + len(segment) - overlap
+            np.multiply(segment[overlap:], scale, out=mix[position:end])
+            position = end
+
+        self._limit(mix)
+        np.clip(mix, -1, 1, out=mix)
+        np.multiply(mix, 32767, out=out, casting="unsafe")
+        return out.tobytes()
+
+
+_mixer: Optional[SentenceMixer] = None
+
+
+def mix_sentence(segments: Sequence[Buffer], gains: Sequence[float]) -> bytes:
+    """
+    Mix segments into a single sentence with this process's default ``SentenceMixer``.
+
+    Meant to run in the process pool, every worker keeps one mixer and its buffers.
+
+    Args:
+        segments (Sequence[Buffer]): PCM segments in Discord's voice format.
+        gains (Sequence[float]): Gain in dB of every segment.
+
+    Returns:
+        bytes: The sentence as PCM in Discord's voice format.
+    """
+    global _mixer
+    if _mixer is None:
+        _mixer = SentenceMixer()
+    return _mixer.mix(segments, gains)
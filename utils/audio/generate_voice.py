@@ -5,52 +5,128 @@ This module provides functions for generating speech from text using the ElevenL
 """
 
 import hashlib
-import io
 import logging
 import os
-from typing import BinaryIO
+from typing import Optional
 
-from elevenlabs import ElevenLabs
 from pydub import AudioSegment
 
-from entities import LocalCache
 from entities.cache import ICache
+from utils.audio.pcm import CHANNELS, SAMPLE_RATE, SAMPLE_WIDTH, decode_mp3_to_pcm
+from utils.audio.tts import convert_options, create_client
+from utils.metrics import SPEECH_CACHE_LOOKUPS, TTS_BYTES, TTS_LATENCY
 
+SPEECH_GAIN = 6
 
-def generate_speech_from_text(text: str, cache: ICache) -> AudioSegment:
+
+def speech_hash(text: str) -> str:
     """
-    Generate speech from text using the ElevenLabs API.
+    Get the cache hash of a custom text.
 
     Args:
-        text (str): The text to convert to speech.
+        text (str): The text.
+
+    Returns:
+        str: The SHA-256 hex digest of the text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_cached_speech_mp3(text: str, cache: ICache) -> Optional[bytes]:
+    """
+    Get the cached MP3 data of a text, if there is any.
+
+    The text itself may also be the hash of a cached entry.
+
+    Args:
+        text (str): The text, or the hash of a cached text.
         cache (ICache): The cache instance to use for caching.
 
     Returns:
-        BinaryIO: A binary stream containing the generated MP3 audio.
+        Optional[bytes]: The MP3 data, or None if the text is not cached.
     """
+    # The data is copied out of the cache, since it is sent to a worker process
 
     if cache.is_mp3_cached(text):
         logging.info(f"Using cached MP3 for {text} - by hash")
-        return cache.load_mp3(text) + 6
+        # Looked up with the raw text
+        SPEECH_CACHE_LOOKUPS.inc(result="text")
+        return bytes(cache.read_mp3(text))
 
-    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    text_hash = speech_hash(text)
     if cache.is_mp3_cached(text_hash):
         logging.info(f"Using cached MP3 for {text_hash}")
-        return cache.load_mp3(text_hash) + 6
-
-    logging.info(f"Generating MP3 for {text_hash}")
-    client = ElevenLabs(api_key=os.environ["ELEVEN_LABS_API_KEY"])
-    audio = b"".join(
-        client.text_to_speech.convert(
-            text=text,
-            voice_id="pqHfZKP75CvOlQylNhV4",
-            model_id="eleven_flash_v2_5",
-            language_code="pl",
-            output_format="mp3_44100_128",
-        )
-    )
+        SPEECH_CACHE_LOOKUPS.inc(result="hash")
+        return bytes(cache.read_mp3(text_hash))
+
+    SPEECH_CACHE_LOOKUPS.inc(result="miss")
+    return None
+
+
+def fetch_speech_mp3(text: str, cache: ICache, blocking: bool = True) -> Optional[bytes]:
+    """
+    Get the MP3 data of a text, from the cache or from the ElevenLabs API.
+
+    Newly generated audio is saved to the cache. Generation holds the entry's cache
+    lock, so a text requested by several threads or shard processes at once is
+    generated once and the others read it from the cache. This function only does
+    blocking I/O, decoding is left to the caller.
+
+    Args:
+        text (str): The text to convert to speech.
+        cache (ICache): The cache instance to use for caching.
+        blocking (bool): Whether to wait while another request generates the text.
+            Callers on the event loop poll instead, so that waiting does not take up
+            a pool thread.
+
+    Returns:
+        Optional[bytes]: The MP3 data, or None if ``blocking`` is False and another
+            request is generating the text.
+    """
+    audio = load_cached_speech_mp3(text, cache)
+    if audio is not None:
+        return audio
+
+    text_hash = speech_hash(text)
+    lock = cache.lock_mp3(text_hash)
+    if not lock.acquire(blocking):
+        return None
 
-    logging.info(f"Saving MP3 for {text_hash}")
-    cache.save_mp3(audio, text_hash)
+    try:
+        # Whoever held the lock may have just generated it
+        cache.refresh()
+        if cache.is_mp3_cached(text_hash):
+            logging.info(f"Using MP3 for {text_hash} generated by another request")
+            return bytes(cache.read_mp3(text_hash))
 
-    return cache.load_mp3(text_hash) + 6
+        logging.info(f"Generating MP3 for {text_hash}")
+        client = create_client(os.environ["ELEVEN_LABS_API_KEY"])
+        with TTS_LATENCY.time(mode="convert"):
+            audio = b"".join(client.text_to_speech.convert(**convert_options(text)))
+        TTS_BYTES.inc(len(audio), mode="convert")
+
+        logging.info(f"Saving MP3 for {text_hash}")
+        cache.save_mp3(audio, text_hash)
+    finally:
+        lock.release()
+
+    return audio
+
+
+def generate_speech_from_text(text: str, cache: ICache) -> AudioSegment:
+    """
+    Generate speech from text using the ElevenLabs API.
+
+    Args:
+        text (str): The text to convert to speech.
+        cache (ICache): The cache instance to use for caching.
+
+    Returns:
+        AudioSegment: The generated speech.
+    """
+    return AudioSegment(
+        data=decode_mp3_to_pcm(fetch_speech_mp3(text, cache), SPEECH_GAIN),
+        sample_width=SAMPLE_WIDTH,
+        frame_rate=SAMPLE_RATE,
+        channels=CHANNELS,
+    )
@@ -0,0 +1,90 @@
+"""
+Opus helpers for the KorwinAI Discord Bot.
+
+This module encodes PCM into Opus packets ahead of time and (de)serializes packet
+sequences to the sidecar files stored next to the cached MP3 files.
+"""
+
+import struct
+from typing import List, Union
+
+from utils.audio.pcm import FRAME_SIZE, SAMPLES_PER_FRAME
+
+# Same as discord.opus.OPUS_SILENCE, defined here to avoid importing discord.py
+OPUS_SILENCE = b"\xf8\xff\xfe"
+
+_LENGTH = struct.Struct("<H")
+
+
+def encode_opus_packets(pcm: Union[bytes, memoryview], gain: float = 0) -> List[bytes]:
+    """
+    Encode PCM in Discord's voice format into 20 ms Opus packets.
+
+    Args:
+        pcm (Union[bytes, memoryview]): PCM buffer, see ``utils.audio.pcm``.
+        gain (float): Gain in dB applied before encoding.
+
+    Returns:
+        List[bytes]: The Opus packets. The last frame is padded with silence.
+
+    Raises:
+        discord.opus.OpusNotLoaded: If libopus is not available.
+    """
+    import discord
+
+    if gain:
+        from utils.audio.dsp import apply_gain
+
+        pcm = apply_gain(pcm, gain)
+
+    encoder = discord.opus.Encoder()
+    view = memoryview(pcm).cast("B")
+    packets = []
+
+    for offset in range(0, len(view), FRAME_SIZE):
+        frame = bytes(view[offset : offset + FRAME_SIZE])
+        if len(frame) < FRAME_SIZE:
+            frame += bytes(FRAME_SIZE - len(frame))
+        packets.append(encoder.encode(frame, SAMPLES_PER_FRAME))
+
+    return packets
+
+
+def pack_opus_packets(packets: List[bytes]) -> bytes:
+    """
+    Serialize Opus packets as length-prefixed records.
+
+    Args:
+        packets (List[bytes]): The packets to serialize.
+
+    Returns:
+        bytes: The serialized packets.
+    """
+    return b"".join(_LENGTH.pack(len(packet)) + packet for packet in packets)
+
+
+def unpack_opus_packets(
+    data: Union[bytes, memoryview], copy: bool = True
+) -> List[Union[bytes, memoryview]]:
+    """
+    Deserialize Opus packets written by ``pack_opus_packets``.
+
+    Args:
+        data (Union[bytes, memoryview]): The serialized packets.
+        copy (bool): Whether to copy the packets, or return views into ``data``.
+
+    Returns:
+        List[Union[bytes, memoryview]]: The packets.
+    """
+    view = memoryview(data).cast("B")
+    packets = []
+    offset = 0
+
+    while offset < len(view):
+        (length,) = _LENGTH.unpack_from(view, offset)
+        offset += _LENGTH.size
+        packet = view[offset : offset + length]
+        packets.append(bytes(packet) if copy else packet)
+        offset += length
+
+    return packets
@@ -0,0 +1,53 @@
+"""
+Opus audio source for the KorwinAI Discord Bot.
+
+This module provides a discord.py audio source that plays pre-encoded Opus packets,
+so voice playback does not need to encode anything.
+"""
+
+from typing import Iterable, Iterator, List, Sequence
+
+import discord
+
+from utils.audio.opus import OPUS_SILENCE
+
+DEFAULT_GAP_FRAMES = 3
+
+
+class OpusPacketSource(discord.AudioSource):
+    """
+    Audio source that plays a sequence of pre-encoded segments.
+
+    Each segment is a sequence of 20 ms Opus packets. Silence packets are inserted
+    between segments so the decoder on the listener's side resets cleanly.
+    """
+
+    def __init__(self, segments: Iterable[Sequence[bytes]], gap_frames: int = DEFAULT_GAP_FRAMES):
+        """
+        Initialize the source with the segments to play.
+
+        Args:
+            segments (Iterable[Sequence[bytes]]): Opus packet sequences to play in order.
+            gap_frames (int): Number of silence packets inserted between segments.
+        """
+        self._packets: Iterator[bytes] = self._iter_packets(segments, gap_frames)
+
+    @staticmethod
+    def _iter_packets(segments: Iterable[Sequence[bytes]], gap_frames: int) -> Iterator[bytes]:
+        gap: List[bytes] = [OPUS_SILENCE] * gap_frames
+        for index, segment in enumerate(segments):
+            if index:
+                yield from gap
+            yield from segment
+
+    def read(self) -> bytes:
+        """
+        Read the next Opus packet.
+
+        Returns:
+            bytes: A 20 ms Opus packet, or an empty bytes object at the end.
+        """
+        return next(self._packets, b"")
+
+    def is_opus(self) -> bool:
+        return True
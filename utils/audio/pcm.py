@@ -0,0 +1,62 @@
+"""
+PCM helpers for the KorwinAI Discord Bot.
+
+This module describes the raw audio format Discord expects for voice playback
+(48 kHz, 16-bit, stereo, 20 ms frames) and converts audio segments into it.
+"""
+
+import io
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pydub import AudioSegment
+
+SAMPLE_RATE = 48000
+CHANNELS = 2
+SAMPLE_WIDTH = 2
+FRAME_LENGTH_MS = 20
+SAMPLES_PER_FRAME = SAMPLE_RATE * FRAME_LENGTH_MS // 1000
+FRAME_SIZE = SAMPLES_PER_FRAME * CHANNELS * SAMPLE_WIDTH
+
+
+def to_discord_pcm(segment: "AudioSegment") -> bytes:
+    """
+    Convert an audio segment to raw PCM in Discord's voice format.
+
+    The conversion is done in-process, no ffmpeg subprocess is started.
+
+    Args:
+        segment (AudioSegment): The audio segment to convert.
+
+    Returns:
+        bytes: Signed 16-bit little-endian stereo PCM sampled at 48 kHz.
+    """
+    return (
+        segment.set_frame_rate(SAMPLE_RATE)
+        .set_channels(CHANNELS)
+        .set_sample_width(SAMPLE_WIDTH)
+        .raw_data
+    )
+
+
+def decode_mp3_to_pcm(data: bytes, gain: float = 0) -> bytes:
+    """
+    Decode MP3 data to raw PCM in Discord's voice format.
+
+    This is a plain module level function so it can run in a process pool.
+
+    Args:
+        data (bytes): The MP3 data.
+        gain (float, optional): Gain in dB applied to the audio. Defaults to 0.
+
+    Returns:
+        bytes: Signed 16-bit little-endian stereo PCM sampled at 48 kHz.
+    """
+    from pydub import AudioSegment
+
+    pcm = to_discord_pcm(AudioSegment.from_mp3(io.BytesIO(data)))
+    if gain:
+        from utils.audio.dsp import apply_gain
+
+        pcm = apply_gain(pcm, gain)
+    return pcm
@@ -0,0 +1,73 @@
+"""
+PCM audio source for the KorwinAI Discord Bot.
+
+This module provides a discord.py audio source that plays raw PCM buffers directly,
+without encoding them to MP3 and decoding them again through an FFmpeg pipe.
+"""
+
+from typing import Iterable, Iterator, Union
+
+import discord
+
+from utils.audio.pcm import FRAME_SIZE
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class PCMSegmentSource(discord.AudioSource):
+    """
+    Audio source that reads 20 ms PCM frames from a sequence of buffers.
+
+    Every buffer must already be in Discord's voice format (see ``utils.audio.pcm``).
+    Frames may span buffer boundaries, the last frame is padded with silence.
+    """
+
+    def __init__(self, segments: Iterable[Buffer]):
+        """
+        Initialize the source with the segments to play.
+
+        Args:
+            segments (Iterable[Buffer]): PCM buffers to play one after another.
+        """
+        self._segments: Iterator[Buffer] = iter(segments)
+        self._current = memoryview(b"")
+        self._offset = 0
+
+    def _next_segment(self) -> bool:
+        segment = next(self._segments, None)
+        if segment is None:
+            return False
+        self._current = memoryview(segment).cast("B")
+        self._offset = 0
+        return True
+
+    def read(self) -> bytes:
+        """
+        Read the next 20 ms frame.
+
+        Returns:
+            bytes: A frame of ``FRAME_SIZE`` bytes, or an empty bytes object at the end.
+        """
+        # Fast path - the whole frame is inside the current segment
+        end = self._offset + FRAME_SIZE
+        if end <= len(self._current):
+            frame = bytes(self._current[self._offset : end])
+            self._offset = end
+            return frame
+
+        frame = bytearray()
+        while len(frame) < FRAME_SIZE:
+            if self._offset >= len(self._current) and not self._next_segment():
+                break
+            take = min(FRAME_SIZE - len(frame), len(self._current) - self._offset)
+            frame += self._current[self._offset : self._offset + take]
+            self._offset += take
+
+        if not frame:
+            return b""
+
+        frame.extend(bytes(FRAME_SIZE - len(frame)))
+        return bytes(frame)
+
+    def is_opus(self) -> bool:
+        return False
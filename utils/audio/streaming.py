@@ -0,0 +1,187 @@
+"""
+Streaming text-to-speech for the KorwinAI Discord Bot.
+
+This module starts playback of uncached custom phrases as soon as the first audio
+chunk arrives from the ElevenLabs API, while the same bytes are written to the cache.
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+from typing import Deque, Iterator, Optional
+
+import discord
+
+from entities.cache import ICache, ICacheWriter
+from utils.audio.generate_voice import SPEECH_GAIN, speech_hash
+from utils.audio.tts import convert_options, create_client
+from utils.concurrency.file_lock import FileLock
+from utils.metrics import TTS_BYTES, TTS_LATENCY
+
+
+class TeeStream:
+    """
+    Read-only file-like object over an iterator of chunks that copies every chunk
+    into a cache writer.
+
+    The chunks are downloaded by a thread of their own and buffered for reading.
+    FFmpeg only reads as fast as the audio plays, so the download does not wait for
+    the playback and the entry's cache lock, if given, is only held until the
+    download ends. The cache entry is committed when the iterator is exhausted and
+    aborted if it fails, so a partial download never ends up in the cache. Closing
+    the stream early drops the buffered chunks, the download still finishes.
+    """
+
+    def __init__(
+        self, chunks: Iterator[bytes], writer: ICacheWriter, lock: Optional[FileLock] = None
+    ):
+        self._chunks = chunks
+        self._writer = writer
+        self._lock = lock
+        self._buffer = b""
+        self._pending: Deque[bytes] = collections.deque()
+        self._done = False
+        self._closed = False
+        # The download thread appends chunks, FFmpeg's pipe writer thread reads them
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._download, name="tts-stream", daemon=True)
+        self._thread.start()
+
+    def _download(self) -> None:
+        started: Optional[float] = time.perf_counter()
+        commit = False
+        try:
+            for chunk in self._chunks:
+                if not chunk:
+                    continue
+                if started is not None:
+                    TTS_LATENCY.observe(time.perf_counter() - started, mode="stream")
+                    started = None
+                TTS_BYTES.inc(len(chunk), mode="stream")
+
+                self._writer.write(chunk)
+                with self._condition:
+                    if not self._closed:
+                        self._pending.append(chunk)
+                        self._condition.notify()
+            commit = True
+        except Exception as e:
+            logging.error(f"Text-to-speech stream failed: {e}")
+        finally:
+            try:
+                if commit:
+                    self._writer.commit()
+                else:
+                    self._writer.abort()
+            except Exception as e:
+                logging.error(f"Could not finish the cache entry of a stream: {e}")
+            finally:
+                if self._lock is not None:
+                    self._lock.release()
+                with self._condition:
+                    self._done = True
+                    self._condition.notify_all()
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Read up to ``size`` bytes, waiting for the next chunk if needed.
+
+        Args:
+            size (int): Maximum number of bytes to read, -1 reads the next chunk.
+
+        Returns:
+            bytes: The data, or an empty bytes object at the end of the stream.
+        """
+        if not self._buffer:
+            with self._condition:
+                while not self._pending and not self._done and not self._closed:
+                    self._condition.wait()
+                if self._closed or not self._pending:
+                    return b""
+                self._buffer = self._pending.popleft()
+
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def close(self) -> None:
+        """
+        Stop reading. The download still finishes into the cache.
+        """
+        with self._condition:
+            self._closed = True
+            self._pending.clear()
+            self._condition.notify_all()
+
+
+class TeeAudio(discord.FFmpegPCMAudio):
+    """
+    FFmpeg audio source over a ``TeeStream``.
+
+    discord.py never closes the input of a piped FFmpeg source, so the stream is
+    closed when the source is cleaned up, also when it is stopped or dropped before
+    the end. That drops the buffered audio, the download still finishes into the cache.
+    """
+
+    def __init__(self, stream: TeeStream, **kwargs):
+        self._stream = stream
+        super().__init__(stream, pipe=True, **kwargs)
+
+    def cleanup(self) -> None:
+        try:
+            super().cleanup()
+        finally:
+            self._stream.close()
+
+
+def stream_speech_from_text(text: str, cache: ICache) -> Optional[discord.AudioSource]:
+    """
+    Create an audio source that plays speech for a text while it is being generated.
+
+    The MP3 stream from the ElevenLabs API is decoded by FFmpeg as it arrives and
+    written to the ``custom`` cache entry of the text at the same time.
+
+    The entry's cache lock is held until the download ends, not until the playback
+    ends. If another request, in this or another shard process, is already generating
+    the text or has just cached it, nothing is streamed and None is returned;
+    ``fetch_speech_mp3`` then waits for that request and reads the result from the
+    cache.
+
+    Args:
+        text (str): The text to convert to speech.
+        cache (ICache): The cache instance to use for caching.
+
+    Returns:
+        Optional[discord.AudioSource]: The audio source, or None if the text is
+            already being generated.
+    """
+    text_hash = speech_hash(text)
+    lock = cache.lock_mp3(text_hash)
+    if not lock.acquire(blocking=False):
+        logging.info(f"MP3 for {text_hash} is already being generated")
+        return None
+
+    try:
+        cache.refresh()
+        if cache.is_mp3_cached(text_hash):
+            lock.release()
+            return None
+
+        logging.info(f"Streaming MP3 for {text_hash}")
+        client = create_client(os.environ["ELEVEN_LABS_API_KEY"])
+        chunks = client.text_to_speech.convert_as_stream(**convert_options(text))
+        writer = cache.open_mp3_writer(text_hash)
+    except Exception:
+        lock.release()
+        raise
+
+    # From here on the stream's download thread owns the lock and the writer
+    stream = TeeStream(iter(chunks), writer, lock)
+    try:
+        return TeeAudio(stream, options=f"-filter:a volume={SPEECH_GAIN}dB")
+    except Exception:
+        stream.close()
+        raise
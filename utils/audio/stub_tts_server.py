@@ -0,0 +1,93 @@
+"""
+Stub text-to-speech server for the KorwinAI Discord Bot.
+
+This module serves a minimal imitation of the ElevenLabs text-to-speech endpoint, so
+bulk generation and load tests can run without spending API credits. It answers with
+silent MP3 audio whose length depends on the text, and can simulate latency, rate
+limiting and server errors.
+
+Run it with ``python -m utils.audio.stub_tts_server`` and set
+``ELEVEN_LABS_BASE_URL=http://127.0.0.1:8089``.
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+
+from aiohttp import web
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, no padding. A frame with an empty body
+# decodes to 1152 samples of silence.
+_FRAME_HEADER = bytes([0xFF, 0xFB, 0x90, 0x64])
+_FRAME_SIZE = 144 * 128000 // 44100
+SILENT_FRAME = _FRAME_HEADER + bytes(_FRAME_SIZE - len(_FRAME_HEADER))
+
+FRAMES_PER_CHARACTER = 3
+CHUNK_FRAMES = 10
+
+
+def silent_mp3(text: str) -> bytes:
+    """
+    Build silent MP3 audio roughly as long as the text would take to say.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        bytes: The MP3 data.
+    """
+    return SILENT_FRAME * max(1, len(text) * FRAMES_PER_CHARACTER)
+
+
+def create_app(latency: float = 0.0, error_rate: float = 0.0) -> web.Application:
+    """
+    Create the stub server application.
+
+    Args:
+        latency (float): Seconds to wait before answering each request.
+        error_rate (float): Fraction of requests answered with 429 or 500.
+
+    Returns:
+        web.Application: The application.
+    """
+
+    async def text_to_speech(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        await asyncio.sleep(latency)
+
+        if random.random() < error_rate:
+            status = random.choice([429, 500])
+            return web.json_response({"detail": "stub error"}, status=status)
+
+        response = web.StreamResponse(headers={"Content-Type": "audio/mpeg"})
+        await response.prepare(request)
+
+        audio = silent_mp3(body.get("text", ""))
+        chunk_size = len(SILENT_FRAME) * CHUNK_FRAMES
+        for offset in range(0, len(audio), chunk_size):
+            await response.write(audio[offset : offset + chunk_size])
+
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/text-to-speech/{voice_id}", text_to_speech)
+    app.router.add_post("/v1/text-to-speech/{voice_id}/stream", text_to_speech)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub ElevenLabs text-to-speech server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 429/500")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(create_app(args.latency, args.error_rate), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
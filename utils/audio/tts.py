@@ -0,0 +1,79 @@
+"""
+Text-to-speech settings for the KorwinAI Discord Bot.
+
+This module keeps the ElevenLabs voice settings in one place and creates API clients.
+Setting the ``ELEVEN_LABS_BASE_URL`` environment variable points the clients at a
+different server, e.g. the local stub server in ``utils.audio.stub_tts_server``.
+"""
+
+import os
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+if TYPE_CHECKING:
+    from elevenlabs import AsyncElevenLabs, ElevenLabs
+    from elevenlabs.environment import ElevenLabsEnvironment
+
+VOICE_ID = "pqHfZKP75CvOlQylNhV4"
+MODEL_ID = "eleven_flash_v2_5"
+LANGUAGE_CODE = "pl"
+OUTPUT_FORMAT = "mp3_44100_128"
+
+
+def _environment() -> "ElevenLabsEnvironment":
+    from elevenlabs.environment import ElevenLabsEnvironment
+
+    base_url: Optional[str] = os.getenv("ELEVEN_LABS_BASE_URL")
+    if not base_url:
+        return ElevenLabsEnvironment.PRODUCTION
+
+    base_url = base_url.rstrip("/")
+    return ElevenLabsEnvironment(base=base_url, wss=base_url.replace("http", "ws", 1))
+
+
+def create_client(api_key: str) -> "ElevenLabs":
+    """
+    Create a synchronous ElevenLabs client.
+
+    Args:
+        api_key (str): ElevenLabs API key.
+
+    Returns:
+        ElevenLabs: The client.
+    """
+    from elevenlabs import ElevenLabs
+
+    return ElevenLabs(api_key=api_key, environment=_environment())
+
+
+def create_async_client(api_key: str) -> "AsyncElevenLabs":
+    """
+    Create an asynchronous ElevenLabs client.
+
+    Args:
+        api_key (str): ElevenLabs API key.
+
+    Returns:
+        AsyncElevenLabs: The client.
+    """
+    from elevenlabs import AsyncElevenLabs
+
+    return AsyncElevenLabs(api_key=api_key, environment=_environment())
+
+
+def convert_options(text: str) -> Dict[str, Any]:
+    """
+    Get the keyword arguments for ``text_to_speech.convert`` for a text.
+
+    Args:
+        text (str): The text to convert to speech.
+
+    Returns:
+        Dict[str, Any]: The keyword arguments.
+    """
+    return dict(
+        text=text,
+        voice_id=VOICE_ID,
+        model_id=MODEL_ID,
+        language_code=LANGUAGE_CODE,
+        output_format=OUTPUT_FORMAT,
+    )
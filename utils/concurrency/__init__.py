@@ -0,0 +1,11 @@
+"""
+Concurrency utilities for the KorwinAI Discord Bot.
+
+This subpackage contains helpers for running blocking work outside the asyncio event loop.
+"""
+
+from utils.concurrency.executor import AudioExecutor
+from utils.concurrency.file_lock import FileLock
+from utils.concurrency.single_flight import SingleFlight
+
+__all__ = ["AudioExecutor", "FileLock", "SingleFlight"]
@@ -0,0 +1,168 @@
+"""
+Executor utilities for the KorwinAI Discord Bot.
+
+This module provides a bounded executor layer that runs blocking audio, cache and
+text-to-speech work outside the asyncio event loop.
+"""
+
+import asyncio
+import contextvars
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+DEFAULT_IO_WORKERS = 8
+DEFAULT_MAX_PENDING = 64
+SLOW_WAIT_THRESHOLD = 1.0
+
+
+def _timed_call(func: Callable, args: Tuple, kwargs: Dict) -> Tuple[float, Any]:
+    # Runs in the worker, so the start time tells how long the job waited in the queue.
+    # Wall clock time is used because process pool workers do not share a monotonic clock.
+    started = time.time()
+    return started, func(*args, **kwargs)
+
+
+@dataclass
+class PoolStats:
+    """
+    Queue depth and wait time statistics of a single pool.
+    """
+
+    pending: int = 0
+    completed: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    last_wait: float = 0.0
+
+    @property
+    def average_wait(self) -> float:
+        return self.total_wait / self.completed if self.completed else 0.0
+
+
+class _BoundedPool:
+    def __init__(self, name: str, executor: Executor, max_pending: int, copy_context: bool):
+        self.name = name
+        self.executor = executor
+        # Threads run jobs in the caller's context, like asyncio.to_thread, so context
+        # variables such as the log context are visible; processes cannot share it
+        self.copy_context = copy_context
+        self.stats = PoolStats()
+        self._slots = asyncio.Semaphore(max_pending)
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        self.stats.pending += 1
+        submitted = time.time()
+        try:
+            async with self._slots:
+                call = (_timed_call, func, args, kwargs)
+                if self.copy_context:
+                    call = (contextvars.copy_context().run, *call)
+                future = asyncio.get_running_loop().run_in_executor(self.executor, *call)
+                started, result = await future
+        finally:
+            self.stats.pending -= 1
+
+        wait = max(0.0, started - submitted)
+        self.stats.completed += 1
+        self.stats.total_wait += wait
+        self.stats.max_wait = max(self.stats.max_wait, wait)
+        self.stats.last_wait = wait
+        if wait > SLOW_WAIT_THRESHOLD:
+            logging.warning(f"{self.name} job {func.__name__} waited {wait:.2f}s in the queue")
+
+        return result
+
+
+class AudioExecutor:
+    """
+    Bounded executor layer for blocking work started from the bot.
+
+    I/O bound work (HTTP requests, cache reads and writes) runs in a thread pool,
+    CPU bound work (decoding and mixing audio) runs in a process pool. Each pool
+    accepts at most ``max_pending`` jobs at a time, further callers wait their turn
+    without blocking the event loop.
+    """
+
+    def __init__(
+        self,
+        io_workers: int = DEFAULT_IO_WORKERS,
+        cpu_workers: Optional[int] = None,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ):
+        """
+        Initialize the executor pools.
+
+        Args:
+            io_workers (int): Number of threads for I/O bound work.
+            cpu_workers (Optional[int]): Number of processes for CPU bound work.
+                Defaults to the number of CPUs.
+            max_pending (int): Maximum number of jobs submitted to each pool at once.
+        """
+        self._io = _BoundedPool(
+            "io",
+            ThreadPoolExecutor(io_workers, thread_name_prefix="korwin-io"),
+            max_pending,
+            copy_context=True,
+        )
+        self._cpu = _BoundedPool(
+            "cpu",
+            ProcessPoolExecutor(
+                cpu_workers or os.cpu_count(), mp_context=multiprocessing.get_context("spawn")
+            ),
+            max_pending,
+            copy_context=False,
+        )
+
+    async def run_io(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run a blocking I/O bound function in the thread pool.
+
+        The function runs in a copy of the caller's context, like with
+        ``asyncio.to_thread``.
+
+        Args:
+            func (Callable): The function to run.
+            *args: Positional arguments for the function.
+            **kwargs: Keyword arguments for the function.
+
+        Returns:
+            Any: The function's return value.
+        """
+        return await self._io.run(func, *args, **kwargs)
+
+    async def run_cpu(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run a CPU bound function in the process pool.
+
+        The function and its arguments must be picklable.
+
+        Args:
+            func (Callable): The function to run.
+            *args: Positional arguments for the function.
+            **kwargs: Keyword arguments for the function.
+
+        Returns:
+            Any: The function's return value.
+        """
+        return await self._cpu.run(func, *args, **kwargs)
+
+    def stats(self) -> Dict[str, PoolStats]:
+        """
+        Get queue depth and wait time statistics of both pools.
+
+        Returns:
+            Dict[str, PoolStats]: Statistics keyed by pool name.
+        """
+        return {self._io.name: self._io.stats, self._cpu.name: self._cpu.stats}
+
+    def shutdown(self) -> None:
+        """
+        Shut down both pools, cancelling jobs that have not started yet.
+        """
+        self._io.executor.shutdown(wait=False, cancel_futures=True)
+        self._cpu.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,96 @@
+"""
+File lock utilities for the KorwinAI Discord Bot.
+
+This module provides advisory file locks that serialize work between threads and
+between processes, such as the shard workers sharing one cache.
+"""
+
+import os
+import pathlib
+from typing import IO, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+
+class FileLock:
+    """
+    Exclusive advisory lock on a lock file.
+
+    Every ``FileLock`` opens the lock file itself, so two instances exclude each other
+    both across processes and across threads of one process. A lock that is dropped
+    without being released is released when it is garbage collected. The lock file is
+    left in place, unless ``remove`` is set. Without ``fcntl`` locking is a no-op.
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path], remove: bool = False):
+        """
+        Initialize the lock.
+
+        Args:
+            path (Union[str, pathlib.Path]): Path of the lock file.
+            remove (bool): Whether the holder removes the lock file on release, for
+                locks of short-lived resources that would otherwise leave one file
+                each behind.
+        """
+        self.path = pathlib.Path(path)
+        self.remove = remove
+        self._file: Optional[IO] = None
+
+    @property
+    def is_locked(self) -> bool:
+        return self._file is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Acquire the lock.
+
+        Args:
+            blocking (bool): Whether to wait for the lock if another holder has it.
+
+        Returns:
+            bool: True if the lock was acquired.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            file = open(self.path, "a")
+            if fcntl is not None:
+                try:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    file.close()
+                    return False
+            if not self.remove or self._is_current(file):
+                self._file = file
+                return True
+            # The previous holder removed the file while this one waited, lock the new one
+            file.close()
+
+    def _is_current(self, file: IO) -> bool:
+        try:
+            return os.stat(self.path).st_ino == os.fstat(file.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def release(self) -> None:
+        """
+        Release the lock, if it is held.
+        """
+        if self._file is None:
+            return
+        if self.remove:
+            # Removed while still locked, so no one else can have locked this file yet
+            self.path.unlink(missing_ok=True)
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
@@ -0,0 +1,48 @@
+"""
+Request coalescing utilities for the KorwinAI Discord Bot.
+
+This module runs a coroutine once for any number of concurrent callers asking for
+the same key.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Generic, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """
+    Coalesces concurrent calls with the same key into a single call.
+
+    The first caller for a key runs the call, callers arriving while it is still
+    running await its result, or its exception. Once it has finished, the next caller
+    runs a new call.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = dict()
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run a call, or wait for the running call with the same key.
+
+        Args:
+            key (Hashable): The key identifying the call.
+            call (Callable[[], Awaitable[T]]): Starts the call.
+
+        Returns:
+            T: The result of the call.
+        """
+        future = self._calls.get(key)
+        if future is not None:
+            # Shield the shared call, so a cancelled waiter does not cancel it for all
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(call())
+        self._calls[key] = future
+        future.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(future)
@@ -4,6 +4,7 @@ Logging utilities for the KorwinAI Discord Bot.
 This subpackage contains functions for setting up and configuring logging.
 """
 
-from utils.logging.setup import setup_logging
+from utils.logging.filters import log_context
+from utils.logging.setup import setup_logging, stop_logging
 
-__all__ = ["setup_logging"]
+__all__ = ["log_context", "setup_logging", "stop_logging"]
@@ -0,0 +1,93 @@
+"""
+Log filters for the KorwinAI Discord Bot.
+
+This module adds the fields of the current command to log records and limits how often
+a single logging call may log, so that hot loops cannot flood the log.
+"""
+
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterator, Tuple
+
+DEFAULT_RATE_LIMIT = 5.0
+DEFAULT_BURST = 20
+
+_context: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar(
+    "log_context", default=dict()
+)
+
+
+@contextlib.contextmanager
+def log_context(**fields: Any) -> Iterator[None]:
+    """
+    Add fields to every record logged in the current task until the block exits.
+
+    Args:
+        **fields: The fields, e.g. ``command`` and ``guild_id``.
+    """
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Adds the fields set with ``log_context`` to log records.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for name, value in _context.get().items():
+            if not hasattr(record, name):
+                setattr(record, name, value)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Limits the records logged by every logging call below WARNING.
+
+    Records are rate limited per call site rather than per message, as most messages
+    are f-strings. Every call site may log ``burst`` records at once and ``rate``
+    records per second on average. The next record that is logged reports how many
+    were dropped.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE_LIMIT, burst: int = DEFAULT_BURST):
+        """
+        Initialize the filter.
+
+        Args:
+            rate (float): Records per second every call site may log.
+            burst (int): Records every call site may log at once.
+        """
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        # Call site -> (tokens, last update, dropped records)
+        self._buckets: Dict[Tuple[str, int], Tuple[float, float, int]] = dict()
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, dropped = self._buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, dropped + 1)
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+
+        if dropped:
+            record.msg = f"{record.getMessage()} ({dropped} similar messages dropped)"
+            record.args = None
+            record.dropped = dropped
+        return True
@@ -0,0 +1,46 @@
+"""
+Log formatters for the KorwinAI Discord Bot.
+
+This module formats log records as JSON lines, for log collectors.
+"""
+
+import json
+import logging
+from datetime import datetime, timezone
+
+# Attributes every log record has, anything else was passed in ``extra`` or set by a filter
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message",
+    "asctime",
+    "taskName",
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats every record as a single line JSON object.
+
+    The object holds the time, level, logger, message and source location of the
+    record, the fields passed in ``extra`` or set with ``log_context``, such as
+    ``command``, ``guild_id`` and ``latency``, and the traceback of exceptions.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and not name.startswith("_"):
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
@@ -0,0 +1,71 @@
+"""
+Log handlers for the KorwinAI Discord Bot.
+
+This module provides a log file handler that rotates the file when it grows too large
+or gets too old, whichever comes first.
+"""
+
+import copy
+import logging.handlers
+import time
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_ROTATE_INTERVAL = 24 * 3600
+DEFAULT_BACKUP_COUNT = 7
+
+
+class RotatingLogHandler(logging.handlers.RotatingFileHandler):
+    """
+    Appends to a log file and rotates it by size and by age.
+
+    Rotated files are numbered like with ``RotatingFileHandler``, ``bot.log.1`` being
+    the most recent one, so a size rotation never overwrites a time rotation.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        interval: float = DEFAULT_ROTATE_INTERVAL,
+        backup_count: int = DEFAULT_BACKUP_COUNT,
+    ):
+        """
+        Initialize the handler.
+
+        Args:
+            filename (str): Path to the log file.
+            max_bytes (int): Rotate when the file would grow larger, 0 disables it.
+            interval (float): Rotate this many seconds after the last rotation, 0
+                disables it.
+            backup_count (int): Number of rotated files to keep.
+        """
+        super().__init__(
+            filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+        )
+        self.interval = interval
+        self.rollover_at = time.time() + interval
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.interval > 0 and time.time() >= self.rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        self.rollover_at = time.time() + self.interval
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on the queue of the writer thread, unformatted.
+
+    ``QueueHandler`` formats records in the logging thread, this handler only merges
+    the message arguments, so the formatting and the traceback of exceptions are left
+    to the writer thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
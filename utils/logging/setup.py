@@ -4,35 +4,112 @@ Logging setup utilities for the KorwinAI Discord Bot.
 This module provides functions for setting up and configuring logging.
 """
 
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
 from typing import Optional
 
+from utils.logging.filters import DEFAULT_BURST, DEFAULT_RATE_LIMIT, ContextFilter, RateLimitFilter
+from utils.logging.formatters import JsonFormatter
+from utils.logging.handlers import (
+    DEFAULT_BACKUP_COUNT,
+    DEFAULT_MAX_BYTES,
+    DEFAULT_ROTATE_INTERVAL,
+    LogQueueHandler,
+    RotatingLogHandler,
+)
 
-def setup_logging(log_file: str = "voice_generator.log", level: int = logging.INFO) -> None:
+DEFAULT_LOG_FILE = "voice_generator.log"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(log_file: Optional[str] = None, level: Optional[int] = None) -> None:
     """
     Set up logging configuration for the application.
 
-    This function configures both file and console logging with consistent formatting.
+    Records are put on a queue and written to the console and the log file by a writer
+    thread, so logging never waits for the disk. The log file is appended to and
+    rotated by size and age. Calling this again replaces the previous configuration.
+
+    Configured by the environment variables LOG_FILE, LOG_LEVEL, LOG_FORMAT ("text"
+    or "json"), LOG_MAX_MB, LOG_ROTATE_HOURS, LOG_BACKUP_COUNT, LOG_RATE_LIMIT and
+    LOG_BURST.
 
     Args:
-        log_file (str, optional): Path to the log file. Defaults to "voice_generator.log".
-        level (int, optional): Logging level. Defaults to logging.INFO.
+        log_file (Optional[str]): Path to the log file. Defaults to LOG_FILE or
+            "voice_generator.log".
+        level (Optional[int]): Logging level. Defaults to LOG_LEVEL or logging.INFO.
     """
-    # Create a logger
-    logger = logging.getLogger()
-    logger.setLevel(level)
+    global _listener
+
+    if log_file is None:
+        log_file = os.getenv("LOG_FILE", DEFAULT_LOG_FILE)
+    if level is None:
+        level = logging.getLevelName(os.getenv("LOG_LEVEL", "INFO").upper())
 
     # Create formatters
-    formatter = logging.Formatter(
-        fmt="[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
-    )
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            fmt="[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
 
     # Set up file handler
-    file_handler = logging.FileHandler(log_file, mode="w")
+    max_mb = os.getenv("LOG_MAX_MB")
+    rotate_hours = os.getenv("LOG_ROTATE_HOURS")
+    file_handler = RotatingLogHandler(
+        log_file,
+        max_bytes=int(float(max_mb) * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES,
+        interval=float(rotate_hours) * 3600 if rotate_hours else DEFAULT_ROTATE_INTERVAL,
+        backup_count=int(os.getenv("LOG_BACKUP_COUNT", DEFAULT_BACKUP_COUNT)),
+    )
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
 
     # Set up console handler
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+
+    # The writer thread owns the handlers, loggers only put records on the queue
+    log_queue = queue.SimpleQueue()
+    queue_handler = LogQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    rate_limit = float(os.getenv("LOG_RATE_LIMIT", DEFAULT_RATE_LIMIT))
+    if rate_limit > 0:
+        queue_handler.addFilter(
+            RateLimitFilter(rate_limit, int(os.getenv("LOG_BURST", DEFAULT_BURST)))
+        )
+
+    stop_logging()
+    logger = logging.getLogger()
+    logger.setLevel(level)
+    logger.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """
+    Write the queued records, stop the writer thread and remove the handlers added by
+    ``setup_logging``.
+    """
+    global _listener
+
+    logger = logging.getLogger()
+    for handler in list(logger.handlers):
+        if isinstance(handler, LogQueueHandler):
+            logger.removeHandler(handler)
+
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
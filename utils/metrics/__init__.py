@@ -0,0 +1,42 @@
+"""
+Metrics utilities for the KorwinAI Discord Bot.
+
+This subpackage contains the metrics registry, the metrics recorded by the bot and
+an HTTP endpoint exposing them in the Prometheus text format.
+"""
+
+from utils.metrics.instruments import (
+    ACTIVE_VOICE_SESSIONS,
+    CACHE_READ_TIME,
+    CATALOGUE_SEGMENTS,
+    COMMAND_LATENCY,
+    COMPOSITION_TIME,
+    EXECUTOR_QUEUE_DEPTH,
+    LOOP_LAG,
+    LOOP_STALLS,
+    SPEECH_CACHE_LOOKUPS,
+    TTS_BYTES,
+    TTS_LATENCY,
+    VOICE_CONNECT_TIME,
+)
+from utils.metrics.registry import REGISTRY, Counter, Gauge, Histogram, Registry
+
+__all__ = [
+    "ACTIVE_VOICE_SESSIONS",
+    "CACHE_READ_TIME",
+    "CATALOGUE_SEGMENTS",
+    "COMMAND_LATENCY",
+    "COMPOSITION_TIME",
+    "EXECUTOR_QUEUE_DEPTH",
+    "LOOP_LAG",
+    "LOOP_STALLS",
+    "REGISTRY",
+    "SPEECH_CACHE_LOOKUPS",
+    "TTS_BYTES",
+    "TTS_LATENCY",
+    "VOICE_CONNECT_TIME",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "Registry",
+]
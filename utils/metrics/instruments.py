@@ -0,0 +1,91 @@
+"""
+Metric definitions for the KorwinAI Discord Bot.
+
+This module declares the metrics recorded by the bot, the catalogue and the caches.
+They are always recorded, the HTTP endpoint that exposes them is opt-in.
+"""
+
+from utils.metrics.registry import REGISTRY, Counter, Gauge, Histogram
+
+CONNECT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TTS_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CACHE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+COMMAND_LATENCY = REGISTRY.register(
+    Histogram(
+        "korwin_command_latency_seconds",
+        "Time from a command being invoked until its audio is ready to play",
+        labels=("command",),
+    )
+)
+VOICE_CONNECT_TIME = REGISTRY.register(
+    Histogram(
+        "korwin_voice_connect_seconds",
+        "Time to connect to a voice channel",
+        buckets=CONNECT_BUCKETS,
+    )
+)
+COMPOSITION_TIME = REGISTRY.register(
+    Histogram(
+        "korwin_sentence_composition_seconds",
+        "Time to compose a random sentence",
+        labels=("format",),
+    )
+)
+TTS_LATENCY = REGISTRY.register(
+    Histogram(
+        "korwin_tts_request_seconds",
+        "Duration of ElevenLabs requests, streamed requests until their first chunk",
+        labels=("mode",),
+        buckets=TTS_BUCKETS,
+    )
+)
+TTS_BYTES = REGISTRY.register(
+    Counter("korwin_tts_bytes", "Audio bytes received from ElevenLabs", labels=("mode",))
+)
+SPEECH_CACHE_LOOKUPS = REGISTRY.register(
+    Counter(
+        "korwin_speech_cache_lookups",
+        "Cache lookups of custom phrases by result: hit by raw text, hit by text hash or miss",
+        labels=("result",),
+    )
+)
+CACHE_READ_TIME = REGISTRY.register(
+    Histogram(
+        "korwin_cache_read_seconds",
+        "Time to read an entry from the cache",
+        labels=("backend", "kind"),
+        buckets=CACHE_BUCKETS,
+    )
+)
+ACTIVE_VOICE_SESSIONS = REGISTRY.register(
+    Gauge("korwin_voice_sessions_active", "Number of guilds with an active voice session")
+)
+EXECUTOR_QUEUE_DEPTH = REGISTRY.register(
+    Gauge(
+        "korwin_executor_queue_depth",
+        "Jobs submitted to an executor pool that have not finished yet",
+        labels=("pool",),
+    )
+)
+CATALOGUE_SEGMENTS = REGISTRY.register(
+    Gauge(
+        "korwin_catalogue_segments",
+        "Catalogue segments by state, cached or missing",
+        labels=("state",),
+    )
+)
+LOOP_LAG = REGISTRY.register(
+    Histogram(
+        "korwin_event_loop_lag_seconds",
+        "How late the event loop runs a scheduled callback, recorded by the watchdog",
+        buckets=LAG_BUCKETS,
+    )
+)
+LOOP_STALLS = REGISTRY.register(
+    Counter(
+        "korwin_event_loop_stalls",
+        "Times the event loop was blocked for longer than the watchdog threshold",
+    )
+)
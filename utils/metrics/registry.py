@@ -0,0 +1,223 @@
+"""
+Metrics registry for the KorwinAI Discord Bot.
+
+This module provides thread-safe counters, gauges and histograms with labels, and
+renders them in the Prometheus text exposition format.
+"""
+
+import bisect
+import contextlib
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """
+    Base class of all metrics: a name, a help text and a fixed set of label names.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing value.
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = dict()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}_total", _format_labels(self.label_names, key), value
+
+
+class Gauge(Metric):
+    """
+    Value that goes up and down, either set directly or read from a function.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = dict()
+        self._functions: Dict[LabelValues, Callable[[], float]] = dict()
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        """
+        Read the value from a function whenever the metrics are collected.
+
+        Args:
+            function (Callable[[], float]): Returns the current value.
+            **labels (str): The label values.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, function in functions:
+            values[key] = function()
+        for key, value in values.items():
+            yield self.name, _format_labels(self.label_names, key), value
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values, counted in cumulative buckets.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelValues, List[int]] = dict()
+        self._sums: Dict[LabelValues, float] = dict()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """
+        Observe the duration of a block of code in seconds.
+
+        Args:
+            **labels (str): The label values.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        with self._lock:
+            entries = [(key, list(counts), self._sums[key]) for key, counts in self._counts.items()]
+
+        for key, counts, total in entries:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.label_names + ("le",), key + (_format_value(bound),))
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Registry:
+    """
+    Collection of metrics rendered together.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = dict()
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
@@ -0,0 +1,64 @@
+"""
+Metrics endpoint for the KorwinAI Discord Bot.
+
+This module serves the metrics of a registry over HTTP in the Prometheus text format.
+"""
+
+import logging
+from typing import Optional
+
+from aiohttp import web
+
+from utils.metrics.registry import REGISTRY, Registry
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_HOST = "127.0.0.1"
+
+
+class MetricsServer:
+    """
+    HTTP server exposing ``/metrics`` on the running event loop.
+    """
+
+    def __init__(self, port: int, host: str = DEFAULT_HOST, registry: Registry = REGISTRY):
+        """
+        Initialize the metrics server.
+
+        Args:
+            port (int): Port to listen on, 0 picks a free port.
+            host (str): Address to listen on, only local by default.
+            registry (Registry): The metrics to serve.
+        """
+        self.port = port
+        self.host = host
+        self.registry = registry
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            body=self.registry.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE}
+        )
+
+    async def start(self) -> None:
+        """
+        Start listening for requests.
+        """
+        app = web.Application()
+        app.router.add_get("/metrics", self._metrics)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+
+        # Resolve the actual port when a free one was picked
+        self.port = self._runner.addresses[0][1]
+        logging.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        """
+        Stop the server.
+        """
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,11 @@
+"""
+Profiling utilities for the KorwinAI Discord Bot.
+
+This subpackage contains tools for measuring where the bot spends its time.
+"""
+
+from utils.profiling.sampling import SamplingProfiler
+from utils.profiling.startup import StartupProfiler
+from utils.profiling.watchdog import LoopWatchdog
+
+__all__ = ["LoopWatchdog", "SamplingProfiler", "StartupProfiler"]
@@ -0,0 +1,116 @@
+"""
+Sampling profiler for the KorwinAI Discord Bot.
+
+This module samples the stack of a thread at a fixed rate while a block of code runs
+and writes the samples as folded stacks, the input format of flamegraph.pl, inferno
+and speedscope.
+"""
+
+import collections
+import logging
+import os
+import pathlib
+import sys
+import threading
+import time
+from typing import Counter, Optional, Union
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        file = os.path.basename(code.co_filename)
+        names.append(f"{code.co_name} ({file}:{frame.f_lineno})".replace(";", ":"))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread while it is used as a context manager.
+
+    The folded stacks are written by the sampler thread once the context exits, so
+    the file may appear shortly after that.
+
+    By default the thread entering the context is sampled, for a coroutine that is
+    the event loop thread, so every sample shows what the loop was running, whether
+    it was the profiled command or something else blocking it. Work offloaded to
+    executor threads is not sampled.
+    """
+
+    def __init__(
+        self,
+        output: Union[str, pathlib.Path],
+        interval: float = DEFAULT_SAMPLE_INTERVAL,
+        thread_id: Optional[int] = None,
+    ):
+        """
+        Initialize the profiler.
+
+        Args:
+            output (Union[str, pathlib.Path]): File the folded stacks are written to.
+            interval (float): Seconds between samples.
+            thread_id (Optional[int]): Thread to sample, defaults to the thread
+                entering the context.
+        """
+        self.output = pathlib.Path(output)
+        self.interval = interval
+        self.thread_id = thread_id
+        self.samples: Counter[str] = collections.Counter()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "SamplingProfiler":
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        # The sampler thread writes the file, so the profiled thread does not wait for it
+        self._stopped.set()
+        self._thread = None
+
+    def _sample(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[_fold(frame)] += 1
+        try:
+            self.write()
+        except OSError as e:
+            logging.error(f"Failed to write profile {self.output}: {e}")
+
+    def write(self) -> None:
+        """
+        Write the samples as folded stacks, one ``frame;frame;... count`` line per stack.
+        """
+        self.output.parent.mkdir(parents=True, exist_ok=True)
+        # Written under a temporary name, so a profile only appears once it is complete
+        temp_path = self.output.with_name(f".{self.output.name}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        os.replace(temp_path, self.output)
+
+
+def profile_path(directory: Union[str, pathlib.Path], name: str) -> pathlib.Path:
+    """
+    Get a unique path for the profile of a single invocation.
+
+    Args:
+        directory (Union[str, pathlib.Path]): Directory of the profiles.
+        name (str): What is profiled, e.g. the command name.
+
+    Returns:
+        pathlib.Path: ``<directory>/<name>-<timestamp>-<ns>.folded``, where ``<ns>``
+            is the nanosecond part of the current time, telling apart invocations that
+            start in the same second.
+    """
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    return pathlib.Path(directory).joinpath(f"{name}-{timestamp}-{time.time_ns() % 10**9}.folded")
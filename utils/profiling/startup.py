@@ -0,0 +1,135 @@
+"""
+Startup profiling utilities for the KorwinAI Discord Bot.
+
+This module measures how long each startup phase and each module import takes, so
+the time until the bot is ready can be attributed to specific work.
+"""
+
+import importlib.abc
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+TOP_IMPORTS = 20
+
+
+class _TimingLoader(importlib.abc.Loader):
+    def __init__(self, loader: importlib.abc.Loader, timings: Dict[str, float]):
+        self._loader = loader
+        self._timings = timings
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module) -> None:
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._timings[module.__name__] = time.perf_counter() - started
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    def __init__(self, timings: Dict[str, float]):
+        self._timings = timings
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimingLoader(spec.loader, self._timings)
+                return spec
+        return None
+
+
+class StartupProfiler:
+    """
+    Records the duration of startup phases and module imports.
+
+    When disabled, all methods are no-ops, so the profiler can be used
+    unconditionally in the startup code.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, str, float, float]] = []
+        self.imports: Dict[str, float] = dict()
+        self._finder: Optional[_TimingFinder] = None
+        self._lock = threading.Lock()
+
+    def install_import_hook(self) -> None:
+        """
+        Start timing every module imported from now on.
+
+        Import times are inclusive, i.e. they contain the imports of submodules.
+        """
+        if self.enabled and self._finder is None:
+            self._finder = _TimingFinder(self.imports)
+            sys.meta_path.insert(0, self._finder)
+
+    def remove_import_hook(self) -> None:
+        if self._finder is not None:
+            sys.meta_path.remove(self._finder)
+            self._finder = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Time a startup phase.
+
+        Args:
+            name (str): Name of the phase.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases.append(
+                    (
+                        name,
+                        threading.current_thread().name,
+                        started - self.started,
+                        time.perf_counter() - started,
+                    )
+                )
+
+    def report(self, milestone: str = "ready") -> None:
+        """
+        Log the phase and import timings collected so far.
+
+        Args:
+            milestone (str): Name of the point in startup the report is made at.
+        """
+        if not self.enabled:
+            return
+
+        self.remove_import_hook()
+        total = time.perf_counter() - self.started
+        lines = [f"Startup profile - {milestone} after {total:.3f}s", "Phases:"]
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase[2])
+        for name, thread, offset, duration in phases:
+            lines.append(f"  {offset:8.3f}s +{duration:8.3f}s  {name} [{thread}]")
+
+        lines.append(f"Slowest imports (inclusive, top {TOP_IMPORTS}):")
+        for module, duration in sorted(self.imports.items(), key=lambda item: -item[1])[
+            :TOP_IMPORTS
+        ]:
+            lines.append(f"  {duration:8.3f}s  {module}")
+
+        logging.info("\n".join(lines))
@@ -0,0 +1,181 @@
+"""
+Event loop watchdog for the KorwinAI Discord Bot.
+
+This module measures how late the event loop runs its callbacks and, when the loop is
+blocked for longer than a threshold, logs the stack the loop thread is stuck in, so
+blocking calls in coroutines can be found before Discord reports missed heartbeats.
+"""
+
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Deque, List, Optional
+
+from utils.metrics import LOOP_LAG, LOOP_STALLS
+
+DEFAULT_THRESHOLD = 0.1
+DEFAULT_INTERVAL = 0.05
+LAG_WINDOW = 10000
+REPORT_INTERVAL = 300.0
+MAX_STALLS = 20
+
+
+@dataclass
+class LoopStall:
+    """
+    A period in which the event loop did not run any callbacks.
+    """
+
+    started: float
+    stack: str
+    duration: Optional[float] = None
+
+
+@dataclass
+class LoopLagStats:
+    """
+    Event loop lag percentiles over the most recent heartbeats, in seconds.
+    """
+
+    samples: int
+    p50: float
+    p95: float
+    p99: float
+    max: float
+    stalls: int
+
+    def __str__(self) -> str:
+        return (
+            f"event loop lag p50 {self.p50 * 1000:.1f} ms, p95 {self.p95 * 1000:.1f} ms, "
+            f"p99 {self.p99 * 1000:.1f} ms, max {self.max * 1000:.1f} ms, "
+            f"{self.stalls} stalls"
+        )
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class LoopWatchdog:
+    """
+    Detects a blocked event loop and records its lag.
+
+    A heartbeat task wakes up every ``interval`` seconds and records how late it woke
+    up. A watcher thread checks the heartbeat, and when it is ``threshold`` seconds
+    overdue, captures the stack of the event loop thread. That stack shows the line
+    that blocks the loop. The stack is logged once per stall, with the stall's
+    duration once the loop runs again.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, interval: float = DEFAULT_INTERVAL):
+        """
+        Initialize the watchdog.
+
+        Args:
+            threshold (float): Seconds the loop may be blocked before its stack is
+                captured.
+            interval (float): Seconds between heartbeats.
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls: Deque[LoopStall] = collections.deque(maxlen=MAX_STALLS)
+        self._lags: Deque[float] = collections.deque(maxlen=LAG_WINDOW)
+        self._stall_count = 0
+        self._beat = time.monotonic()
+        self._stall: Optional[LoopStall] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """
+        Start watching the running event loop.
+        """
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logging.info(f"Event loop watchdog started, threshold {self.threshold * 1000:.0f} ms")
+
+    async def stop(self) -> None:
+        """
+        Stop watching and log the lag percentiles.
+        """
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._thread.join()
+        self._thread = None
+        logging.info(f"Event loop watchdog stopped, {self.stats()}")
+
+    def stats(self) -> LoopLagStats:
+        """
+        Get the lag percentiles over the most recent heartbeats.
+
+        Returns:
+            LoopLagStats: The percentiles.
+        """
+        lags = sorted(self._lags)
+        return LoopLagStats(
+            samples=len(lags),
+            p50=_percentile(lags, 50),
+            p95=_percentile(lags, 95),
+            p99=_percentile(lags, 99),
+            max=lags[-1] if lags else 0.0,
+            stalls=self._stall_count,
+        )
+
+    async def _heartbeat(self) -> None:
+        loop = asyncio.get_running_loop()
+        reported = loop.time()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            self._beat = time.monotonic()
+
+            lag = max(0.0, now - expected)
+            self._lags.append(lag)
+            LOOP_LAG.observe(lag)
+
+            if now - reported >= REPORT_INTERVAL:
+                logging.info(f"Watchdog: {self.stats()}")
+                reported = now
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.interval):
+            overdue = time.monotonic() - self._beat - self.interval
+            stall = self._stall
+
+            if stall is None and overdue >= self.threshold:
+                frame = sys._current_frames().get(self._loop_thread)
+                stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+                self._stall = LoopStall(started=self._beat + self.interval, stack=stack)
+                self._stall_count += 1
+                LOOP_STALLS.inc()
+                logging.warning(
+                    f"Event loop blocked for more than {overdue * 1000:.0f} ms in:\n{stack}"
+                )
+            elif stall is not None and overdue < self.threshold:
+                stall.duration = self._beat - stall.started
+                self.stalls.append(stall)
+                self._stall = None
+                logging.warning(f"Event loop was blocked for {stall.duration * 1000:.0f} ms")